@@ -0,0 +1,56 @@
+"""
+Compare the time spent to build the cobra model of a merged model
+in memory and through a temporary SBML file.
+
+Usage:
+    python benchmarks/build_cobra_model.py <pathway_file> <model_file> [--repeat N]
+"""
+
+from argparse import ArgumentParser
+from timeit import repeat
+from types import SimpleNamespace
+
+from brs_utils import create_logger
+
+from rpfba.Args import DEFAULT_ARGS
+from rpfba.fba import build_cobra_model, preprocess
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("pathway_file", type=str)
+    parser.add_argument("model_file", type=str)
+    parser.add_argument("--compartment_id", type=str, default="c")
+    parser.add_argument("--biomass_rxn_id", type=str, default="biomass")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = SimpleNamespace(**{**DEFAULT_ARGS, **vars(parser.parse_args())})
+    logger = create_logger(__name__, "ERROR")
+
+    merged_model, pathway, ids = preprocess(args=args, logger=logger)
+    objective_id = merged_model.find_or_create_objective(
+        rxn_id=ids["biomass_rxn_id"],
+        obj_id=f"brs_obj_{ids['biomass_rxn_id']}",
+    )
+
+    timings = {}
+    for from_file in (True, False):
+        timings[from_file] = min(
+            repeat(
+                lambda: build_cobra_model(
+                    rpsbml=merged_model,
+                    objective_id=objective_id,
+                    from_file=from_file,
+                    logger=logger,
+                ),
+                number=1,
+                repeat=args.repeat,
+            )
+        )
+
+    print(f"temporary file: {timings[True]:.3f} s / call")
+    print(f"     in memory: {timings[False]:.3f} s / call")
+    print(f"         saved: {timings[True] - timings[False]:.3f} s / call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+"""
+Benchmark suite of rpfba: per-pathway latency of each simulation type,
+batch throughput, peak RSS, and the cost of build_cobra_model, rp_fraction
+and build_results, over the bundled lycopene pathways (or any pathway set),
+optionally scaled up with synthetic copies.
+
+Results can be saved as a baseline and compared with a baseline, the
+comparison report flagging regressions beyond a threshold (exit status 1).
+
+Usage:
+    python benchmarks/suite.py <model_file> [--pathways <pathways> ...] [--scale N]
+        [--jobs N] [--repeat N] [--output results.json]
+        [--baseline baseline.json] [--threshold 0.1]
+
+e.g. to store a baseline, then compare a branch with it:
+    python benchmarks/suite.py e_coli_iML1515.sbml --output benchmarks/baselines/<machine>.json
+    python benchmarks/suite.py e_coli_iML1515.sbml --baseline benchmarks/baselines/<machine>.json
+"""
+
+import platform
+import sys
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from json import dump as json_dump
+from json import load as json_load
+from os import makedirs
+from os import path as os_path
+from resource import RUSAGE_CHILDREN, RUSAGE_SELF, getrusage
+from shutil import copyfile
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Tuple
+from zipfile import ZipFile
+
+from brs_utils import create_logger
+
+from rpfba._version import __version__
+from rpfba.Args import DEFAULT_ARGS
+from rpfba.batch import iter_pathway_files, run_batch
+from rpfba.fba import (
+    build_cobra_model,
+    build_results,
+    preprocess,
+    rp_fraction,
+    run_pathway,
+    runFBA,
+)
+from rpfba.host import HostModel
+
+BUNDLED_PATHWAYS = os_path.join(
+    os_path.dirname(os_path.abspath(__file__)),
+    "..",
+    "tests",
+    "data",
+    "lycopene_iML1515_completereactions.zip",
+)
+SIM_TYPES = ["fba", "pfba", "fraction", "pareto"]
+
+
+def pathway_files(pathways: List[str], outdir: str) -> List[str]:
+    """Return the pathway files of pathways, zip archives being extracted
+    into outdir.
+    """
+    files = []
+    for item in pathways:
+        if item.lower().endswith(".zip"):
+            with ZipFile(item) as archive:
+                files += [
+                    archive.extract(name, outdir) for name in sorted(archive.namelist())
+                ]
+        else:
+            files += [path for _, path in iter_pathway_files([item])]
+    return files
+
+
+def scale_pathways(files: List[str], scale: int, outdir: str) -> List[str]:
+    """Return a synthetic set of pathway files, made of scale copies of
+    files (under distinct names) written into outdir.
+    """
+    makedirs(outdir, exist_ok=True)
+    scaled = []
+    for i in range(scale):
+        for path in files:
+            scaled_path = os_path.join(outdir, f"{i:04d}_{os_path.basename(path)}")
+            copyfile(path, scaled_path)
+            scaled.append(scaled_path)
+    return scaled
+
+
+def measure(func: Callable, repeat: int) -> List[float]:
+    """Return the wall times (s) of repeat calls of func."""
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        timings.append(perf_counter() - start)
+    return timings
+
+
+def stats(timings: List[float], unit: str = "s") -> Dict:
+    return {
+        "value": median(timings),
+        "min": min(timings),
+        "max": max(timings),
+        "n": len(timings),
+        "unit": unit,
+        "lower_is_better": True,
+    }
+
+
+def peak_rss_mb(who: int = RUSAGE_SELF) -> float:
+    # ru_maxrss is in bytes on macOS, in kilobytes elsewhere
+    maxrss = getrusage(who).ru_maxrss
+    return maxrss / 1024**2 if sys.platform == "darwin" else maxrss / 1024
+
+
+def bench_latency(
+    args: SimpleNamespace,
+    host: HostModel,
+    pathways: List[str],
+    repeat: int,
+    logger,
+) -> Dict[str, Dict]:
+    benchmarks = {}
+    for sim in SIM_TYPES:
+        timings = []
+        for path in pathways:
+            pathway_args = SimpleNamespace(
+                **{**vars(args), "pathway_file": path, "sim": sim}
+            )
+            # Warm-up (e.g. cobra model of the host, solver)
+            run_pathway(args=pathway_args, host=host, logger=logger)
+            timings += measure(
+                lambda: run_pathway(args=pathway_args, host=host, logger=logger), repeat
+            )
+        benchmarks[f"latency_{sim}"] = stats(timings)
+    return benchmarks
+
+
+def bench_stages(
+    args: SimpleNamespace,
+    host: HostModel,
+    pathways: List[str],
+    repeat: int,
+    logger,
+) -> Dict[str, Dict]:
+    timings = {"build_cobra_model": [], "rp_fraction": [], "build_results": []}
+    for path in pathways:
+        pathway_args = SimpleNamespace(**{**vars(args), "pathway_file": path})
+        # Whole merged model, as built without a host
+        merged_model, pathway, ids = preprocess(args=pathway_args, logger=logger)
+        objective_id = merged_model.find_or_create_objective(
+            rxn_id=ids["biomass_rxn_id"],
+            obj_id=f"brs_obj_{ids['biomass_rxn_id']}",
+        )
+        timings["build_cobra_model"] += measure(
+            lambda: build_cobra_model(
+                rpsbml=merged_model, objective_id=objective_id, logger=logger
+            ),
+            repeat,
+        )
+        # Overlay of the host, as processed by run_pathway
+        merged_model, pathway, ids = preprocess(
+            args=pathway_args, host=host, logger=logger
+        )
+        timings["rp_fraction"] += measure(
+            lambda: rp_fraction(
+                rpsbml=merged_model,
+                objective_rxn_id=ids["obj_rxn_id"],
+                biomass_rxn_id=ids["biomass_rxn_id"],
+                fraction_coeff=args.fraction_of,
+                host=host,
+                logger=logger,
+            ),
+            repeat,
+        )
+        results = runFBA(
+            model=merged_model,
+            compartment_id=ids["comp_id"],
+            objective_rxn_id=ids["obj_rxn_id"],
+            biomass_rxn_id=ids["biomass_rxn_id"],
+            host=host,
+            write_results=False,
+            logger=logger,
+        )
+        timings["build_results"] += measure(
+            lambda: build_results(
+                results=results,
+                pathway=pathway,
+                compartment_id=ids["comp_id"],
+                hidden_species=merged_model.get_isolated_species(),
+                logger=logger,
+            ),
+            repeat,
+        )
+    return {name: stats(_timings) for name, _timings in timings.items()}
+
+
+def bench_batch(
+    args: SimpleNamespace,
+    pathways: List[str],
+    jobs: int,
+    tmp_d: str,
+    logger,
+) -> Dict[str, Dict]:
+    benchmarks = {}
+    for _jobs in sorted({1, jobs}):
+        batch_args = SimpleNamespace(
+            **{
+                **vars(args),
+                "pathways": pathways,
+                "outpath": os_path.join(tmp_d, f"batch_{_jobs}"),
+                "jobs": _jobs,
+            }
+        )
+        elapsed = measure(lambda: run_batch(args=batch_args, logger=logger), 1)[0]
+        benchmarks[f"batch_throughput_jobs{_jobs}"] = {
+            "value": len(pathways) / elapsed,
+            "n": len(pathways),
+            "unit": "pathways/s",
+            "lower_is_better": False,
+        }
+    return benchmarks
+
+
+def run_suite(
+    args: SimpleNamespace,
+    logger,
+) -> Dict:
+    """Run all the benchmarks and return their results, with the context
+    (version, Python, platform) they have been run in.
+    """
+    benchmarks = {}
+    with TemporaryDirectory() as tmp_d:
+        originals = pathway_files(args.pathways, tmp_d)
+        # The batch benchmarks run over the scaled set
+        pathways = scale_pathways(originals, args.scale, os_path.join(tmp_d, "scaled"))
+        host = HostModel(model_file=args.model_file, logger=logger)
+        benchmarks.update(bench_latency(args, host, originals, args.repeat, logger))
+        benchmarks.update(bench_stages(args, host, originals, args.repeat, logger))
+        benchmarks["peak_rss"] = {
+            "value": peak_rss_mb(RUSAGE_SELF),
+            "unit": "MB",
+            "lower_is_better": True,
+        }
+        benchmarks.update(bench_batch(args, pathways, args.jobs, tmp_d, logger))
+        benchmarks["batch_peak_rss"] = {
+            "value": peak_rss_mb(RUSAGE_CHILDREN),
+            "unit": "MB",
+            "lower_is_better": True,
+        }
+    return {
+        "version": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "nb_pathways": len(pathways),
+        "benchmarks": benchmarks,
+    }
+
+
+def compare(
+    results: Dict,
+    baseline: Dict,
+    threshold: float = 0.1,
+) -> Tuple[List[Tuple], bool]:
+    """Compare results with baseline and return the rows of the report
+    (name, baseline value, value, relative change, status) and whether some
+    benchmark has regressed by more than threshold (relative).
+    """
+    rows = []
+    regressed = False
+    for name, bench in results["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if base is None or not base["value"]:
+            rows.append((name, None, bench["value"], None, "new"))
+            continue
+        change = (bench["value"] - base["value"]) / base["value"]
+        worse = change if bench.get("lower_is_better", True) else -change
+        if worse > threshold:
+            status = "REGRESSION"
+            regressed = True
+        elif worse < -threshold:
+            status = "improved"
+        else:
+            status = "ok"
+        rows.append((name, base["value"], bench["value"], change, status))
+    return rows, regressed
+
+
+def format_results(results: Dict) -> str:
+    lines = [f"rpfba {results['version']} over {results['nb_pathways']} pathway(s)"]
+    for name, bench in results["benchmarks"].items():
+        lines.append(f"{name:<28} {bench['value']:>12.4f} {bench['unit']}")
+    return "\n".join(lines)
+
+
+def format_report(rows: List[Tuple], baseline: Dict) -> str:
+    lines = [
+        f"Compared with rpfba {baseline['version']} ({baseline['date']})",
+        f"{'benchmark':<28} {'baseline':>12} {'current':>12} {'change':>8}  status",
+    ]
+    for name, base, value, change, status in rows:
+        lines.append(
+            f"{name:<28} "
+            + ("" if base is None else f"{base:.4f}").rjust(12)
+            + f" {value:>12.4f} "
+            + ("" if change is None else f"{change:+.1%}").rjust(8)
+            + f"  {status}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("model_file", type=str)
+    parser.add_argument(
+        "--pathways",
+        type=str,
+        nargs="+",
+        default=[BUNDLED_PATHWAYS],
+        help="pathway files, directories, glob patterns, tar or zip archives (default: bundled lycopene pathways)",
+    )
+    parser.add_argument(
+        "--scale",
+        type=int,
+        default=10,
+        help="number of copies of the pathways in the batch benchmarks (default: 10)",
+    )
+    parser.add_argument("--compartment_id", type=str, default="c")
+    parser.add_argument("--biomass_rxn_id", type=str, default="biomass")
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=str, help="file to save the results into")
+    parser.add_argument("--baseline", type=str, help="results to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative change beyond which a benchmark is reported as regressed (default: 0.1)",
+    )
+    args = SimpleNamespace(
+        **{
+            **DEFAULT_ARGS,
+            "fraction_of": DEFAULT_ARGS["fraction_coeff"],
+            **vars(parser.parse_args()),
+        }
+    )
+    logger = create_logger(__name__, "ERROR")
+
+    results = run_suite(args, logger)
+    print(format_results(results))
+    if args.output:
+        dirname = os_path.dirname(args.output)
+        if dirname != "":
+            makedirs(dirname, exist_ok=True)
+        with open(args.output, "w") as f:
+            json_dump(results, f, indent=2)
+        print(f"Results saved in {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json_load(f)
+        rows, regressed = compare(results, baseline, args.threshold)
+        print(format_report(rows, baseline))
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
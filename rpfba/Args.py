@@ -1,4 +1,5 @@
-from argparse import ArgumentParser
+from argparse import Action, ArgumentParser, ArgumentTypeError
+from typing import List, Tuple
 
 DEFAULT_ARGS = {
     "pathway_file": "",
@@ -11,8 +12,66 @@ DEFAULT_ARGS = {
     "fraction_coeff": 0.75,
     "merge": "",
     "with_orphan_species": False,
+    "cobra_from_file": False,
+    "jobs": 1,
+    "fraction_sweep": None,
+    "pareto_tolerance": 0.01,
+    "pareto_max_points": 20,
+    "fva_processes": 1,
+    "objectives": None,
+    "knockout_type": "reaction",
+    "knockout_candidates": None,
+    "double_knockouts": False,
+    "knockout_top": 10,
+    "knockout_processes": 1,
+    "knockout_max": 10000,
+    "engine": "cobra",
+    "results": None,
+    "cache_dir": None,
+    "cache_size": 1024,
+    "host": "127.0.0.1",
+    "port": 8000,
+    "socket": None,
+    "profile": None,
+    "profile_stage": None,
+    "profile_stage_out": None,
+    "snapshot": None,
 }
 
+SIM_TYPES = [
+    "fba",
+    "pfba",
+    "fraction",
+    "pareto",
+    "fva",
+    "fraction_fva",
+    "multi_fba",
+    "knockout",
+]
+
+ENGINES = ["cobra", "scipy"]
+
+# Stages recorded when profiling, see profiling.Profiler
+PROFILE_STAGES = [
+    "parse_model",
+    "pathway",
+    "parse_pathway",
+    "check_ids",
+    "overlay",
+    "merge",
+    "isolated_species",
+    "cache",
+    "simulate",
+    "build_cobra_model",
+    "build_lp",
+    "solve",
+    "fva",
+    "knockout",
+    "build_results",
+    "write_results",
+    "write_pathway",
+]
+
 
 def add_arguments(parser: ArgumentParser):
     parser.add_argument(
@@ -25,6 +84,167 @@ def add_arguments(parser: ArgumentParser):
         help="model compartment id to consider (e.g. 'c' or 'MNXC3')",
     )
     parser.add_argument("outfile", type=str, help="output file")
+    add_simulation_arguments(parser)
+    parser.add_argument(
+        "--merge",
+        type=str,
+        default=DEFAULT_ARGS["merge"],
+        help="output the full merged model in addition of heterologous pathway only (default: False)",
+    )
+    add_results_arguments(parser)
+    add_profile_arguments(parser)
+    add_snapshot_arguments(parser)
+
+    return parser
+
+
+def add_batch_arguments(parser: ArgumentParser):
+    parser.add_argument(
+        "pathways",
+        type=str,
+        nargs="+",
+        help="SBML files that contain heterologous pathways, as files, directories, glob patterns or tar archives (e.g. .tar.xz)",
+    )
+    parser.add_argument("model_file", type=str, help="GEM model file (SBML)")
+    parser.add_argument(
+        "compartment_id",
+        type=str,
+        help="model compartment id to consider (e.g. 'c' or 'MNXC3')",
+    )
+    parser.add_argument(
+        "outpath",
+        type=str,
+        help="output directory, or tar archive if ending with .tar, .tar.gz, .tar.bz2 or .tar.xz",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_ARGS["jobs"],
+        help="number of worker processes, each of them parsing the GEM once (default: 1)",
+    )
+    add_results_arguments(parser)
+    add_simulation_arguments(parser)
+    add_profile_arguments(parser)
+    add_snapshot_arguments(parser)
+
+    return parser
+
+
+def add_serve_arguments(parser: ArgumentParser):
+    parser.add_argument(
+        "models",
+        type=str,
+        nargs="+",
+        help="GEM model files (SBML) to preload, as 'name=path' or 'path' (named after the file name without extension)",
+    )
+    parser.add_argument(
+        "--compartment_id",
+        type=str,
+        default=DEFAULT_ARGS["compartment_id"],
+        help="model compartment id to consider (e.g. 'c' or 'MNXC3'), unless given in the request (default: c)",
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default=DEFAULT_ARGS["host"],
+        help="address to listen to (default: 127.0.0.1)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_ARGS["port"],
+        help="port to listen to (default: 8000)",
+    )
+    parser.add_argument(
+        "--socket",
+        type=str,
+        default=DEFAULT_ARGS["socket"],
+        help="Unix socket to listen to, in place of --host and --port",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_ARGS["jobs"],
+        help="number of worker processes, i.e. of requests processed concurrently, each of them preloading the GEMs (default: 1)",
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_const",
+        const="",
+        default=DEFAULT_ARGS["snapshot"],
+        help="load the GEMs from their snapshots '<model file>.snapshot', built (or rebuilt if stale) if needed (default: False)",
+    )
+    add_simulation_arguments(parser)
+
+    return parser
+
+
+def add_snapshot_command_arguments(parser: ArgumentParser):
+    parser.add_argument(
+        "model_file", type=str, help="GEM model file (SBML, cobra JSON or MAT)"
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="snapshot file (default: '<model_file>.snapshot')",
+    )
+
+    return parser
+
+
+def add_snapshot_arguments(parser: ArgumentParser):
+    parser.add_argument(
+        "--snapshot",
+        type=str,
+        nargs="?",
+        const="",
+        default=DEFAULT_ARGS["snapshot"],
+        help="load the GEM from the snapshot FILE (default: '<model_file>.snapshot'), built by 'rpfba snapshot', instead of parsing it. A missing or stale snapshot (built from another content of the GEM file) is rebuilt (default: no snapshot)",
+    )
+
+    return parser
+
+
+def add_profile_arguments(parser: ArgumentParser):
+    parser.add_argument(
+        "--profile",
+        type=str,
+        nargs="?",
+        const="",
+        default=DEFAULT_ARGS["profile"],
+        help="record the wall time, CPU time and peak memory of each stage of the processing of each pathway, log their summary and, if a file is given, write them into it (JSON). Can also be enabled by the RPFBA_PROFILE environment variable, set to 1 or to the JSON file",
+    )
+    parser.add_argument(
+        "--profile_stage",
+        type=str,
+        choices=PROFILE_STAGES,
+        default=DEFAULT_ARGS["profile_stage"],
+        help="stage to run under cProfile when profiling",
+    )
+    parser.add_argument(
+        "--profile_stage_out",
+        type=str,
+        default=DEFAULT_ARGS["profile_stage_out"],
+        help="file to dump the cProfile statistics of --profile_stage into (default: rpfba_<stage>.prof)",
+    )
+
+    return parser
+
+
+def add_results_arguments(parser: ArgumentParser):
+    parser.add_argument(
+        "--results",
+        type=str,
+        nargs="+",
+        default=DEFAULT_ARGS["results"],
+        help="files to stream the results into, in addition of the pathway files: JSON Lines (one record per pathway, e.g. results.jsonl) or Parquet if ending with .parquet (one row per value, requires pyarrow)",
+    )
+
+    return parser
+
+
+def add_simulation_arguments(parser: ArgumentParser):
     parser.add_argument(
         "--objective_rxn_id",
         type=str,
@@ -40,7 +260,7 @@ def add_arguments(parser: ArgumentParser):
     parser.add_argument(
         "--sim",
         type=str,
-        choices=["fba", "pfba", "fraction"],
+        choices=SIM_TYPES,
         default=DEFAULT_ARGS["sim"],
         help="type of simulation to use (default: fraction)",
     )
@@ -51,10 +271,75 @@ def add_arguments(parser: ArgumentParser):
         help="fraction of the optimum (default: 0.75). Note: this value is ignored is 'fba' is used",
     )
     parser.add_argument(
-        "--merge",
+        "--fraction_sweep",
+        type=fraction_range,
+        nargs="+",
+        action=FlattenAction,
+        default=DEFAULT_ARGS["fraction_sweep"],
+        help="fractions of the optimum to sweep in 'fraction' simulation, in place of --fraction_of, as values or ranges 'start:stop:step' (e.g. 0.1:1.0:0.1), within [0, 1]. The biomass optimum is computed once and results are written as 'fba_fraction_<fraction>'",
+    )
+    parser.add_argument(
+        "--pareto_tolerance",
+        type=float,
+        default=DEFAULT_ARGS["pareto_tolerance"],
+        help="relative deviation of the target flux under which a segment of the frontier is not refined (default: 0.01). Note: Only for 'pareto' simulation",
+    )
+    parser.add_argument(
+        "--pareto_max_points",
+        type=int,
+        default=DEFAULT_ARGS["pareto_max_points"],
+        help="maximal number of points of the frontier (default: 20). Note: Only for 'pareto' simulation",
+    )
+    parser.add_argument(
+        "--fva_processes",
+        type=int,
+        default=DEFAULT_ARGS["fva_processes"],
+        help="number of processes running the minimisations and maximisations of the pathway reactions in parallel, in a pool that cobra starts for each pathway (default: 1). Note: Only for 'fva' and 'fraction_fva' simulations",
+    )
+    parser.add_argument(
+        "--objectives",
+        type=weighted_objective,
+        nargs="+",
+        default=DEFAULT_ARGS["objectives"],
+        help="reactions of the weighted objective of 'multi_fba' simulation, as 'rxn_id[:weight[:max|min]]' (default weight: 1, default sense: max), e.g. rxn_target:1 biomass:0.5 ATPM:0.1:min",
+    )
+    parser.add_argument(
+        "--knockout_type",
         type=str,
-        default=DEFAULT_ARGS["merge"],
-        help="output the full merged model in addition of heterologous pathway only (default: False)",
+        choices=["reaction", "gene"],
+        default=DEFAULT_ARGS["knockout_type"],
+        help="host entities knocked out in 'knockout' simulation (default: reaction)",
+    )
+    parser.add_argument(
+        "--knockout_candidates",
+        type=str,
+        nargs="+",
+        default=DEFAULT_ARGS["knockout_candidates"],
+        help="IDs of the reactions (or genes) to knock out in 'knockout' simulation, or files listing them (one per line) (default: all the host reactions but the exchange, biomass and target ones, or all the host genes)",
+    )
+    parser.add_argument(
+        "--double_knockouts",
+        action="store_true",
+        default=DEFAULT_ARGS["double_knockouts"],
+        help="knock out the pairs of candidates too in 'knockout' simulation (default: False)",
+    )
+    parser.add_argument(
+        "--knockout_top",
+        type=int,
+        default=DEFAULT_ARGS["knockout_top"],
+        help="number of the best knockouts (raising the target flux the most) written into the results, as 'knockout_<ID>[+<ID>]' (default: 10). Note: Only for 'knockout' simulation",
+    )
+    parser.add_argument(
+        "--knockout_processes",
+        type=int,
+        default=DEFAULT_ARGS["knockout_processes"],
+        help="number of processes the knockouts are distributed over (default: 1). Note: Only for 'knockout' simulation",
+    )
+    parser.add_argument(
+        "--knockout_max",
+        type=int,
+        default=DEFAULT_ARGS["knockout_max"],
+        help="maximal number of knockouts (candidates, and their pairs with --double_knockouts) screened, the simulation failing beyond (default: 10000). Note: Only for 'knockout' simulation",
     )
     parser.add_argument(
         "--with_orphan_species",
@@ -62,5 +347,77 @@ def add_arguments(parser: ArgumentParser):
         default=DEFAULT_ARGS["with_orphan_species"],
         help="Take metabolites that are only consumed (default: False)",
     )
+    parser.add_argument(
+        "--engine",
+        type=str,
+        choices=ENGINES,
+        default=DEFAULT_ARGS["engine"],
+        help="LP engine: 'cobra', or 'scipy' which solves the stoichiometric matrix of the merged model (the GEM part being built once) with HiGHS, without building cobra models (default: cobra). Note: Only for 'fba', 'fraction' and 'multi_fba' simulations, the others falling back to cobra",
+    )
+    parser.add_argument(
+        "--cobra_from_file",
+        action="store_true",
+        default=DEFAULT_ARGS["cobra_from_file"],
+        help="Build cobra models from the whole merged model written into and read back from a temporary SBML file, instead of completing the GEM cobra model with the pathway in memory (default: False)",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        "--cache-dir",
+        type=str,
+        default=DEFAULT_ARGS["cache_dir"],
+        help="directory of the results cache, simulations already performed with the same merged model and parameters being not run again (default: no cache)",
+    )
+    parser.add_argument(
+        "--cache_size",
+        type=int,
+        default=DEFAULT_ARGS["cache_size"],
+        help="maximal size of the results cache in MB, the least recently used results being evicted beyond (default: 1024)",
+    )
 
     return parser
+
+
+def fraction_range(value: str) -> List[float]:
+    """Parse a fraction coefficient or a range of them 'start:stop:step'
+    (stop included), fractions being within [0, 1].
+    """
+    try:
+        if ":" not in value:
+            start = stop = float(value)
+            step = 1.0
+        else:
+            start, stop, step = (float(x) for x in value.split(":"))
+    except ValueError:
+        raise ArgumentTypeError(f"invalid fraction or range: '{value}'")
+    if step <= 0:
+        raise ArgumentTypeError(f"invalid range step: '{value}'")
+    if stop < start:
+        raise ArgumentTypeError(f"invalid range, stop before start: '{value}'")
+    if not 0 <= start <= stop <= 1:
+        raise ArgumentTypeError(f"invalid fraction, not within [0, 1]: '{value}'")
+    n = int(round((stop - start) / step, 9)) + 1
+    return [round(start + i * step, 9) for i in range(n)]
+
+
+def weighted_objective(value: str) -> Tuple[str, float, str]:
+    """Parse a reaction of a weighted objective 'rxn_id[:weight[:max|min]]'
+    into (rxn_id, weight, sense).
+    """
+    rxn_id, *options = value.split(":")
+    if rxn_id == "" or len(options) > 2:
+        raise ArgumentTypeError(f"invalid objective: '{value}'")
+    try:
+        weight = float(options[0]) if options else 1.0
+    except ValueError:
+        raise ArgumentTypeError(f"invalid objective weight: '{value}'")
+    sense = options[1].lower() if len(options) > 1 else "max"
+    if sense not in ("max", "min"):
+        raise ArgumentTypeError(f"invalid objective sense: '{value}'")
+    return rxn_id, weight, sense
+
+
+class FlattenAction(Action):
+    """Store the values, each of them being a list, as a single list."""
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        setattr(namespace, self.dest, [x for value in values for x in value])
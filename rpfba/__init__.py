@@ -4,6 +4,14 @@ Created on June 16 2020
 @author: Joan Hérisson
 """
 
-from rpfba.fba import runFBA
-
 __all__ = ["runFBA"]
+
+
+def __getattr__(name):
+    # rpfba.fba (and cobra, pandas, rplibs with it) is only imported on
+    # first use, so that importing rpfba (e.g. by the CLI) stays fast
+    if name == "runFBA":
+        from rpfba.fba import runFBA
+
+        return runFBA
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,13 +1,17 @@
 from os import path as os_path, makedirs as os_makedirs
-from sys import exit as sys_exit
+from sys import exit as sys_exit, argv as sys_argv
 from errno import EEXIST as errno_EEXIST
-from .Args import add_arguments
-from ._version import __version__
-from brs_utils import (
-    init as init_logger,
-    build_args_parser,
+from .Args import (
+    add_arguments,
+    add_batch_arguments,
+    add_serve_arguments,
+    add_snapshot_command_arguments,
 )
-from .fba import preprocess, runFBA, build_results, write_results_to_pathway
+from ._version import __version__
+
+# brs_utils and the modules which import cobra, pandas and rplibs are
+# imported by the commands, the latter once the arguments are parsed, so that
+# importing the CLI, --help and argument errors are fast
 
 
 def _make_dir(filename):
@@ -20,70 +24,121 @@ def _make_dir(filename):
                 raise
 
 
-def entry_point():
+def _parse_args(prog, description, m_add_args, argv=None):
+    from brs_utils import build_args_parser, init as init_logger
+
     parser = build_args_parser(
+        prog=prog,
+        description=description,
+        m_add_args=m_add_args,
+    )
+    args = parser.parse_args(argv)
+
+    return args, init_logger(parser, args, __version__)
+
+
+def entry_point():
+    # Subcommands
+    if len(sys_argv) > 1 and sys_argv[1] in SUBCOMMANDS:
+        return SUBCOMMANDS[sys_argv[1]](sys_argv[2:])
+
+    args, logger = _parse_args(
         prog="rpfba",
         description="Process to Flux Balance Analysis",
         m_add_args=add_arguments,
     )
-    args = parser.parse_args()
-
-    logger = init_logger(parser, args, __version__)
-
-    # PREPROCESSING
-    merged_model, pathway, ids = preprocess(args=args, logger=logger)
-
-    # FBA
-    results = runFBA(
-        model=merged_model,
-        compartment_id=ids["comp_id"],
-        biomass_rxn_id=ids["biomass_rxn_id"],
-        objective_rxn_id=ids["obj_rxn_id"],
-        sim_type=args.sim,
-        fraction_coeff=args.fraction_of,
-        logger=logger,
-    )
-    # with NamedTemporaryFile() as tmpfile:
-    #     merged_model.write_to_file(tmpfile.name)
-    #     results = runFBA(
-    #         model_file=tmpfile.name,
-    #         compartment_id=ids['comp_id'],
-    #         biomass_rxn_id=ids['biomass_rxn_id'],
-    #         objective_rxn_id=ids['obj_rxn_id'],
-    #         sim_type=args.sim,
-    #         fraction_coeff=args.fraction_of,
-    #         hidden_species=hidden_species,
-    #         logger=logger,
-    #     )
-
-    # RESULTS
-    hidden_species = merged_model.get_isolated_species()
-    results = build_results(
-        results=results,
-        pathway=pathway,
-        compartment_id=ids["comp_id"],
-        hidden_species=hidden_species,
-        logger=logger,
-    )
 
-    # # Remove the Cobra standard ('compound@compartment') from all compounds
-    # pathway.uncobraize()
+    from .cache import open_cache
+    from .fba import run_pathway
+    from .host import HostModel
+    from .profiling import PROFILER, report_profile, setup_profiler
+    from .profiling import stage as profile_stage
+    from .results import ResultsWriter
 
-    # results = uncobraize_results(results, cobra_suffix(compartment_id))
+    setup_profiler(args)
+    host = HostModel(model_file=args.model_file, logger=logger, snapshot=args.snapshot)
+    cache = open_cache(args, logger)
 
-    # Write results into the pathway
-    write_results_to_pathway(pathway, results, logger)
+    with PROFILER.pathway(os_path.basename(args.pathway_file)), profile_stage(
+        "pathway"
+    ):
+        processed = run_pathway(args=args, host=host, cache=cache, logger=logger)
+    if cache is not None:
+        cache.log_stats()
+        cache.close()
+    if processed is None:
+        return 1
+    pathway, results = processed
 
     if not results:
         logger.info("No results written. Exiting...")
     else:
         logger.info("Writing into file...")
         _make_dir(args.outfile)
-        pathway.write_to_file(args.outfile)
+        with profile_stage("write_pathway"):
+            pathway.write_to_file(args.outfile)
         logger.info("   |--> written in " + args.outfile)
+        for outfile in args.results or []:
+            with ResultsWriter(outfile, logger=logger) as writer:
+                writer.write(os_path.basename(args.pathway_file), results)
+    report_profile(args, logger)
 
     return 0
 
 
+def batch(argv):
+    args, logger = _parse_args(
+        prog="rpfba batch",
+        description="Process to Flux Balance Analysis over a collection of pathways",
+        m_add_args=add_batch_arguments,
+        argv=argv,
+    )
+
+    from .batch import run_batch
+
+    status = run_batch(args=args, logger=logger)
+
+    return 1 if status["failed"] else 0
+
+
+def serve(argv):
+    args, logger = _parse_args(
+        prog="rpfba serve",
+        description="Serve Flux Balance Analysis of pathways over HTTP, the GEMs being preloaded",
+        m_add_args=add_serve_arguments,
+        argv=argv,
+    )
+
+    from .serve import serve as run_server
+
+    run_server(args=args, logger=logger)
+
+    return 0
+
+
+def snapshot(argv):
+    args, logger = _parse_args(
+        prog="rpfba snapshot",
+        description="Parse a GEM once and store its binary snapshot, to be loaded with --snapshot",
+        m_add_args=add_snapshot_command_arguments,
+        argv=argv,
+    )
+
+    from .host import HostModel
+    from .snapshot import default_snapshot
+
+    host = HostModel(model_file=args.model_file, logger=logger)
+    host.save_snapshot(args.output or default_snapshot(args.model_file))
+
+    return 0
+
+
+SUBCOMMANDS = {
+    "batch": batch,
+    "serve": serve,
+    "snapshot": snapshot,
+}
+
+
 if __name__ == "__main__":
     sys_exit(entry_point())
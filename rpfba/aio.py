@@ -0,0 +1,149 @@
+import asyncio
+from argparse import Namespace as arg_nspace
+from concurrent.futures import ProcessPoolExecutor
+from logging import Logger, getLevelName, getLogger
+from os import PathLike
+from os import path as os_path
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, Tuple, Union
+
+from .batch import _collect_profile, _init_worker, _process_in_worker
+from .host import shared_snapshot
+
+# A pathway source: a file path, or a tuple (name, file path or content)
+PathwaySource = Union[str, PathLike, Tuple[str, Union[str, PathLike, bytes]]]
+
+
+async def run_fba_many(
+    pathway_sources: Union[Iterable[PathwaySource], AsyncIterable[PathwaySource]],
+    model_file: str,
+    args: arg_nspace,
+    jobs: int = 1,
+    max_pending: int = None,
+    logger: Logger = getLogger(__name__),
+) -> AsyncIterator[Tuple[str, bytes, Dict]]:
+    """Process the pathways of pathway_sources against model_file and yield
+    the results as they complete, as tuples (name, content of the resulting
+    pathway file, results as built by build_results), (name, None, None)
+    for the pathways which cannot be processed.
+
+    Pathways are read (in threads) while others are simulated by a pool of
+    jobs worker processes, which share the arrays of the GEM parsed once
+    with the 'scipy' engine (see shared_snapshot). At most max_pending pathways read and max_pending
+    results not consumed yet are held, reading (then simulating) pausing
+    until they are consumed.
+
+    :param pathway_sources: Pathway files, or tuples (name, file or content), e.g. from iter_pathway_files
+    :param model_file: The GEM model file (SBML)
+    :param args: The simulation arguments, as parsed from the command line
+    :param jobs: The number of worker processes (Default: 1)
+    :param max_pending: The maximal number of pathways waiting to be simulated, or results waiting to be consumed (Default: None, 2*jobs)
+    :param logger: The logger object
+
+    :type pathway_sources: Union[Iterable, AsyncIterable]
+    :type model_file: str
+    :type args: Namespace
+    :type jobs: int
+    :type max_pending: int
+    :type logger: Logger
+
+    :return: Tuples (name, content, results)
+    :rtype: AsyncIterator[Tuple[str, bytes, Dict]]
+    """
+    args = arg_nspace(**{**vars(args), "model_file": model_file})
+    if max_pending is None:
+        max_pending = 2 * jobs
+    loop = asyncio.get_running_loop()
+    pending = asyncio.Queue(maxsize=max_pending)
+    done = asyncio.Queue(maxsize=max_pending)
+
+    async def read() -> Exception:
+        error = None
+        try:
+            async for name, content in _aiter_sources(pathway_sources):
+                # Wait for a free slot (backpressure)
+                await pending.put((name, content))
+        except Exception as e:
+            logger.error(f"Reading pathways: {e}")
+            error = e
+        # Stop the solvers
+        for _ in range(jobs):
+            await pending.put(None)
+        return error
+
+    async def solve(executor: ProcessPoolExecutor) -> None:
+        while (item := await pending.get()) is not None:
+            try:
+                processed = _collect_profile(
+                    await loop.run_in_executor(executor, _process_in_worker, *item)
+                )
+            except Exception as e:
+                processed = e
+            await done.put(processed)
+        await done.put(None)
+
+    with shared_snapshot(
+        model_file,
+        getattr(args, "snapshot", None),
+        jobs,
+        getattr(args, "engine", "cobra"),
+        logger,
+    ) as snapshot:
+        # The workers load the GEM from the same snapshot
+        worker_args = arg_nspace(**{**vars(args), "snapshot": snapshot})
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_worker,
+            initargs=(worker_args, getLevelName(logger.getEffectiveLevel())),
+        ) as executor:
+            tasks = [asyncio.create_task(solve(executor)) for _ in range(jobs)]
+            reader = asyncio.create_task(read())
+            try:
+                nb_running = jobs
+                while nb_running:
+                    processed = await done.get()
+                    if processed is None:
+                        nb_running -= 1
+                    elif isinstance(processed, Exception):
+                        raise processed
+                    else:
+                        yield processed
+                error = await reader
+                if error is not None:
+                    raise error
+            finally:
+                for task in tasks + [reader]:
+                    task.cancel()
+                await asyncio.gather(*tasks, reader, return_exceptions=True)
+
+
+async def _aiter_sources(
+    pathway_sources: Union[Iterable[PathwaySource], AsyncIterable[PathwaySource]],
+) -> AsyncIterator[Tuple[str, bytes]]:
+    """Yield the name and the content of each pathway of pathway_sources,
+    files being read, and synchronous iterables iterated, in threads.
+    """
+    if hasattr(pathway_sources, "__aiter__"):
+        async for source in pathway_sources:
+            yield await asyncio.to_thread(_read_source, source)
+    else:
+        sources = iter(pathway_sources)
+        # Each step reads the pathway before the next one is requested, as
+        # iter_pathway_files removes the archive members it has extracted
+        while (source := await asyncio.to_thread(_next_source, sources)) is not None:
+            yield source
+
+
+def _next_source(sources: Iterator[PathwaySource]) -> Tuple[str, bytes]:
+    source = next(sources, None)
+    return None if source is None else _read_source(source)
+
+
+def _read_source(source: PathwaySource) -> Tuple[str, bytes]:
+    if isinstance(source, tuple):
+        name, source = source
+    else:
+        name = os_path.basename(source)
+    if isinstance(source, bytes):
+        return name, source
+    with open(source, "rb") as f:
+        return name, f.read()
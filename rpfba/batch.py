@@ -0,0 +1,359 @@
+from argparse import Namespace as arg_nspace
+from contextlib import ExitStack
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from glob import glob
+from io import BytesIO
+from logging import Logger, getLevelName, getLogger
+from os import listdir, makedirs, remove
+from os import path as os_path
+from posixpath import normpath
+from shutil import copyfileobj
+from tarfile import TarInfo, is_tarfile
+from tarfile import open as tar_open
+from tempfile import TemporaryDirectory
+from time import time
+from typing import Dict, Iterator, List, Tuple
+
+from brs_utils import create_logger
+
+from .cache import ResultsCache, open_cache
+from .fba import run_pathway
+from .host import HostModel, shared_snapshot
+from .profiling import PROFILER, report_profile, setup_profiler
+from .profiling import stage as profile_stage
+from .results import ResultsWriter
+
+SBML_EXTENSIONS = (".xml", ".sbml")
+TAR_MODES = {
+    ".tar": "w",
+    ".tar.gz": "w:gz",
+    ".tgz": "w:gz",
+    ".tar.bz2": "w:bz2",
+    ".tar.xz": "w:xz",
+}
+
+
+def iter_pathway_files(
+    pathways: List[str],
+    logger: Logger = getLogger(__name__),
+) -> Iterator[Tuple[str, str]]:
+    """Yield the name and the path of each pathway file found in pathways.
+
+    Each item of pathways can be a file, a directory (its SBML files are
+    taken), a glob pattern or a tar archive. Archive members are extracted
+    one at a time into a temporary file, which is removed once the next
+    pathway is requested, so that archives are never fully extracted.
+
+    Pathways are named after their file name, or their (relative) path for
+    archive members. As they name the output pathways and the results,
+    names are unique: a name already yielded gets a '_<n>' suffix (before
+    its extension).
+
+    :param pathways: Files, directories, glob patterns or tar archives
+    :param logger: The logger object
+
+    :type pathways: List[str]
+    :type logger: Logger
+
+    :return: Tuples (name, path) of pathway files
+    :rtype: Iterator[Tuple[str, str]]
+    """
+    names = set()
+    for name, path in _iter_pathway_files(pathways, logger):
+        if name in names:
+            stem, ext = os_path.splitext(name)
+            n = 2
+            while f"{stem}_{n}{ext}" in names:
+                n += 1
+            logger.warning(f"Pathway {name} found twice, {path} named {stem}_{n}{ext}")
+            name = f"{stem}_{n}{ext}"
+        names.add(name)
+        yield name, path
+
+
+def _iter_pathway_files(
+    pathways: List[str],
+    logger: Logger = getLogger(__name__),
+) -> Iterator[Tuple[str, str]]:
+    for item in pathways:
+        if os_path.isdir(item):
+            filenames = sorted(
+                os_path.join(item, f)
+                for f in listdir(item)
+                if f.lower().endswith(SBML_EXTENSIONS)
+            )
+        elif os_path.isfile(item):
+            filenames = [item]
+        else:
+            filenames = sorted(glob(item))
+            if not filenames:
+                logger.warning(f"No pathway found in {item}")
+        for filename in filenames:
+            if is_tarfile(filename):
+                yield from _iter_archive(filename, logger)
+            else:
+                yield os_path.basename(filename), filename
+
+
+def _iter_archive(
+    filename: str,
+    logger: Logger = getLogger(__name__),
+) -> Iterator[Tuple[str, str]]:
+    logger.debug(f"Reading archive {filename}")
+    # Stream mode: members are read in sequence, without seeking
+    with tar_open(filename, mode="r|*") as archive, TemporaryDirectory() as tmp_d:
+        for member in archive:
+            if not member.isfile():
+                continue
+            # Relative path within the archive
+            name = normpath(member.name).lstrip("/")
+            if name.split("/")[0] == "..":
+                logger.warning(f"Skipping {member.name}, outside of {filename}")
+                continue
+            path = os_path.join(tmp_d, os_path.basename(name))
+            with archive.extractfile(member) as src, open(path, "wb") as dst:
+                copyfileobj(src, dst)
+            yield name, path
+            remove(path)
+
+
+class PathwayWriter:
+    """Write pathways into a directory or a tar archive, depending on the
+    extension of outpath.
+    """
+
+    def __init__(
+        self,
+        outpath: str,
+        logger: Logger = getLogger(__name__),
+    ):
+        self.outpath = outpath
+        self.logger = logger
+        self.__archive = None
+        mode = get_tar_mode(outpath)
+        if mode is None:
+            makedirs(outpath, exist_ok=True)
+        else:
+            dirname = os_path.dirname(outpath)
+            if dirname != "":
+                makedirs(dirname, exist_ok=True)
+            self.__archive = tar_open(outpath, mode=mode)
+
+    def write_content(self, name: str, content: bytes) -> None:
+        """Write the content of the pathway file name, which can be a
+        relative path (see iter_pathway_files).
+        """
+        if self.__archive is None:
+            outfile = os_path.join(self.outpath, name)
+            makedirs(os_path.dirname(outfile), exist_ok=True)
+            with open(outfile, "wb") as f:
+                f.write(content)
+            return
+        info = TarInfo(name=name)
+        info.size = len(content)
+        info.mtime = time()
+        self.__archive.addfile(info, BytesIO(content))
+
+    def close(self) -> None:
+        if self.__archive is not None:
+            self.__archive.close()
+
+    def __enter__(self) -> "PathwayWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def get_tar_mode(outpath: str) -> str:
+    """Return the tarfile writing mode according to the extension of outpath,
+    None if outpath is not an archive.
+    """
+    for ext, mode in TAR_MODES.items():
+        if outpath.lower().endswith(ext):
+            return mode
+    return None
+
+
+def run_batch(
+    args: arg_nspace,
+    logger: Logger = getLogger(__name__),
+) -> Dict:
+    """Process all the pathways of args.pathways against args.model_file,
+    which is parsed only once (per worker), and write the results into
+    args.outpath (and stream them into the files args.results, if any).
+    If args.jobs is greater than 1, pathways are dispatched over a pool of
+    args.jobs worker processes.
+
+    :param args: The arguments, as parsed from the command line
+    :param logger: The logger object
+
+    :type args: Namespace
+    :type logger: Logger
+
+    :return: The names of the processed and failed pathways
+    :rtype: Dict
+    """
+    status = {"processed": [], "failed": []}
+    setup_profiler(args)
+    cache = open_cache(args, logger)
+    cache_stats = cache.stats() if cache is not None else None
+    with ExitStack() as stack:
+        writer = stack.enter_context(PathwayWriter(args.outpath, logger))
+        results_writers = [
+            stack.enter_context(ResultsWriter(outfile, logger=logger))
+            for outfile in getattr(args, "results", None) or []
+        ]
+        if getattr(args, "jobs", 1) > 1:
+            processed = _run_pool(args, logger)
+        else:
+            processed = _run_sequential(args, cache, logger)
+        for name, content, results in processed:
+            if content is None:
+                status["failed"].append(name)
+            else:
+                writer.write_content(name, content)
+                for results_writer in results_writers:
+                    results_writer.write(name, results)
+                status["processed"].append(name)
+
+    logger.info(
+        f"{len(status['processed'])} pathway(s) processed, "
+        + f"{len(status['failed'])} failed"
+    )
+    if cache is not None:
+        # Hits and misses of all the workers
+        cache.log_stats(since=cache_stats)
+        cache.close()
+    # Stages of all the workers
+    report_profile(args, logger)
+    return status
+
+
+def _run_sequential(
+    args: arg_nspace,
+    cache: ResultsCache = None,
+    logger: Logger = getLogger(__name__),
+) -> Iterator[Tuple[str, bytes, Dict]]:
+    # Parse the GEM once for all the pathways
+    host = HostModel(
+        model_file=args.model_file,
+        logger=logger,
+        snapshot=getattr(args, "snapshot", None),
+    )
+    for name, path in iter_pathway_files(args.pathways, logger):
+        yield (name, *_process_pathway(name, path, args, host, cache, logger))
+
+
+def _run_pool(
+    args: arg_nspace,
+    logger: Logger = getLogger(__name__),
+) -> Iterator[Tuple[str, bytes, Dict]]:
+    with shared_snapshot(
+        args.model_file,
+        getattr(args, "snapshot", None),
+        args.jobs,
+        getattr(args, "engine", "cobra"),
+        logger,
+    ) as snapshot:
+        # The workers load the GEM from the same snapshot
+        worker_args = arg_nspace(**{**vars(args), "snapshot": snapshot})
+        logger.info(f"Processing pathways over {args.jobs} workers...")
+        with ProcessPoolExecutor(
+            max_workers=args.jobs,
+            initializer=_init_worker,
+            initargs=(worker_args, getLevelName(logger.getEffectiveLevel())),
+        ) as executor:
+            # Bound the number of pending pathways, archives are read as needed
+            max_pending = 2 * args.jobs
+            pending = set()
+            for name, path in iter_pathway_files(args.pathways, logger):
+                with open(path, "rb") as f:
+                    pending.add(executor.submit(_process_in_worker, name, f.read()))
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield _collect_profile(future.result())
+            for future in as_completed(pending):
+                yield _collect_profile(future.result())
+
+
+def _collect_profile(
+    processed: Tuple[str, bytes, Dict, Dict],
+) -> Tuple[str, bytes, Dict]:
+    # Merge the profile of the pathway processed by a worker
+    name, content, results, profile = processed
+    PROFILER.merge(profile)
+    return name, content, results
+
+
+def _process_pathway(
+    name: str,
+    path: str,
+    args: arg_nspace,
+    host: HostModel,
+    cache: ResultsCache = None,
+    logger: Logger = getLogger(__name__),
+) -> Tuple[bytes, Dict]:
+    """Process the pathway file path and return the content of the
+    resulting pathway file and the results, (None, None) if the pathway
+    cannot be processed.
+    """
+    logger.info(f"Processing {name}...")
+    pathway_args = arg_nspace(**{**vars(args), "pathway_file": path, "merge": ""})
+    with PROFILER.pathway(name), profile_stage("pathway"):
+        try:
+            processed = run_pathway(
+                args=pathway_args, host=host, cache=cache, logger=logger
+            )
+        except Exception as e:
+            logger.error(f"{name}: {e}")
+            return None, None
+        if processed is None:
+            return None, None
+        pathway, results = processed
+        with TemporaryDirectory() as tmp_d, profile_stage("write_pathway"):
+            # name can be a relative path
+            outfile = os_path.join(tmp_d, os_path.basename(name))
+            pathway.write_to_file(outfile)
+            with open(outfile, "rb") as f:
+                return f.read(), results
+
+
+# Worker-local state, set by _init_worker in each process of the pool
+_worker = {}
+
+
+def _init_worker(args: arg_nspace, log_level: str) -> None:
+    logger = create_logger(__name__, log_level)
+    _worker["args"] = args
+    _worker["logger"] = logger
+    # The GEM is parsed once per worker (or memory-mapped from the snapshot),
+    # and its cobra model built on first use
+    _worker["host"] = HostModel(
+        model_file=args.model_file,
+        logger=logger,
+        snapshot=getattr(args, "snapshot", None),
+    )
+    _worker["cache"] = open_cache(args, logger)
+    setup_profiler(args)
+
+
+def _process_in_worker(name: str, content: bytes) -> Tuple[str, bytes, Dict, Dict]:
+    with TemporaryDirectory() as tmp_d:
+        path = os_path.join(tmp_d, os_path.basename(name))
+        with open(path, "wb") as f:
+            f.write(content)
+        return (
+            name,
+            *_process_pathway(
+                name,
+                path,
+                _worker["args"],
+                _worker["host"],
+                _worker["cache"],
+                _worker["logger"],
+            ),
+            # Stages recorded by the worker, None if profiling is disabled
+            PROFILER.drain(),
+        )
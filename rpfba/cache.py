@@ -0,0 +1,346 @@
+import sqlite3
+import struct
+from argparse import Namespace as arg_nspace
+from hashlib import sha256
+from json import dumps as json_dumps
+from json import loads as json_loads
+from logging import Logger, getLogger
+from os import makedirs
+from os import path as os_path
+from time import time
+from typing import TYPE_CHECKING, Dict, List
+from zlib import compress, decompress
+from zlib import error as zlib_error
+
+import numpy as np
+import pandas as pd
+from cobra import Solution as cobra_solution
+
+from ._version import __version__
+
+if TYPE_CHECKING:
+    from rplibs import rpSBML
+
+CACHE_FILENAME = "rpfba_cache.sqlite"
+# Series of the cobra Solutions stored, as float64 arrays
+SOLUTION_SERIES = ("fluxes", "reduced_costs", "shadow_prices")
+
+
+class CacheError(Exception):
+    pass
+
+
+class ResultsCache:
+    """On-disk cache of the results of runFBA, stored in an SQLite database
+    within cache_dir and keyed by simulation_key.
+
+    Results are stored as JSON and arrays (see encode_results), not
+    pickled, so that loading them cannot execute any code: a cache_dir
+    shared between runs does not have to be trusted.
+
+    When the size of the cached results exceeds max_size (in bytes), the
+    least recently used ones are evicted. Hits and misses are counted in
+    the database, so that they are shared by all the processes (e.g. batch
+    workers) using the same cache_dir.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_size: int = 1024**3,
+        logger: Logger = getLogger(__name__),
+    ):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.logger = logger
+        makedirs(cache_dir, exist_ok=True)
+        self.__db = sqlite3.connect(os_path.join(cache_dir, CACHE_FILENAME), timeout=60)
+        # Let the workers of a batch read while another one writes
+        self.__db.execute("PRAGMA journal_mode=WAL")
+        with self.__db:
+            self.__db.execute(
+                "CREATE TABLE IF NOT EXISTS results "
+                + "(key TEXT PRIMARY KEY, value BLOB, size INTEGER, accessed REAL)"
+            )
+            self.__db.execute(
+                "CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)"
+            )
+            self.__db.executemany(
+                "INSERT OR IGNORE INTO stats VALUES (?, 0)", [("hits",), ("misses",)]
+            )
+
+    def get(self, key: str) -> Dict:
+        """Return the results cached for key, None if there is none. Results
+        that cannot be decoded (see decode_results) are removed and counted
+        as a miss.
+
+        :param key: The key, see simulation_key
+        :type key: str
+
+        :return: The results of runFBA
+        :rtype: Dict
+        """
+        row = self.__db.execute(
+            "SELECT value FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        results = None
+        if row is not None:
+            try:
+                results = decode_results(row[0])
+            except CacheError as e:
+                self.logger.warning(f"Removing invalid cached results ({key}): {e}")
+                with self.__db:
+                    self.__db.execute("DELETE FROM results WHERE key = ?", (key,))
+                row = None
+        with self.__db:
+            self.__db.execute(
+                "UPDATE stats SET value = value + 1 WHERE name = ?",
+                ("misses" if row is None else "hits",),
+            )
+            if row is None:
+                return None
+            self.__db.execute(
+                "UPDATE results SET accessed = ? WHERE key = ?", (time(), key)
+            )
+        self.logger.debug(f"Results found in cache ({key})")
+        return results
+
+    def put(self, key: str, results: Dict) -> None:
+        """Cache results under key, then evict the least recently used results
+        if the cache is full.
+
+        :param key: The key, see simulation_key
+        :param results: The results of runFBA
+
+        :type key: str
+        :type results: Dict[str, cobra.Solution]
+        """
+        value = encode_results(results)
+        if len(value) > self.max_size:
+            self.logger.warning(
+                f"Results too large to be cached ({len(value)} > {self.max_size} bytes)"
+            )
+            return
+        with self.__db:
+            self.__db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time()),
+            )
+            self.__evict()
+
+    def __evict(self) -> None:
+        (size,) = self.__db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+        if size <= self.max_size:
+            return
+        evicted = []
+        for key, entry_size in self.__db.execute(
+            "SELECT key, size FROM results ORDER BY accessed"
+        ).fetchall():
+            if size <= self.max_size:
+                break
+            evicted.append((key,))
+            size -= entry_size
+        self.__db.executemany("DELETE FROM results WHERE key = ?", evicted)
+        self.logger.debug(f"{len(evicted)} result(s) evicted from cache")
+
+    def stats(self) -> Dict:
+        """Return the number of hits and misses, the number of cached results
+        and their size (in bytes).
+
+        :rtype: Dict
+        """
+        stats = dict(self.__db.execute("SELECT name, value FROM stats").fetchall())
+        stats["entries"], stats["size"] = self.__db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+        return stats
+
+    def log_stats(self, since: Dict = None) -> None:
+        """Log the cache statistics, hits and misses being counted from the
+        statistics since (as returned by stats), if given.
+
+        :param since: Former statistics (Default: None)
+        :type since: Dict
+        """
+        stats = self.stats()
+        if since is not None:
+            for name in ("hits", "misses"):
+                stats[name] -= since[name]
+        self.logger.info(
+            f"Cache: {stats['hits']} hit(s), {stats['misses']} miss(es), "
+            + f"{stats['entries']} result(s) cached ({stats['size'] / 1024**2:.1f} MB)"
+        )
+
+    def close(self) -> None:
+        self.__db.close()
+
+
+def encode_results(results: Dict[str, cobra_solution]) -> bytes:
+    """Return results, cobra Solutions by simulation type, as the
+    (compressed) JSON of their objective values and status, followed by
+    their series (see SOLUTION_SERIES) as raw float64 arrays, the indexes of
+    which are stored once in the JSON.
+
+    :param results: The results of runFBA
+    :type results: Dict[str, cobra.Solution]
+
+    :return: The encoded results
+    :rtype: bytes
+    """
+    indexes = {}
+    arrays = []
+    offset = 0
+    solutions = {}
+    for sim_type, solution in results.items():
+        if solution is None:
+            solutions[sim_type] = None
+            continue
+        series = {}
+        for name in SOLUTION_SERIES:
+            values = getattr(solution, name, None)
+            if values is None:
+                series[name] = None
+                continue
+            index = indexes.setdefault(tuple(values.index), len(indexes))
+            arrays.append(values.to_numpy(dtype=np.float64))
+            series[name] = [index, offset]
+            offset += len(values)
+        solutions[sim_type] = {
+            "objective_value": (
+                None
+                if solution.objective_value is None
+                else float(solution.objective_value)
+            ),
+            "status": solution.status,
+            "series": series,
+        }
+    header = json_dumps(
+        {"indexes": [list(index) for index in indexes], "solutions": solutions}
+    ).encode()
+    return compress(
+        struct.pack("<Q", len(header))
+        + header
+        + b"".join(array.tobytes() for array in arrays)
+    )
+
+
+def decode_results(value: bytes) -> Dict[str, cobra_solution]:
+    """Return the results encoded by encode_results.
+
+    :param value: The encoded results
+    :type value: bytes
+
+    :raises CacheError: If value is not encoded results
+
+    :return: The results of runFBA
+    :rtype: Dict[str, cobra.Solution]
+    """
+    try:
+        buffer = decompress(value)
+        (size,) = struct.unpack_from("<Q", buffer)
+        start = struct.calcsize("<Q")
+        header = json_loads(buffer[start : start + size])
+        arrays = np.frombuffer(buffer, dtype=np.float64, offset=start + size)
+        indexes = [pd.Index(index) for index in header["indexes"]]
+        results = {}
+        for sim_type, solution in header["solutions"].items():
+            if solution is None:
+                results[sim_type] = None
+                continue
+            series = {}
+            for name in SOLUTION_SERIES:
+                if solution["series"][name] is None:
+                    series[name] = None
+                    continue
+                index, offset = solution["series"][name]
+                if offset < 0 or offset + len(indexes[index]) > len(arrays):
+                    raise ValueError(f"{name} out of the arrays")
+                series[name] = pd.Series(
+                    arrays[offset : offset + len(indexes[index])].copy(),
+                    index=indexes[index],
+                    name=name,
+                )
+            results[sim_type] = cobra_solution(
+                objective_value=solution["objective_value"],
+                status=solution["status"],
+                **series,
+            )
+    except (
+        ValueError,
+        TypeError,
+        KeyError,
+        IndexError,
+        AttributeError,
+        struct.error,
+        zlib_error,
+    ) as e:
+        raise CacheError(f"not encoded results ({e})")
+    return results
+
+
+def open_cache(
+    args: arg_nspace,
+    logger: Logger = getLogger(__name__),
+) -> ResultsCache:
+    """Return the results cache of args.cache_dir, None if no cache is set."""
+    if not getattr(args, "cache_dir", None):
+        return None
+    return ResultsCache(
+        cache_dir=args.cache_dir,
+        max_size=args.cache_size * 1024**2,
+        logger=logger,
+    )
+
+
+def simulation_key(
+    rpsbml: "rpSBML",
+    hidden_species: List[str],
+    base: str = "",
+    **params,
+) -> str:
+    """Return the key of a simulation of rpsbml, i.e. the hash of its
+    stoichiometry and flux bounds, of its species hidden to cobra and of the
+    simulation parameters params (e.g. sim_type, fraction_coeff).
+
+    :param rpsbml: The merged model
+    :param hidden_species: The species hidden to cobra
+    :param base: A key rpsbml completes, e.g. the digest of the host model rpsbml is an overlay of (Default: '')
+    :param params: The simulation parameters
+
+    :type rpsbml: rpSBML
+    :type hidden_species: List[str]
+    :type base: str
+
+    :return: The key of the simulation
+    :rtype: str
+    """
+    h = sha256((__version__ + base).encode())
+    model = rpsbml.getModel()
+    # Reactions are hashed in the model order, which cobra follows
+    for rxn in model.getListOfReactions():
+        fbc_rxn = rxn.getPlugin("fbc")
+        bounds = [
+            model.getParameter(param_id)
+            for param_id in (fbc_rxn.getLowerFluxBound(), fbc_rxn.getUpperFluxBound())
+        ]
+        h.update(
+            repr(
+                (
+                    rxn.getId(),
+                    [
+                        (r.getSpecies(), r.getStoichiometry())
+                        for r in rxn.getListOfReactants()
+                    ],
+                    [
+                        (p.getSpecies(), p.getStoichiometry())
+                        for p in rxn.getListOfProducts()
+                    ],
+                    [None if b is None else b.getValue() for b in bounds],
+                )
+            ).encode()
+        )
+    h.update(repr(sorted(hidden_species)).encode())
+    h.update(repr(sorted(params.items())).encode())
+    return h.hexdigest()
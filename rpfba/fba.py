@@ -1,22 +1,43 @@
 import pandas as pd
 from logging import Logger, getLogger
 from os import remove
+from os import path as os_path
 from argparse import Namespace as arg_nspace
 from pandas.core.series import Series as np_series
-from typing import List, Dict, Tuple
+from typing import List, Dict, Iterable, Iterator, Set, Tuple, Union, TYPE_CHECKING
+from time import perf_counter
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from heapq import nlargest
+from itertools import chain, combinations
+from math import isnan
 from tempfile import NamedTemporaryFile
 from json import dumps as json_dumps
-from cobra.flux_analysis import pfba
+from cobra.flux_analysis import flux_variability_analysis, pfba
 from cobra import io as cobra_io
-from cobra.io.sbml import validate_sbml_model, CobraSBMLError
+from cobra.io.sbml import validate_sbml_model, CobraSBMLError, _sbml_to_model
+from cobra.io.sbml import F_GENE, F_REACTION, F_REPLACE
 from cobra.core.model import Model as cobra_model
 from cobra.core.solution import Solution as cobra_solution
 
+from libsbml import Reaction as libsbml_reaction
+from libsbml import writeSBMLToString
 from rplibs import rpSBML, rpPathway
 from rplibs.cobra_format import to_cobra, cobraize
 from .Args import DEFAULT_ARGS as DEFAULT_RPFBA_ARGS
+from .cache import simulation_key
+from .profiling import stage as profile_stage
 
-# TODO: add the pareto frontier optimisation as an automatic way to calculate the optimal fluxes
+if TYPE_CHECKING:
+    from .cache import ResultsCache
+    from .host import HostModel
+    from .lp import SparseLP
+
+# Simulations the 'scipy' engine runs, the others falling back to cobra
+SCIPY_ENGINE_SIMS = ["fba", "fraction", "multi_fba"]
+# Source optimum under which a knockout is lethal, and rise of the target
+# flux under which a knockout does not raise it
+KNOCKOUT_TOLERANCE = 1e-6
 
 
 class ModelError(Exception):
@@ -25,32 +46,97 @@ class ModelError(Exception):
 
 def preprocess(
     args: arg_nspace,
+    host: "HostModel" = None,
     logger: Logger = getLogger(__name__),
 ):
-    pathway = rpPathway(args.pathway_file, logger=logger)
-    pathway.setup_pathway_fba()
-    model = rpSBML(inFile=args.model_file, logger=logger)
+    with profile_stage("parse_pathway"):
+        pathway = rpPathway(args.pathway_file, logger=logger)
+        pathway.setup_pathway_fba()
+    if host is None:
+        model = rpSBML(inFile=args.model_file, logger=logger)
+    elif getattr(args, "cobra_from_file", False):
+        # The GEM has already been parsed
+        model = host.get_rpsbml()
+    else:
+        # IDs are checked against the GEM, or its skeleton if it is loaded
+        # from a snapshot, the pathway being merged into an overlay model
+        model = host.get_skeleton()
 
     try:
-        ids = check_ids(
-            pathway=pathway,
-            model=model,
-            objective_rxn_id=args.objective_rxn_id,
-            biomass_rxn_id=args.biomass_rxn_id,
-            compartment_id=args.compartment_id,
-            logger=logger,
-        )
+        with profile_stage("check_ids"):
+            ids = check_ids(
+                pathway=pathway,
+                model=model,
+                objective_rxn_id=args.objective_rxn_id,
+                biomass_rxn_id=args.biomass_rxn_id,
+                compartment_id=args.compartment_id,
+                logger=logger,
+            )
+            if args.sim == "multi_fba":
+                ids["objectives"] = check_objectives(
+                    pathway=pathway,
+                    model=model,
+                    objectives=getattr(args, "objectives", None),
+                )
     except ModelError as e:
         logger.error(e)
         return 1
 
     # MERGE
-    merged_model, reactions_in_both, missing_species, compartment_id = rpSBML.merge(
-        pathway=pathway.get_rpsbml(),
+    if host is not None and not getattr(args, "cobra_from_file", False):
+        # Merge into the part of the GEM the pathway can match only,
+        # the cobra model of the host being completed with the pathway
+        with profile_stage("overlay"):
+            model = host.overlay_model(
+                pathway=pathway.get_rpsbml(), biomass_rxn_id=ids["biomass_rxn_id"]
+            )
+    merged_model = merge_pathway(
+        pathway=pathway,
         model=model,
         compartment_id=ids["comp_id"],
+        with_orphan_species=args.with_orphan_species,
+        host=host,
         logger=logger,
     )
+
+    return merged_model, pathway, ids
+
+
+def merge_pathway(
+    pathway: rpPathway,
+    model: rpSBML,
+    compartment_id: str,
+    with_orphan_species: bool = DEFAULT_RPFBA_ARGS["with_orphan_species"],
+    host: "HostModel" = None,
+    logger: Logger = getLogger(__name__),
+) -> rpSBML:
+    """Merge pathway into model and, unless with_orphan_species is set,
+    search the isolated species of the merged model.
+
+    :param pathway: The pathway
+    :param model: The model to merge the pathway into
+    :param compartment_id: The compartment ID of the model
+    :param with_orphan_species: Keep the species only consumed or produced (Default: False)
+    :param host: The host model, whose species incidence index is used (Default: None)
+    :param logger: The logger object
+
+    :type pathway: rpPathway
+    :type model: rpSBML
+    :type compartment_id: str
+    :type with_orphan_species: bool
+    :type host: HostModel
+    :type logger: Logger
+
+    :return: The merged model
+    :rtype: rpSBML
+    """
+    with profile_stage("merge"):
+        merged_model, reactions_in_both, missing_species, compartment_id = rpSBML.merge(
+            pathway=pathway.get_rpsbml(),
+            model=model,
+            compartment_id=compartment_id,
+            logger=logger,
+        )
     logger.debug(f"model: {model}")
     logger.debug(f"reactions_in_both: {reactions_in_both}")
     logger.debug(f"missing_species: {missing_species}")
@@ -58,14 +144,239 @@ def preprocess(
     # CHECKING
     # Detect orphan species among missing ones in the model,
     # i.e. that are only consumed or produced
-    if not args.with_orphan_species:
-        merged_model.search_isolated_species(missing_species)
+    if not with_orphan_species:
+        with profile_stage("isolated_species"):
+            search_isolated_species(
+                rpsbml=merged_model,
+                species=missing_species,
+                host_incidence=None if host is None else host.get_species_incidence(),
+                logger=logger,
+            )
+
+    return merged_model
+
+
+def search_isolated_species(
+    rpsbml: rpSBML,
+    species: Iterable[str],
+    host_incidence: Dict[str, Tuple[Set[str], Set[str]]] = None,
+    pathway_id: str = "rp_pathway",
+    logger: Logger = getLogger(__name__),
+) -> List[str]:
+    """Search, among species, those of rpsbml which are only consumed or
+    only produced, and set them as the isolated species of rpsbml.
+
+    Producing and consuming reactions are looked up in a species incidence
+    index (see species_incidence). If host_incidence, the index of the host
+    model rpsbml has been merged from, is given, only the reactions of the
+    pathway group are indexed, otherwise all the reactions of rpsbml are.
+
+    :param rpsbml: The merged model
+    :param species: The IDs of the species to check (e.g. species missing from the host)
+    :param host_incidence: The species incidence index of the host (Default: None)
+    :param pathway_id: The ID of the heterologous pathway group (Default: rp_pathway)
+    :param logger: The logger object
+
+    :type rpsbml: rpSBML
+    :type species: Iterable[str]
+    :type host_incidence: Dict[str, Tuple[Set[str], Set[str]]]
+    :type pathway_id: str
+    :type logger: Logger
+
+    :return: The IDs of the isolated species
+    :rtype: List[str]
+    """
+    start = perf_counter()
+    species = list(species)
+    model = rpsbml.getModel()
+    group = rpsbml.getGroup(pathway_id)
+    if host_incidence is None or group is None:
+        host_incidence = {}
+        reactions = model.getListOfReactions()
+    else:
+        reactions = [
+            model.getReaction(member.getIdRef()) for member in group.getListOfMembers()
+        ]
+    incidence = species_incidence(reactions)
+
+    isolated = []
+    for spe_id in species:
+        producing, consuming = (
+            host_incidence.get(spe_id, (set(), set()))[i]
+            | incidence.get(spe_id, (set(), set()))[i]
+            for i in (0, 1)
+        )
+        if not producing or not consuming:
+            isolated.append(spe_id)
+    rpsbml.set_isolated_species(isolated)
+
+    logger.debug(
+        f"{len(isolated)} isolated species found among {len(species)} "
+        + f"({len(reactions)} reaction(s) indexed) in {perf_counter() - start:.4f} s"
+    )
+    return isolated
+
+
+def species_incidence(
+    reactions: Iterable[libsbml_reaction],
+) -> Dict[str, Tuple[Set[str], Set[str]]]:
+    """Index the producing and consuming reactions of each species involved
+    in reactions.
+
+    :param reactions: The libSBML reactions to index
+    :type reactions: Iterable[libsbml.Reaction]
+
+    :return: The IDs of the producing and consuming reactions, by species ID
+    :rtype: Dict[str, Tuple[Set[str], Set[str]]]
+    """
+    incidence = {}
+    for rxn in reactions:
+        if rxn is None:
+            continue
+        for i, species_refs in (
+            (0, rxn.getListOfProducts()),
+            (1, rxn.getListOfReactants()),
+        ):
+            for spe_ref in species_refs:
+                incidence.setdefault(spe_ref.getSpecies(), (set(), set()))[i].add(
+                    rxn.getId()
+                )
+    return incidence
+
+
+def run_pathway(
+    args: arg_nspace,
+    host: "HostModel" = None,
+    cache: "ResultsCache" = None,
+    logger: Logger = getLogger(__name__),
+) -> Tuple[rpPathway, Dict]:
+    """Process one pathway, from preprocessing to writing the results
+    into the pathway.
+
+    :param args: The arguments, as parsed from the command line
+    :param host: The host model to merge the pathway with (Default: None, args.model_file is parsed)
+    :param cache: The cache to look the results of the simulation up in (Default: None)
+    :param logger: The logger object
+
+    :type args: Namespace
+    :type host: HostModel
+    :type cache: ResultsCache
+    :type logger: Logger
+
+    :return: The pathway and the results, None if the pathway cannot be processed
+    :rtype: Tuple[rpPathway, Dict]
+    """
+
+    # PREPROCESSING
+    preprocessed = preprocess(args=args, host=host, logger=logger)
+    if preprocessed == 1:
+        return None
+    merged_model, pathway, ids = preprocessed
+
+    # FBA
+    sim_params = {
+        "objective_rxn_id": ids["obj_rxn_id"],
+        "biomass_rxn_id": ids["biomass_rxn_id"],
+        "sim_type": args.sim,
+        "fraction_coeff": args.fraction_of,
+        "fraction_sweep": args.fraction_sweep,
+        "pareto_tolerance": args.pareto_tolerance,
+        "pareto_max_points": args.pareto_max_points,
+        "objectives": ids.get("objectives"),
+        "engine": getattr(args, "engine", DEFAULT_RPFBA_ARGS["engine"]),
+    }
+    if args.sim == "knockout":
+        candidates = getattr(args, "knockout_candidates", None)
+        sim_params.update(
+            knockout_type=getattr(
+                args, "knockout_type", DEFAULT_RPFBA_ARGS["knockout_type"]
+            ),
+            # Read once, and part of the cache key
+            knockout_candidates=(
+                None if candidates is None else read_candidates(candidates)
+            ),
+            double_knockouts=getattr(
+                args, "double_knockouts", DEFAULT_RPFBA_ARGS["double_knockouts"]
+            ),
+            knockout_top=getattr(
+                args, "knockout_top", DEFAULT_RPFBA_ARGS["knockout_top"]
+            ),
+        )
+    results = None
+    if cache is not None:
+        with profile_stage("cache"):
+            key = simulation_key(
+                merged_model,
+                merged_model.get_isolated_species(),
+                # The merged model can be an overlay of the host
+                base="" if host is None else host.digest(),
+                **sim_params,
+            )
+            results = cache.get(key)
+    if results is None:
+        with profile_stage("simulate"):
+            results = runFBA(
+                model=merged_model,
+                compartment_id=ids["comp_id"],
+                cobra_from_file=args.cobra_from_file,
+                host=host,
+                fva_processes=getattr(
+                    args, "fva_processes", DEFAULT_RPFBA_ARGS["fva_processes"]
+                ),
+                knockout_processes=getattr(
+                    args,
+                    "knockout_processes",
+                    DEFAULT_RPFBA_ARGS["knockout_processes"],
+                ),
+                knockout_max=getattr(
+                    args, "knockout_max", DEFAULT_RPFBA_ARGS["knockout_max"]
+                ),
+                # The merged model is only annotated if it is saved
+                write_results=False,
+                logger=logger,
+                **sim_params,
+            )
+        if cache is not None:
+            cache.put(key, results)
 
     if args.merge != "":
+        if host is not None:
+            # The full merged model is only built to be saved
+            merged_model = merge_pathway(
+                pathway=pathway,
+                model=host.get_rpsbml(),
+                compartment_id=ids["comp_id"],
+                with_orphan_species=args.with_orphan_species,
+                host=host,
+                logger=logger,
+            )
+        write_results_to_merged_model(
+            rpsbml=merged_model,
+            results=results,
+            objective_rxn_id=ids["obj_rxn_id"],
+            biomass_rxn_id=ids["biomass_rxn_id"],
+            objectives=ids.get("objectives"),
+            logger=logger,
+        )
         logger.info(f"Write merged rpSBML file to {args.merge}")
         merged_model.write_to_file(args.merge)
 
-    return merged_model, pathway, ids
+    # RESULTS
+    hidden_species = merged_model.get_isolated_species()
+    with profile_stage("build_results"):
+        results = build_results(
+            results=results,
+            pathway=pathway,
+            compartment_id=ids["comp_id"],
+            hidden_species=hidden_species,
+            logger=logger,
+        )
+
+    # Write results into the pathway
+    with profile_stage("write_results"):
+        write_results_to_pathway(pathway, results, logger)
+
+    return pathway, results
 
 
 def check_ids(
@@ -122,6 +433,73 @@ def check_ids(
     }
 
 
+def check_objectives(
+    pathway: rpPathway,
+    model: rpSBML,
+    objectives: List[Tuple[str, float, str]],
+) -> List[Tuple[str, float, str]]:
+    """Check the reactions of the weighted objective objectives, which
+    can be in the pathway or in the model. If one is not found, or if there
+    is no objective, then raise ModelError exception.
+
+    :param pathway: The pathway rpSBML object
+    :param model: The model rpSBML object
+    :param objectives: The reactions of the objective, as (ID, weight, sense)
+
+    :type pathway: rpPathway
+    :type model: rpSBML
+    :type objectives: List[Tuple[str, float, str]]
+
+    :return: The reactions of the objective, with their SBML IDs
+    :rtype: List[Tuple[str, float, str]]
+    """
+    if not objectives:
+        raise ModelError("No objectives given for 'multi_fba' simulation.")
+    checked = []
+    for rxn_id, weight, sense in objectives:
+        sbml_rxn_id = pathway.get_rpsbml().check_SBML_rxnid(rxn_id)
+        if sbml_rxn_id is None:
+            sbml_rxn_id = model.check_SBML_rxnid(rxn_id)
+        if sbml_rxn_id is None:
+            raise ModelError(f"No objective reaction {rxn_id} found.")
+        checked.append((sbml_rxn_id, weight, sense))
+    return checked
+
+
+def find_or_create_weighted_objective(
+    rpsbml: rpSBML,
+    objectives: List[Tuple[str, float, str]],
+    obj_id: str = "brs_obj_multi",
+) -> str:
+    """Set the (FBC) objective obj_id of rpsbml to the weighted sum of the
+    fluxes of objectives, to be maximised ('min' reactions being given
+    negative weights).
+
+    :param rpsbml: The model
+    :param objectives: The reactions of the objective, as (ID, weight, sense)
+    :param obj_id: The objective ID (Default: brs_obj_multi)
+
+    :type rpsbml: rpSBML
+    :type objectives: List[Tuple[str, float, str]]
+    :type obj_id: str
+
+    :return: The objective ID
+    :rtype: str
+    """
+    fbc_plugin = rpsbml.getModel().getPlugin("fbc")
+    # The weights may have changed
+    if fbc_plugin.getObjective(obj_id) is not None:
+        fbc_plugin.removeObjective(obj_id)
+    objective = fbc_plugin.createObjective()
+    objective.setId(obj_id)
+    objective.setType("maximize")
+    for rxn_id, weight, sense in objectives:
+        flux_obj = objective.createFluxObjective()
+        flux_obj.setReaction(rxn_id)
+        flux_obj.setCoefficient(weight if sense == "max" else -weight)
+    return obj_id
+
+
 def runFBA_fromFile(
     model_file: str,
     compartment_id: str,
@@ -183,6 +561,21 @@ def runFBA(
     biomass_rxn_id: str = DEFAULT_RPFBA_ARGS["biomass_rxn_id"],
     sim_type: str = DEFAULT_RPFBA_ARGS["sim"],
     fraction_coeff: float = DEFAULT_RPFBA_ARGS["fraction_coeff"],
+    cobra_from_file: bool = DEFAULT_RPFBA_ARGS["cobra_from_file"],
+    host: "HostModel" = None,
+    fraction_sweep: List[float] = DEFAULT_RPFBA_ARGS["fraction_sweep"],
+    pareto_tolerance: float = DEFAULT_RPFBA_ARGS["pareto_tolerance"],
+    pareto_max_points: int = DEFAULT_RPFBA_ARGS["pareto_max_points"],
+    fva_processes: int = DEFAULT_RPFBA_ARGS["fva_processes"],
+    objectives: List[Tuple[str, float, str]] = DEFAULT_RPFBA_ARGS["objectives"],
+    knockout_type: str = DEFAULT_RPFBA_ARGS["knockout_type"],
+    knockout_candidates: List[str] = DEFAULT_RPFBA_ARGS["knockout_candidates"],
+    double_knockouts: bool = DEFAULT_RPFBA_ARGS["double_knockouts"],
+    knockout_top: int = DEFAULT_RPFBA_ARGS["knockout_top"],
+    knockout_processes: int = DEFAULT_RPFBA_ARGS["knockout_processes"],
+    knockout_max: int = DEFAULT_RPFBA_ARGS["knockout_max"],
+    engine: str = DEFAULT_RPFBA_ARGS["engine"],
+    write_results: bool = True,
     logger: Logger = getLogger(__name__),
 ) -> Dict:
     """Single rpSBML simulation
@@ -194,6 +587,21 @@ def runFBA(
     :param sim_type: The simulation type (Default: fraction)
     :param fraction_coeff: The fraction coefficient (Default: 0.75)
     :param hidden_species: List of hidden species (Default: [])
+    :param fraction_sweep: Fraction coefficients to sweep in 'fraction' simulation, in place of fraction_coeff. Results are stored as 'fraction_<coefficient>' (Default: None)
+    :param pareto_tolerance: Relative deviation under which a segment of the frontier is not refined in 'pareto' simulation (Default: 0.01)
+    :param pareto_max_points: Maximal number of points of the frontier in 'pareto' simulation. Results are stored as 'pareto_<fraction of the biomass optimum>' (Default: 20)
+    :param fva_processes: Number of processes running the LPs of 'fva' and 'fraction_fva' simulations. Results are stored as 'fva_min' and 'fva_max' (Default: 1)
+    :param objectives: The reactions of the weighted objective of 'multi_fba' simulation, as (ID, weight, 'max' or 'min'), optimised at once on the same cobra model (Default: None)
+    :param knockout_type: Knock out 'reaction's or 'gene's in 'knockout' simulation (Default: reaction)
+    :param knockout_candidates: The reactions (or genes) to knock out in 'knockout' simulation, see knockout_candidates (Default: None, all)
+    :param double_knockouts: Knock out the pairs of candidates too in 'knockout' simulation (Default: False)
+    :param knockout_top: Number of the best knockouts of 'knockout' simulation. Results are stored as 'knockout_<ID>[+<ID>]' (Default: 10)
+    :param knockout_processes: Number of processes the knockouts of 'knockout' simulation are distributed over (Default: 1)
+    :param knockout_max: Maximal number of knockouts of 'knockout' simulation (Default: 10000)
+    :param engine: The LP engine, 'cobra' or 'scipy' (see SparseLP), only for the simulations of SCIPY_ENGINE_SIMS, the others falling back to 'cobra' (Default: cobra)
+    :param cobra_from_file: Build cobra models through a temporary SBML file (Default: False)
+    :param host: The host model the model has been merged from. If given (and cobra_from_file is not set), its cached cobra model is completed with the pathway instead of converting the whole model (Default: None)
+    :param write_results: Write the results into the annotations of model, see write_results_to_merged_model (Default: True)
     :param logger: The logger object
 
     :type model_file: str
@@ -203,6 +611,21 @@ def runFBA(
     :type sim_type: str
     :type fraction_coeff: float
     :type hidden_species: List[str]
+    :type cobra_from_file: bool
+    :type host: HostModel
+    :type fraction_sweep: List[float]
+    :type pareto_tolerance: float
+    :type pareto_max_points: int
+    :type fva_processes: int
+    :type objectives: List[Tuple[str, float, str]]
+    :type knockout_type: str
+    :type knockout_candidates: List[str]
+    :type double_knockouts: bool
+    :type knockout_top: int
+    :type knockout_processes: int
+    :type knockout_max: int
+    :type engine: str
+    :type write_results: bool
     :type logger: Logger
 
     :return: The results of the simulation
@@ -215,6 +638,13 @@ def runFBA(
     logger.debug("       biomass_rxn_id: " + str(biomass_rxn_id))
     logger.debug("       fraction_coeff: " + str(fraction_coeff))
     logger.debug("       compartment_id: " + str(compartment_id))
+    logger.debug("               engine: " + str(engine))
+
+    if engine == "scipy" and sim_type.lower() not in SCIPY_ENGINE_SIMS:
+        logger.warning(
+            f"'{sim_type}' simulation is not supported by the 'scipy' engine, running cobra"
+        )
+        engine = "cobra"
 
     # # NOTE: reactions is organised with key being the rpsbml reaction and value being the rpsbml_gem value`
     # # BUG: when merging the rxn_sink (very rare cases) can be recognised if another reaction contains the same species as a reactant
@@ -243,40 +673,115 @@ def runFBA(
             rpsbml=model,
             objective_id=objective_id,
             fraction_coeff=fraction_coeff,
+            cobra_from_file=cobra_from_file,
+            host=host,
+            engine=engine,
+            logger=logger,
+        )
+        results[sim_type] = cobra_results
+    elif sim_type.lower() == "multi_fba":
+        objective_id = find_or_create_weighted_objective(model, objectives)
+        results[sim_type] = runCobra(
+            sim_type=sim_type,
+            rpsbml=model,
+            objective_id=objective_id,
+            cobra_from_file=cobra_from_file,
+            host=host,
+            engine=engine,
+            logger=logger,
+        )
+    elif sim_type.lower() in ["fva", "fraction_fva"]:
+        fva_results, objective_id = rp_fva(
+            rpsbml=model,
+            objective_rxn_id=objective_rxn_id,
+            biomass_rxn_id=biomass_rxn_id,
+            fraction_coeff=(
+                fraction_coeff if sim_type.lower() == "fraction_fva" else None
+            ),
+            processes=fva_processes,
+            cobra_from_file=cobra_from_file,
+            host=host,
+            logger=logger,
+        )
+        results.update(fva_results)
+    elif sim_type.lower() == "knockout":
+        knockout_results, objective_id = rp_knockout(
+            rpsbml=model,
+            objective_rxn_id=objective_rxn_id,
+            biomass_rxn_id=biomass_rxn_id,
+            fraction_coeff=fraction_coeff,
+            knockout_type=knockout_type,
+            candidates=knockout_candidates,
+            double=double_knockouts,
+            top=knockout_top,
+            processes=knockout_processes,
+            max_knockouts=knockout_max,
+            cobra_from_file=cobra_from_file,
+            host=host,
+            logger=logger,
+        )
+        results.update(knockout_results)
+    elif sim_type.lower() == "pareto":
+        pareto_results, results_biomass, objective_id = rp_pareto(
+            rpsbml=model,
+            objective_rxn_id=objective_rxn_id,
+            biomass_rxn_id=biomass_rxn_id,
+            tolerance=pareto_tolerance,
+            max_points=pareto_max_points,
+            cobra_from_file=cobra_from_file,
+            host=host,
+            logger=logger,
+        )
+
+        results["biomass"] = results_biomass
+        for coeff, cobra_results in pareto_results.items():
+            results[pareto_sim_type(coeff)] = cobra_results
+    elif fraction_sweep:
+        sweep_results, results_biomass, objective_id = rp_fraction_sweep(
+            rpsbml=model,
+            objective_rxn_id=objective_rxn_id,
+            biomass_rxn_id=biomass_rxn_id,
+            fraction_coeffs=fraction_sweep,
+            cobra_from_file=cobra_from_file,
+            host=host,
+            engine=engine,
             logger=logger,
         )
+
+        results["biomass"] = results_biomass
+        for coeff, cobra_results in sweep_results.items():
+            results[fraction_sim_type(coeff)] = cobra_results
     else:
         cobra_results, results_biomass, objective_id = rp_fraction(
             rpsbml=model,
             objective_rxn_id=objective_rxn_id,
             biomass_rxn_id=biomass_rxn_id,
             fraction_coeff=fraction_coeff,
+            cobra_from_file=cobra_from_file,
+            host=host,
+            engine=engine,
             logger=logger,
         )
 
         results["biomass"] = results_biomass
-
-    results[sim_type] = cobra_results
+        results[sim_type] = cobra_results
 
     # Write results for merged model
-    write_results_to_rpsbml(
-        rpsbml=model,
-        objective_id=objective_id,
-        cobra_results=cobra_results,
-        sim_type=sim_type,
-        logger=logger,
-    )
+    if write_results:
+        write_results_to_merged_model(
+            rpsbml=model,
+            results=results,
+            objective_rxn_id=objective_rxn_id,
+            biomass_rxn_id=biomass_rxn_id,
+            objectives=objectives,
+            logger=logger,
+        )
 
     return results
 
     # if cobra_results is None:
     #     return None
 
-    # '''
-    # ###### multi objective #####
-    # elif sim_type=='multi_fba':
-    #     rpfba.runMultiObjective(reactions, coefficients, is_max, pathway_id)
-    # '''
     # if not merge:
     #     complete_heterologous_pathway(
     #         rpsbml = rpsbml,
@@ -331,27 +836,42 @@ def build_results(
         "ignored_species": hidden_species,
     }
 
+    # Pathway IDs -> cobra IDs, computed once for all the simulations
+    spe_ids = pathway.get_species_ids()
+    spe_index = pd.Index(
+        [to_cobra(cobraize(spe_id, compartment_id)) for spe_id in spe_ids]
+    )
+    rxn_ids = pathway.get_reactions_ids()
+    rxn_index = pd.Index(rxn_ids)
+
     # SPECIES
-    for spe_id in pathway.get_species_ids():
+    for spe_id in spe_ids:
         _results["species"][spe_id] = {}
-        for sim_type, cobra_r in results.items():
-            value = cobra_r.shadow_prices.get(
-                to_cobra(cobraize(spe_id, compartment_id))
-            )
+    for sim_type, cobra_r in results.items():
+        shadow_prices = cobra_r.shadow_prices
+        # e.g. flux ranges of FVA
+        if shadow_prices is None:
+            continue
+        values = shadow_prices.reindex(spe_index).to_numpy()
+        # Species missing from the cobra model have no shadow price
+        found = spe_index.isin(shadow_prices.index)
+        for spe_id, value, is_found in zip(spe_ids, values, found):
             _results["species"][spe_id][sim_type + "_shadow_price"] = {
-                "value": value,
+                "value": value if is_found else None,
                 # 'units': 'milimole / gDW / hour',
             }
     # REACTIONS
-    for rxn_id in pathway.get_reactions_ids():
+    for rxn_id in rxn_ids:
         _results["reactions"][rxn_id] = {}
-        for sim_type, cobra_r in results.items():
+    for sim_type, cobra_r in results.items():
+        units = "gDW / gDW / hour" if sim_type == "biomass" else "milimole / gDW / hour"
+        # Raises KeyError if a reaction is missing from the cobra model
+        values = cobra_r.fluxes.loc[rxn_index].to_numpy()
+        for rxn_id, value in zip(rxn_ids, values):
             _results["reactions"][rxn_id][sim_type] = {
-                "value": cobra_r.fluxes[rxn_id],
-                "units": "milimole / gDW / hour",
+                "value": value,
+                "units": units,
             }
-            if sim_type == "biomass":
-                _results["reactions"][rxn_id][sim_type]["units"] = "gDW / gDW / hour"
     # PATHWAY
     _results["pathway"] = {}
     for sim_type, cobra_r in results.items():
@@ -587,6 +1107,9 @@ def rp_fraction(
     objective_rxn_id: str,
     biomass_rxn_id: str,
     fraction_coeff: float = DEFAULT_RPFBA_ARGS["fraction_coeff"],
+    cobra_from_file: bool = DEFAULT_RPFBA_ARGS["cobra_from_file"],
+    host: "HostModel" = None,
+    engine: str = DEFAULT_RPFBA_ARGS["engine"],
     logger: Logger = getLogger(__name__),
 ) -> cobra_solution:
     """Optimise for a target reaction while fixing a source reaction to the fraction of its optimum
@@ -599,6 +1122,8 @@ def rp_fraction(
     :param is_max: Maximise or minimise the objective (Default: True)
     :param pathway_id: The id of the heterologous pathway (Default: rp_pathway)
     :param objective_id: Overwrite the default id (Default: None)
+    :param host: The host model rpsbml has been merged from (Default: None)
+    :param engine: The LP engine, 'cobra' or 'scipy' (Default: cobra)
 
     :type source_reaction: str
     :type source_coefficient: float
@@ -608,125 +1133,790 @@ def rp_fraction(
     :type is_max: bool
     :type pathway_id: str
     :type objective_id: str
+    :type host: HostModel
+    :type engine: str
 
     :return: Tuple with the results of the FBA and boolean indicating the success or failure of the function
     :rtype: tuple
     """
 
-    logger.debug("rpsbml:       " + str(rpsbml))
-    logger.debug("objective_rxn_id:   " + objective_rxn_id)
-    logger.debug("biomass_rxn_id: " + str(biomass_rxn_id))
-    logger.debug("fraction_coeff:  " + str(fraction_coeff))
+    sweep_results, results_biomass, objective_id = rp_fraction_sweep(
+        rpsbml=rpsbml,
+        objective_rxn_id=objective_rxn_id,
+        biomass_rxn_id=biomass_rxn_id,
+        fraction_coeffs=[fraction_coeff],
+        cobra_from_file=cobra_from_file,
+        host=host,
+        engine=engine,
+        logger=logger,
+    )
+    return sweep_results.get(fraction_coeff), results_biomass, objective_id
 
-    def get_annot_objective(rpsbml: rpSBML, objective_id: str) -> str:
-        fbc_plugin = rpsbml.getPlugin("fbc")
-        objective = fbc_plugin.getObjective(objective_id)
-        rpsbml.checklibSBML(objective, "Getting objective " + str(objective_id))
 
-        fbc_obj_annot = objective.getAnnotation()
-        # TODO: if this is None need to set it up
-        if fbc_obj_annot is None:
-            return None
+def rp_fraction_sweep(
+    rpsbml: rpSBML,
+    objective_rxn_id: str,
+    biomass_rxn_id: str,
+    fraction_coeffs: List[float],
+    cobra_from_file: bool = DEFAULT_RPFBA_ARGS["cobra_from_file"],
+    host: "HostModel" = None,
+    engine: str = DEFAULT_RPFBA_ARGS["engine"],
+    logger: Logger = getLogger(__name__),
+) -> Tuple[Dict[float, cobra_solution], cobra_solution, str]:
+    """Optimise for a target reaction while fixing a source reaction to
+    several fractions of its optimum. The optimum of the source reaction is
+    computed once, then the target is optimised for each fraction on the same
+    cobra model (and solver).
+
+    :param rpsbml: The model to analyse
+    :param objective_rxn_id: The id of the target reaction
+    :param biomass_rxn_id: The id of the source reaction
+    :param fraction_coeffs: Fractions of the source reaction optimum
+    :param cobra_from_file: Build the cobra model through a temporary SBML file (Default: False)
+    :param host: The host model rpsbml has been merged from (Default: None)
+    :param engine: The LP engine, 'cobra' or 'scipy' (Default: cobra)
+    :param logger: A logger (Optional)
 
-        logger.debug("Already calculated flux for " + str(objective_id))
+    :type rpsbml: rpSBML
+    :type objective_rxn_id: str
+    :type biomass_rxn_id: str
+    :type fraction_coeffs: List[float]
+    :type cobra_from_file: bool
+    :type host: HostModel
+    :type engine: str
+    :type logger: Logger
+
+    :return: Results of the target optimisation by fraction coefficient, results of the source optimisation and the target objective ID
+    :rtype: Tuple[Dict[float, cobra.Solution], cobra.Solution, str]
+    """
 
-        return fbc_obj_annot
+    logger.debug("rpsbml:       " + str(rpsbml))
+    logger.debug("objective_rxn_id:   " + objective_rxn_id)
+    logger.debug("biomass_rxn_id: " + str(biomass_rxn_id))
+    logger.debug("fraction_coeffs:  " + str(fraction_coeffs))
 
     # retreive the biomass objective and flux results and set as maxima
     biomass_objective_id = rpsbml.find_or_create_objective(
         rxn_id=biomass_rxn_id, obj_id=f"brs_obj_{biomass_rxn_id}"
     )
+    objective_id = rpsbml.find_or_create_objective(
+        rxn_id=objective_rxn_id,
+        obj_id=f"brs_obj_{objective_rxn_id}",
+    )
+    logger.debug(f"objective_id: {objective_id}")
 
-    # fbc_plugin = rpsbml.getPlugin('fbc')
-    # TODO: use the rpSBML BRSynth annotation parser
-    # try:
-    fbc_obj_annot = get_annot_objective(rpsbml, biomass_objective_id)
-
-    # except (AttributeError, ValueError) as e:
-    if fbc_obj_annot is None:
-        # logger.debug(e)
-        logger.debug("Performing FBA to calculate the source reaction")
-
-        ### FBA ###
-        # logger.info('Running the FBA (fraction of reaction)...')
-        # rpsbml.runFBA(source_reaction, source_coefficient, is_max, pathway_id)
-        logger.info("Processing FBA (biomass)...")
-        cobra_results = runCobra(
-            sim_type="biomass",
+    if engine == "scipy":
+        lp = build_sparse_lp(
             rpsbml=rpsbml,
             objective_id=biomass_objective_id,
+            host=host,
             logger=logger,
         )
+        if lp is None:
+            return {}, None, biomass_objective_id
+        logger.info("Processing FBA (biomass)...")
+        results_biomass = optimize_lp(lp, logger)
+        flux = float(results_biomass.objective_value)
+        biomass_rxn_id = F_REPLACE[F_REACTION](biomass_rxn_id)
+        lp.set_objective({F_REPLACE[F_REACTION](objective_rxn_id): 1})
+        sweep_results = {}
+        for fraction_coeff in fraction_coeffs:
+            # The LP is dropped afterwards
+            lp.set_bounds(biomass_rxn_id, flux * fraction_coeff, flux * fraction_coeff)
+            logger.info(f"Processing FBA (fraction {fraction_coeff})...")
+            sweep_results[fraction_coeff] = optimize_lp(lp, logger)
+        return sweep_results, results_biomass, objective_id
+
+    # Both optimisations are performed on the same cobra model,
+    # so that the solver re-starts from the biomass solution
+    with cobra_model_context(
+        rpsbml=rpsbml,
+        objective_id=biomass_objective_id,
+        cobra_from_file=cobra_from_file,
+        host=host,
+        logger=logger,
+    ) as cobraModel:
+        if not cobraModel:
+            return {}, None, biomass_objective_id
 
-        # rxn>scores>fba>biomass = cobra_results.fluxes('rxn_X')
-        # scores>fba>biomass = cobra_results.objective_value
-        if cobra_results is None:
-            return None, None, biomass_objective_id
-
-        results_biomass = cobra_results
+        results_biomass, flux = _optimize_biomass(cobraModel, host, logger)
 
-        write_results_to_rpsbml(
-            rpsbml=rpsbml,
-            objective_id=biomass_objective_id,
-            sim_type="biomass",
-            cobra_results=cobra_results,
-            logger=logger,
+        biomass_rxn = cobraModel.reactions.get_by_id(
+            F_REPLACE[F_REACTION](biomass_rxn_id)
         )
+        cobraModel.objective = F_REPLACE[F_REACTION](objective_rxn_id)
+        cobraModel.objective_direction = "max"
+
+        sweep_results = {}
+        for fraction_coeff in fraction_coeffs:
+            logger.debug(f"Optimising the objective: {biomass_rxn_id}")
+            logger.debug(f"     Setting upper bound: {flux*fraction_coeff}")
+            logger.debug(f"     Setting lower bound: {flux*fraction_coeff}")
+
+            # Bounds are restored on exit of the cobra model context
+            # (or the model is dropped)
+            biomass_rxn.bounds = (flux * fraction_coeff, flux * fraction_coeff)
+
+            logger.info(f"Processing FBA (fraction {fraction_coeff})...")
+            cobra_results = optimize(
+                cobraModel=cobraModel,
+                sim_type="fraction",
+                fraction_coeff=fraction_coeff,
+                logger=logger,
+            )
 
-        fbc_obj_annot = get_annot_objective(rpsbml, biomass_objective_id)
-        if fbc_obj_annot is None:
-            logger.error("No annotation available for: " + str(biomass_objective_id))
+            ##### print the biomass results ######
+            logger.debug(
+                "Biomass: " + str(cobra_results.fluxes.get(biomass_objective_id))
+            )
+            logger.debug(" Target: " + str(cobra_results.fluxes.get(objective_id)))
+            logger.debug(
+                "The objective "
+                + str(objective_id)
+                + " results "
+                + str(cobra_results.objective_value)
+            )
 
-    flux = float(
-        fbc_obj_annot.getChild("RDF")
-        .getChild("BRSynth")
-        .getChild("brsynth")
-        .getChild(0)
-        .getAttrValue("value")
-    )
+            sweep_results[fraction_coeff] = cobra_results
+
+    return sweep_results, results_biomass, objective_id
+
+
+def rp_fva(
+    rpsbml: rpSBML,
+    objective_rxn_id: str,
+    biomass_rxn_id: str,
+    fraction_coeff: float = None,
+    processes: int = DEFAULT_RPFBA_ARGS["fva_processes"],
+    cobra_from_file: bool = DEFAULT_RPFBA_ARGS["cobra_from_file"],
+    host: "HostModel" = None,
+    pathway_id: str = "rp_pathway",
+    logger: Logger = getLogger(__name__),
+) -> Tuple[Dict[str, cobra_solution], str]:
+    """Flux Variability Analysis of the reactions of the pathway.
+
+    If fraction_coeff is None ('fva' simulation), the target is optimised
+    ('fba' results) and flux ranges are those of its optimal solutions.
+    Otherwise ('fraction_fva' simulation), the source reaction is fixed to
+    fraction_coeff of its optimum and the target optimised, as in
+    rp_fraction ('biomass' and 'fraction' results), and flux ranges are
+    those of all the flux distributions at this source flux.
+
+    Ranges are returned as 'fva_min' and 'fva_max' results, with the fluxes
+    of the pathway reactions only (and no shadow prices), the objective
+    value being the range of the target. The minimisation and maximisation
+    LPs are run over processes processes by the pool of cobra's
+    flux_variability_analysis, which is started for each call, its workers
+    receiving a copy of the merged cobra model.
+
+    :param rpsbml: The model to analyse
+    :param objective_rxn_id: The id of the target reaction
+    :param biomass_rxn_id: The id of the source reaction
+    :param fraction_coeff: The fraction of the source reaction optimum (Default: None)
+    :param processes: The number of processes (Default: 1)
+    :param cobra_from_file: Build the cobra model through a temporary SBML file (Default: False)
+    :param host: The host model rpsbml has been merged from (Default: None)
+    :param pathway_id: The id of the heterologous pathway group (Default: rp_pathway)
+    :param logger: A logger (Optional)
+
+    :type rpsbml: rpSBML
+    :type objective_rxn_id: str
+    :type biomass_rxn_id: str
+    :type fraction_coeff: float
+    :type processes: int
+    :type cobra_from_file: bool
+    :type host: HostModel
+    :type pathway_id: str
+    :type logger: Logger
 
+    :return: Results by simulation type and the target objective ID
+    :rtype: Tuple[Dict[str, cobra.Solution], str]
+    """
+    biomass_objective_id = rpsbml.find_or_create_objective(
+        rxn_id=biomass_rxn_id, obj_id=f"brs_obj_{biomass_rxn_id}"
+    )
     objective_id = rpsbml.find_or_create_objective(
         rxn_id=objective_rxn_id,
         obj_id=f"brs_obj_{objective_rxn_id}",
     )
-    logger.debug(f"objective_id: {objective_id}")
+    target_id = F_REPLACE[F_REACTION](objective_rxn_id)
+    rxn_ids = [
+        F_REPLACE[F_REACTION](member.getIdRef())
+        for member in rpsbml.getGroup(pathway_id).getListOfMembers()
+    ]
+
+    results = {}
+    with cobra_model_context(
+        rpsbml=rpsbml,
+        objective_id=objective_id if fraction_coeff is None else biomass_objective_id,
+        cobra_from_file=cobra_from_file,
+        host=host,
+        logger=logger,
+    ) as cobraModel:
+        if not cobraModel:
+            return results, objective_id
+
+        if fraction_coeff is None:
+            logger.info("Processing FBA...")
+            results["fba"] = optimize(
+                cobraModel=cobraModel, sim_type="fba", logger=logger
+            )
+            fraction_of_optimum = 1.0
+        else:
+            results["biomass"], flux = _optimize_biomass(cobraModel, host, logger)
+            # Bounds are restored on exit of the cobra model context
+            # (or the model is dropped)
+            cobraModel.reactions.get_by_id(
+                F_REPLACE[F_REACTION](biomass_rxn_id)
+            ).bounds = (flux * fraction_coeff, flux * fraction_coeff)
+            cobraModel.objective = target_id
+            cobraModel.objective_direction = "max"
+            logger.info(f"Processing FBA (fraction {fraction_coeff})...")
+            results["fraction"] = optimize(
+                cobraModel=cobraModel,
+                sim_type="fraction",
+                fraction_coeff=fraction_coeff,
+                logger=logger,
+            )
+            fraction_of_optimum = 0.0
+
+        logger.info(f"Processing FVA of {len(rxn_ids)} reaction(s)...")
+        with profile_stage("fva"):
+            fva = flux_variability_analysis(
+                cobraModel,
+                reaction_list=[
+                    rxn_id for rxn_id in rxn_ids if rxn_id in cobraModel.reactions
+                ],
+                fraction_of_optimum=fraction_of_optimum,
+                processes=processes,
+            )
+    logger.debug(fva)
+
+    for sim_type, column in (("fva_min", "minimum"), ("fva_max", "maximum")):
+        objective_value = fva[column].get(target_id)
+        results[sim_type] = cobra_solution(
+            objective_value=None if objective_value is None else float(objective_value),
+            status="optimal",
+            fluxes=fva[column],
+        )
+    return results, objective_id
+
+
+def rp_knockout(
+    rpsbml: rpSBML,
+    objective_rxn_id: str,
+    biomass_rxn_id: str,
+    fraction_coeff: float = DEFAULT_RPFBA_ARGS["fraction_coeff"],
+    knockout_type: str = DEFAULT_RPFBA_ARGS["knockout_type"],
+    candidates: List[str] = DEFAULT_RPFBA_ARGS["knockout_candidates"],
+    double: bool = DEFAULT_RPFBA_ARGS["double_knockouts"],
+    top: int = DEFAULT_RPFBA_ARGS["knockout_top"],
+    processes: int = DEFAULT_RPFBA_ARGS["knockout_processes"],
+    max_knockouts: int = DEFAULT_RPFBA_ARGS["knockout_max"],
+    cobra_from_file: bool = DEFAULT_RPFBA_ARGS["cobra_from_file"],
+    host: "HostModel" = None,
+    pathway_id: str = "rp_pathway",
+    logger: Logger = getLogger(__name__),
+) -> Tuple[Dict[str, cobra_solution], str]:
+    """Screen the knockouts of host reactions (or genes) for the ones which
+    raise the production of the target in 'fraction' simulation.
+
+    The source reaction is fixed to fraction_coeff of its optimum and the
+    target optimised, as in rp_fraction ('biomass' and 'fraction'
+    results), first on the merged model, then with each knockout: each
+    candidate, and each pair of candidates if double is set (generated as
+    they are screened). Knockouts are applied to the same cobra model
+    (bounds set to 0 within a cobra context, which reverts them), their
+    source optimum being computed again. They are distributed over
+    processes processes, which load the host from its snapshot (see
+    HostModel.get_snapshot) and apply the pathway changes to it (see
+    HostModel.pathway_delta), or else receive a copy of the cobra model.
+    Lethal knockouts (source optimum below KNOCKOUT_TOLERANCE) are left out.
+
+    The top knockouts raising the target flux the most are returned as
+    'knockout_<ID>[+<ID>]' results (see knockout_sim_type), sorted by
+    decreasing target flux.
+
+    :param rpsbml: The model to analyse
+    :param objective_rxn_id: The id of the target reaction
+    :param biomass_rxn_id: The id of the source reaction
+    :param fraction_coeff: The fraction of the source reaction optimum (Default: 0.75)
+    :param knockout_type: Knock out 'reaction's or 'gene's (Default: reaction)
+    :param candidates: The IDs of the reactions (or genes) to knock out (Default: None, see knockout_candidates)
+    :param double: Knock out the pairs of candidates too (Default: False)
+    :param top: The number of knockouts returned (Default: 10)
+    :param processes: The number of processes (Default: 1)
+    :param max_knockouts: The maximal number of knockouts (Default: 10000)
+    :param cobra_from_file: Build the cobra model through a temporary SBML file (Default: False)
+    :param host: The host model rpsbml has been merged from (Default: None)
+    :param pathway_id: The id of the heterologous pathway group (Default: rp_pathway)
+    :param logger: A logger (Optional)
 
-    logger.debug(f"Optimising the objective: {biomass_rxn_id}")
-    logger.debug(f"     Setting upper bound: {flux*fraction_coeff}")
-    logger.debug(f"     Setting lower bound: {flux*fraction_coeff}")
+    :type rpsbml: rpSBML
+    :type objective_rxn_id: str
+    :type biomass_rxn_id: str
+    :type fraction_coeff: float
+    :type knockout_type: str
+    :type candidates: List[str]
+    :type double: bool
+    :type top: int
+    :type processes: int
+    :type max_knockouts: int
+    :type cobra_from_file: bool
+    :type host: HostModel
+    :type pathway_id: str
+    :type logger: Logger
 
-    old_upper_bound, old_lower_bound = rpsbml.getReactionConstraints(biomass_rxn_id)
-    rpsbml.setReactionConstraints(
-        biomass_rxn_id, flux * fraction_coeff, flux * fraction_coeff
+    :raises ValueError: If there are more than max_knockouts knockouts
+
+    :return: Results by simulation type and the target objective ID
+    :rtype: Tuple[Dict[str, cobra.Solution], str]
+    """
+    biomass_objective_id = rpsbml.find_or_create_objective(
+        rxn_id=biomass_rxn_id, obj_id=f"brs_obj_{biomass_rxn_id}"
     )
+    objective_id = rpsbml.find_or_create_objective(
+        rxn_id=objective_rxn_id,
+        obj_id=f"brs_obj_{objective_rxn_id}",
+    )
+    biomass_rxn_id = F_REPLACE[F_REACTION](biomass_rxn_id)
+    target_id = F_REPLACE[F_REACTION](objective_rxn_id)
+    pathway_rxn_ids = [
+        F_REPLACE[F_REACTION](member.getIdRef())
+        for member in rpsbml.getGroup(pathway_id).getListOfMembers()
+    ]
+    # The workers load the host from its snapshot, written from the host
+    # alone, before the pathway is merged
+    worker_host = None if cobra_from_file else host
+    if processes > 1 and worker_host is not None:
+        worker_host.get_snapshot()
 
-    logger.info("Processing FBA (fraction)...")
-    sim_type = "fraction"
-    cobra_results = runCobra(
-        sim_type=sim_type,
+    results = {}
+    with cobra_model_context(
         rpsbml=rpsbml,
-        objective_id=objective_id,
-        fraction_coeff=fraction_coeff,
+        objective_id=biomass_objective_id,
+        cobra_from_file=cobra_from_file,
+        host=host,
         logger=logger,
+    ) as cobraModel:
+        if not cobraModel:
+            return results, objective_id
+
+        results["biomass"], flux = _optimize_biomass(cobraModel, host, logger)
+        with cobraModel:
+            cobraModel.reactions.get_by_id(biomass_rxn_id).bounds = (
+                flux * fraction_coeff,
+                flux * fraction_coeff,
+            )
+            cobraModel.objective = target_id
+            cobraModel.objective_direction = "max"
+            logger.info(f"Processing FBA (fraction {fraction_coeff})...")
+            results["fraction"] = optimize(
+                cobraModel=cobraModel,
+                sim_type="fraction",
+                fraction_coeff=fraction_coeff,
+                logger=logger,
+            )
+
+        ids = knockout_candidates(
+            cobraModel=cobraModel,
+            knockout_type=knockout_type,
+            candidates=candidates,
+            excluded=pathway_rxn_ids + [biomass_rxn_id, target_id],
+            logger=logger,
+        )
+        nb_knockouts = len(ids) + (len(ids) * (len(ids) - 1) // 2 if double else 0)
+        if nb_knockouts > max_knockouts:
+            raise ValueError(
+                f"{nb_knockouts} {knockout_type} knockouts exceed the maximum "
+                + f"({max_knockouts}), narrow the candidates down"
+            )
+        logger.info(
+            f"Processing {nb_knockouts} {knockout_type} knockout(s) "
+            + f"over {processes} process(es)..."
+        )
+        with profile_stage("knockout"):
+            screened = _screen_knockouts(
+                cobraModel=cobraModel,
+                knockouts=iter_knockouts(ids, double),
+                nb_knockouts=nb_knockouts,
+                processes=processes,
+                host=worker_host,
+                knockout_type=knockout_type,
+                biomass_rxn_id=biomass_rxn_id,
+                target_id=target_id,
+                fraction_coeff=fraction_coeff,
+            )
+            # Knockouts raising the target flux, the top ones by decreasing flux
+            wild_type = float(results["fraction"].objective_value)
+            raising = [
+                (target_flux, knockout)
+                for knockout, (growth, target_flux) in zip(
+                    iter_knockouts(ids, double), screened
+                )
+                if growth >= KNOCKOUT_TOLERANCE
+                and target_flux > wild_type + KNOCKOUT_TOLERANCE
+            ]
+        logger.info(
+            f"{len(raising)} knockout(s) raise the target flux above {wild_type:g}"
+        )
+        # The solutions of the top knockouts are computed again, in full
+        for _, knockout in nlargest(top, raising, key=lambda item: item[0]):
+            with cobraModel:
+                _knock_out(cobraModel, knockout, knockout_type)
+                flux = cobraModel.slim_optimize()
+                cobraModel.reactions.get_by_id(biomass_rxn_id).bounds = (
+                    flux * fraction_coeff,
+                    flux * fraction_coeff,
+                )
+                cobraModel.objective = target_id
+                cobraModel.objective_direction = "max"
+                results[knockout_sim_type(knockout)] = optimize(
+                    cobraModel=cobraModel,
+                    sim_type="fraction",
+                    fraction_coeff=fraction_coeff,
+                    logger=logger,
+                )
+
+    return results, objective_id
+
+
+def knockout_sim_type(knockout: Tuple[str, ...]) -> str:
+    """Name of the results of the 'knockout' simulation for the knocked
+    out reactions (or genes) knockout, e.g. knockout_PGI+PFK
+    """
+    return "knockout_" + "+".join(knockout)
+
+
+def knockout_candidates(
+    cobraModel: cobra_model,
+    knockout_type: str = DEFAULT_RPFBA_ARGS["knockout_type"],
+    candidates: List[str] = None,
+    excluded: List[str] = None,
+    logger: Logger = getLogger(__name__),
+) -> List[str]:
+    """Return the cobra IDs of the reactions (or genes) of cobraModel to
+    knock out: candidates, as IDs (SBML or cobra) or files listing them
+    (one per line), or by default all the reactions but the boundary ones
+    (or all the genes). Reactions of excluded (or their genes), and
+    candidates missing from cobraModel, are left out.
+
+    :param cobraModel: The cobra model
+    :param knockout_type: Knock out 'reaction's or 'gene's (Default: reaction)
+    :param candidates: The IDs, or files listing them (Default: None)
+    :param excluded: The IDs of the reactions never knocked out, nor their genes (Default: None)
+    :param logger: A logger (Optional)
+
+    :type cobraModel: cobra.Model
+    :type knockout_type: str
+    :type candidates: List[str]
+    :type excluded: List[str]
+    :type logger: Logger
+
+    :return: The IDs to knock out
+    :rtype: List[str]
+    """
+    if knockout_type == "gene":
+        entities, f_replace = cobraModel.genes, F_REPLACE[F_GENE]
+    else:
+        entities, f_replace = cobraModel.reactions, F_REPLACE[F_REACTION]
+    if candidates is None:
+        ids = [
+            entity.id
+            for entity in entities
+            if knockout_type == "gene" or not entity.boundary
+        ]
+    else:
+        ids = [
+            _id if _id in entities else f_replace(_id)
+            for _id in read_candidates(candidates)
+        ]
+        missing = [_id for _id in ids if _id not in entities]
+        if missing:
+            logger.warning(
+                f"{len(missing)} {knockout_type}(s) to knock out not found: "
+                + ", ".join(missing)
+            )
+    excluded = set(excluded or [])
+    if knockout_type == "gene":
+        excluded = {
+            gene.id
+            for rxn_id in excluded
+            if rxn_id in cobraModel.reactions
+            for gene in cobraModel.reactions.get_by_id(rxn_id).genes
+        }
+    # Unique, in the order of the candidates
+    return list(
+        dict.fromkeys(_id for _id in ids if _id in entities and _id not in excluded)
     )
-    if cobra_results is None:
-        return results_biomass, None, objective_id
 
-    ##### print the biomass results ######
-    logger.debug("Biomass: " + str(cobra_results.fluxes.get(biomass_objective_id)))
-    logger.debug(" Target: " + str(cobra_results.fluxes.get(objective_id)))
 
-    # reset the bounds to the original values for the target
-    rpsbml.setReactionConstraints(biomass_rxn_id, old_upper_bound, old_lower_bound)
+def iter_knockouts(ids: List[str], double: bool = False) -> Iterator[Tuple[str, ...]]:
+    """Yield the knockouts of ids: each of them and, if double is set, each
+    pair of them, as tuples of IDs.
+    """
+    singles = ((_id,) for _id in ids)
+    return chain(singles, combinations(ids, 2)) if double else singles
+
+
+def read_candidates(candidates: List[str]) -> List[str]:
+    """Return the IDs of candidates, the files among them (one ID per line)
+    being read.
+    """
+    ids = []
+    for candidate in candidates:
+        if os_path.isfile(candidate):
+            with open(candidate) as f:
+                ids += [line.strip() for line in f if line.strip()]
+        else:
+            ids.append(candidate)
+    return ids
+
+
+def knockout_fraction(
+    cobraModel: cobra_model,
+    knockout: Tuple[str, ...],
+    knockout_type: str,
+    biomass_rxn_id: str,
+    target_id: str,
+    fraction_coeff: float,
+) -> Tuple[float, float]:
+    """Return the source optimum of cobraModel (whose objective is the
+    source reaction) with the reactions (or genes) of knockout knocked out,
+    and the target flux with the source reaction fixed to fraction_coeff of
+    this optimum, (nan, nan) if infeasible. cobraModel is left unchanged.
+
+    :rtype: Tuple[float, float]
+    """
+    with cobraModel:
+        _knock_out(cobraModel, knockout, knockout_type)
+        flux = cobraModel.slim_optimize()
+        if isnan(flux):
+            return flux, flux
+        cobraModel.reactions.get_by_id(biomass_rxn_id).bounds = (
+            flux * fraction_coeff,
+            flux * fraction_coeff,
+        )
+        cobraModel.objective = target_id
+        cobraModel.objective_direction = "max"
+        return flux, cobraModel.slim_optimize()
+
+
+def _knock_out(
+    cobraModel: cobra_model, knockout: Tuple[str, ...], knockout_type: str
+) -> None:
+    # Reverted on exit of the cobra model context
+    entities = cobraModel.genes if knockout_type == "gene" else cobraModel.reactions
+    for _id in knockout:
+        entities.get_by_id(_id).knock_out()
+
+
+def _screen_knockouts(
+    cobraModel: cobra_model,
+    knockouts: Iterable[Tuple[str, ...]],
+    nb_knockouts: int,
+    processes: int = 1,
+    host: "HostModel" = None,
+    **kwargs,
+) -> Iterator[Tuple[float, float]]:
+    # Source optima and target fluxes of the knockouts (see knockout_fraction)
+    if processes <= 1 or nb_knockouts <= 1:
+        for knockout in knockouts:
+            yield knockout_fraction(cobraModel, knockout, **kwargs)
+        return
+    if host is None:
+        model = cobraModel
+    else:
+        # The workers load the host and apply the pathway to it
+        model = (host.model_file, host.get_snapshot(), host.pathway_delta(cobraModel))
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_init_knockout_worker,
+        initargs=(model, kwargs),
+    ) as executor:
+        yield from executor.map(
+            _knockout_in_worker,
+            knockouts,
+            chunksize=max(1, nb_knockouts // (4 * processes)),
+        )
+
+
+# Worker-local state, set by _init_knockout_worker in each process of the pool
+_knockout_worker = {}
+
+
+def _init_knockout_worker(
+    model: Union[cobra_model, Tuple[str, str, Dict]], kwargs: Dict
+) -> None:
+    # Each worker knocks out the candidates on its own copy of the model:
+    # the one sent, or the host loaded from its snapshot with the pathway
+    # changes applied for the life of the worker
+    if isinstance(model, tuple):
+        from .host import HostModel
+
+        model_file, snapshot, delta = model
+        host = HostModel(model_file=model_file, snapshot=snapshot)
+        _knockout_worker["stack"] = ExitStack()
+        model = _knockout_worker["stack"].enter_context(host.delta_cobra_model(delta))
+    _knockout_worker["model"] = model
+    _knockout_worker["kwargs"] = kwargs
+
+
+def _knockout_in_worker(knockout: Tuple[str, ...]) -> Tuple[float, float]:
+    return knockout_fraction(
+        _knockout_worker["model"], knockout, **_knockout_worker["kwargs"]
+    )
+
+
+def rp_pareto(
+    rpsbml: rpSBML,
+    objective_rxn_id: str,
+    biomass_rxn_id: str,
+    tolerance: float = DEFAULT_RPFBA_ARGS["pareto_tolerance"],
+    max_points: int = DEFAULT_RPFBA_ARGS["pareto_max_points"],
+    cobra_from_file: bool = DEFAULT_RPFBA_ARGS["cobra_from_file"],
+    host: "HostModel" = None,
+    logger: Logger = getLogger(__name__),
+) -> Tuple[Dict[float, cobra_solution], cobra_solution, str]:
+    """Compute the Pareto frontier between the source (biomass) and the
+    target reactions, i.e. the maximal target flux for source fluxes from 0
+    to the source optimum.
+
+    The frontier is concave and piecewise linear. Starting from its two ends,
+    each segment is split at its middle as long as the target flux there
+    deviates from the segment by more than tolerance (relative to the maximal
+    target flux), so that points are only added where the frontier bends.
+    All optimisations are performed on the same cobra model (and solver).
+
+    :param rpsbml: The model to analyse
+    :param objective_rxn_id: The id of the target reaction
+    :param biomass_rxn_id: The id of the source reaction
+    :param tolerance: Relative deviation under which a segment is not split (Default: 0.01)
+    :param max_points: Maximal number of points of the frontier (Default: 20)
+    :param cobra_from_file: Build the cobra model through a temporary SBML file (Default: False)
+    :param host: The host model rpsbml has been merged from (Default: None)
+    :param logger: A logger (Optional)
+
+    :type rpsbml: rpSBML
+    :type objective_rxn_id: str
+    :type biomass_rxn_id: str
+    :type tolerance: float
+    :type max_points: int
+    :type cobra_from_file: bool
+    :type host: HostModel
+    :type logger: Logger
+
+    :return: Results of the target optimisation by fraction of the source optimum, results of the source optimisation and the target objective ID
+    :rtype: Tuple[Dict[float, cobra.Solution], cobra.Solution, str]
+    """
+
+    logger.debug("rpsbml:       " + str(rpsbml))
+    logger.debug("objective_rxn_id:   " + objective_rxn_id)
+    logger.debug("biomass_rxn_id: " + str(biomass_rxn_id))
+    logger.debug("tolerance:  " + str(tolerance))
+    logger.debug("max_points:  " + str(max_points))
+
+    biomass_objective_id = rpsbml.find_or_create_objective(
+        rxn_id=biomass_rxn_id, obj_id=f"brs_obj_{biomass_rxn_id}"
+    )
+    objective_id = rpsbml.find_or_create_objective(
+        rxn_id=objective_rxn_id,
+        obj_id=f"brs_obj_{objective_rxn_id}",
+    )
+
+    with cobra_model_context(
+        rpsbml=rpsbml,
+        objective_id=biomass_objective_id,
+        cobra_from_file=cobra_from_file,
+        host=host,
+        logger=logger,
+    ) as cobraModel:
+        if not cobraModel:
+            return {}, None, biomass_objective_id
+
+        results_biomass, flux = _optimize_biomass(cobraModel, host, logger)
+
+        biomass_rxn = cobraModel.reactions.get_by_id(
+            F_REPLACE[F_REACTION](biomass_rxn_id)
+        )
+        cobraModel.objective = F_REPLACE[F_REACTION](objective_rxn_id)
+        cobraModel.objective_direction = "max"
+
+        points = {}
+
+        def target_flux(fraction_coeff: float) -> float:
+            # Bounds are restored on exit of the cobra model context
+            # (or the model is dropped)
+            biomass_rxn.bounds = (flux * fraction_coeff, flux * fraction_coeff)
+            logger.debug(f"Processing FBA (pareto {fraction_coeff})...")
+            points[fraction_coeff] = optimize(
+                cobraModel=cobraModel,
+                sim_type="pareto",
+                logger=logger,
+            )
+            return points[fraction_coeff].objective_value
+
+        logger.info("Processing FBA (pareto)...")
+        # Segments to refine, as (start, end) fractions of the biomass optimum
+        segments = [(0.0, 1.0)]
+        target_flux(0.0)
+        target_flux(1.0)
+        while segments and len(points) < max_points:
+            start, end = segments.pop(0)
+            middle = (start + end) / 2
+            chord = (points[start].objective_value + points[end].objective_value) / 2
+            deviation = abs(target_flux(middle) - chord)
+            # Relative to the maximal target flux of the points computed so far
+            scale = max(max(abs(p.objective_value) for p in points.values()), 1e-9)
+            if deviation > tolerance * scale:
+                segments += [(start, middle), (middle, end)]
 
     logger.debug(
-        "The objective "
-        + str(objective_id)
-        + " results "
-        + str(cobra_results.objective_value)
+        "Pareto frontier: "
+        + str({k: points[k].objective_value for k in sorted(points)})
     )
 
-    return cobra_results, results_biomass, objective_id
+    return dict(sorted(points.items())), results_biomass, objective_id
+
+
+def pareto_sim_type(fraction_coeff: float) -> str:
+    """Name of the results of the 'pareto' simulation for the point at
+    fraction_coeff of the biomass optimum, e.g. pareto_0.5
+    """
+    return f"pareto_{fraction_coeff:g}"
+
+
+def _optimize_biomass(
+    cobraModel: cobra_model,
+    host: "HostModel" = None,
+    logger: Logger = getLogger(__name__),
+) -> Tuple[cobra_solution, float]:
+    """Optimise cobraModel, whose objective is the biomass. If cobraModel
+    has been completed from host and the pathway cannot change the host
+    optimum, the memoized optimum of host is returned instead.
+
+    :return: The results of the optimisation and the biomass flux
+    :rtype: Tuple[cobra.Solution, float]
+    """
+    logger.debug("Performing FBA to calculate the source reaction")
+    logger.info("Processing FBA (biomass)...")
+    if host is not None:
+        results_biomass = host.unchanged_optimum(cobraModel)
+        if results_biomass is not None:
+            return results_biomass, float(results_biomass.objective_value)
+    results_biomass = optimize(
+        cobraModel=cobraModel,
+        sim_type="biomass",
+        logger=logger,
+    )
+    return results_biomass, float(results_biomass.objective_value)
+
+
+def fraction_sim_type(fraction_coeff: float) -> str:
+    """Name of the results of the 'fraction' simulation for fraction_coeff
+    in a sweep, e.g. fraction_0.5
+    """
+    return f"fraction_{fraction_coeff:g}"
 
 
 def runCobra(
@@ -734,6 +1924,9 @@ def runCobra(
     rpsbml: rpSBML,
     objective_id: str,
     fraction_coeff: float = 0.95,
+    cobra_from_file: bool = DEFAULT_RPFBA_ARGS["cobra_from_file"],
+    host: "HostModel" = None,
+    engine: str = DEFAULT_RPFBA_ARGS["engine"],
     logger: Logger = getLogger(__name__),
 ) -> Tuple[cobra_solution, pd.DataFrame]:
     """Run Cobra to optimize model.
@@ -743,6 +1936,9 @@ def runCobra(
     :param objective_id: Overwrite the auto-generated id of the results (Default: None)
     :param hidden_species: List of species to mask (Optional).
     :param fraction_coeff: The fraction of the optimum. Used in pfba simulation (Default: 0.95).
+    :param cobra_from_file: Build the cobra model through a temporary SBML file (Default: False).
+    :param host: The host model rpsbml has been merged from. If given (and cobra_from_file is not set), its cached cobra model is completed with the pathway (Optional).
+    :param engine: The LP engine, 'cobra' or 'scipy' (not for pfba simulation) (Default: cobra).
     :param logger: A logger (Optional).
 
     :type sim_type: str
@@ -750,46 +1946,209 @@ def runCobra(
     :type objective_id: str
     :type hidden_species: List[str]
     :type fraction_coeff: float
+    :type cobra_from_file: bool
+    :type host: HostModel
+    :type engine: str
     :type logger: Logger
 
     :return: Results of the simulation.
     :rtype: cobra.Solution
     """
 
-    cobraModel = build_cobra_model(
+    if engine == "scipy" and sim_type.lower() != "pfba":
+        lp = build_sparse_lp(
+            rpsbml=rpsbml, objective_id=objective_id, host=host, logger=logger
+        )
+        if lp is None:
+            return None
+        return optimize_lp(lp, logger)
+
+    with cobra_model_context(
         rpsbml=rpsbml,
         objective_id=objective_id,
+        cobra_from_file=cobra_from_file,
+        host=host,
         logger=logger,
-    )
-    if not cobraModel:
-        return None
+    ) as cobraModel:
+        if not cobraModel:
+            return None
+        return optimize(
+            cobraModel=cobraModel,
+            sim_type=sim_type,
+            fraction_coeff=fraction_coeff,
+            logger=logger,
+        )
+
+
+@contextmanager
+def cobra_model_context(
+    rpsbml: rpSBML,
+    objective_id: str,
+    cobra_from_file: bool = DEFAULT_RPFBA_ARGS["cobra_from_file"],
+    host: "HostModel" = None,
+    logger: Logger = getLogger(__name__),
+) -> Iterator[cobra_model]:
+    """Yield the cobra model of rpsbml with the objective objective_id set.
+    If host is given (and cobra_from_file is not set), this is the cached
+    cobra model of the host completed with the pathway, which is restored
+    on exit. Otherwise, the cobra model is built from the whole rpsbml.
+
+    :param rpsbml: The model to analyse.
+    :param objective_id: The objective to set.
+    :param cobra_from_file: Build the cobra model through a temporary SBML file (Default: False).
+    :param host: The host model rpsbml has been merged from (Optional).
+    :param logger: A logger (Optional).
+
+    :type rpsbml: rpSBML
+    :type objective_id: str
+    :type cobra_from_file: bool
+    :type host: HostModel
+    :type logger: Logger
+
+    :return: The cobra model, None if it cannot be built.
+    :rtype: cobra.Model
+    """
+    if host is not None and not cobra_from_file:
+        with host.merged_cobra_model(
+            rpsbml=rpsbml, objective_id=objective_id
+        ) as cobraModel:
+            yield cobraModel
+    else:
+        with profile_stage("build_cobra_model"):
+            cobraModel = build_cobra_model(
+                rpsbml=rpsbml,
+                objective_id=objective_id,
+                from_file=cobra_from_file,
+                logger=logger,
+            )
+        yield cobraModel
+
+
+def optimize(
+    cobraModel: cobra_model,
+    sim_type: str,
+    fraction_coeff: float = 0.95,
+    logger: Logger = getLogger(__name__),
+) -> cobra_solution:
+    """Optimize the cobra model according to the simulation type.
+
+    :param cobraModel: The cobra model with the objective set.
+    :param sim_type: The type of simulation to use. Available simulation types include: fraction, fba, rpfba
+    :param fraction_coeff: The fraction of the optimum. Used in pfba simulation (Default: 0.95).
+    :param logger: A logger (Optional).
+
+    :type cobraModel: cobra.Model
+    :type sim_type: str
+    :type fraction_coeff: float
+    :type logger: Logger
+
+    :return: Results of the simulation.
+    :rtype: cobra.Solution
+    """
 
     cobra_results = None
     # cobraModel.objective = {
     #     cobraModel.reactions.get_by_id('BIOMASS_Ec_iML1515_core_75p37M'): 1,
     #     cobraModel.reactions.get_by_id('PYRt2'): 2
     # }
-    if sim_type.lower() == "pfba":
-        cobra_results = pfba(cobraModel, fraction_coeff)
-    else:
-        cobra_results = cobraModel.optimize(
-            objective_sense="maximize", raise_error=True
-        )
+    with profile_stage("solve"):
+        if sim_type.lower() == "pfba":
+            cobra_results = pfba(cobraModel, fraction_coeff)
+        else:
+            cobra_results = cobraModel.optimize(
+                objective_sense="maximize", raise_error=True
+            )
 
     logger.debug(cobra_results)
 
     return cobra_results
 
 
+def build_sparse_lp(
+    rpsbml: rpSBML,
+    objective_id: str,
+    host: "HostModel" = None,
+    logger: Logger = getLogger(__name__),
+) -> "SparseLP":
+    """Return the LP of rpsbml with the objective objective_id set, for the
+    'scipy' engine. If host is given, this is the cached LP of the host
+    extended with the pathway columns. Otherwise, the LP is built from the
+    cobra model of the whole rpsbml.
+
+    :param rpsbml: The model to analyse.
+    :param objective_id: The objective to set.
+    :param host: The host model rpsbml has been merged from (Optional).
+    :param logger: A logger (Optional).
+
+    :type rpsbml: rpSBML
+    :type objective_id: str
+    :type host: HostModel
+    :type logger: Logger
+
+    :return: The LP, None if it cannot be built.
+    :rtype: SparseLP
+    """
+    # scipy is only required by the 'scipy' engine
+    from .lp import SparseLP
+
+    if host is not None:
+        host_lp = host.get_sparse_lp()
+        if host_lp is None:
+            return None
+        with profile_stage("build_lp"):
+            lp = host_lp.extend(
+                sbml_model=rpsbml.getModel(),
+                hidden_species=set(rpsbml.get_isolated_species()),
+                logger=logger,
+            )
+    else:
+        with profile_stage("build_cobra_model"):
+            cobraModel = build_cobra_model(
+                rpsbml=rpsbml, objective_id=objective_id, logger=logger
+            )
+        if cobraModel is None:
+            return None
+        with profile_stage("build_lp"):
+            lp = SparseLP.from_cobra_model(cobraModel)
+    lp.set_sbml_objective(rpsbml.getModel(), objective_id)
+    return lp
+
+
+def optimize_lp(
+    lp: "SparseLP",
+    logger: Logger = getLogger(__name__),
+) -> cobra_solution:
+    """Optimize lp, as optimize does cobra models (see SparseLP.optimize)."""
+    with profile_stage("solve"):
+        cobra_results = lp.optimize()
+    logger.debug(cobra_results)
+    return cobra_results
+
+
 def build_cobra_model(
     rpsbml: rpSBML,
     objective_id: str,
+    from_file: bool = DEFAULT_RPFBA_ARGS["cobra_from_file"],
     logger: Logger = getLogger(__name__),
 ) -> cobra_model:
     """Convert the rpSBML object to cobra object
 
-    :return: Success or failure of the function
-    :rtype: bool
+    The libSBML document of the rpSBML object is handed over to cobrapy
+    in memory. If from_file is set, the document is written to a temporary
+    file which is then read back by cobrapy (former behaviour).
+
+    :param rpsbml: The model to convert
+    :param objective_id: The objective to activate in the cobra model
+    :param from_file: Go through a temporary SBML file (Default: False)
+    :param logger: A logger (Optional)
+
+    :type rpsbml: rpSBML
+    :type objective_id: str
+    :type from_file: bool
+    :type logger: Logger
+
+    :return: The cobra model, None if something went wrong
+    :rtype: cobra.Model
     """
 
     rpsbml.logger.info("Creating Cobra object from rpSBML...")
@@ -797,8 +2156,62 @@ def build_cobra_model(
 
     rpsbml.activateObjective(objective_id=objective_id, plugin="fbc")
 
+    if from_file:
+        cobraModel = _read_cobra_model_from_file(rpsbml, logger)
+    else:
+        cobraModel = _read_cobra_model_from_document(rpsbml, logger)
+    if cobraModel is None:
+        return None
+
+    # Hide to Cobra species that are isolated
+    cobraModel.remove_metabolites(
+        [
+            cobraModel.metabolites.get_by_id(to_cobra(met))
+            for met in rpsbml.get_isolated_species()
+        ]
+    )
+
+    logger.debug(cobraModel)
+
+    return cobraModel
+
+
+def _read_cobra_model_from_document(
+    rpsbml: rpSBML,
+    logger: Logger = getLogger(__name__),
+) -> cobra_model:
+    """Build the cobra model straight from the libSBML document of rpsbml,
+    without any serialization.
+
+    :return: The cobra model, None if the document cannot be read
+    :rtype: cobra.Model
+    """
+    document = rpsbml.getModel().getSBMLDocument()
+    if document.getPlugin("fbc") and document.getPlugin("fbc").getPackageVersion() == 1:
+        # cobra converts fbc v1 documents to fbc v2 in place
+        document = document.clone()
+    try:
+        return _sbml_to_model(document, use_fbc_package=True)
+    except CobraSBMLError as e:
+        logger.error("Something went wrong reading the SBML model")
+        logger.debug(e)
+        _, errors = validate_sbml_model(writeSBMLToString(document))
+        logger.error(str(json_dumps(errors, indent=4)))
+        return None
+
+
+def _read_cobra_model_from_file(
+    rpsbml: rpSBML,
+    logger: Logger = getLogger(__name__),
+) -> cobra_model:
+    """Build the cobra model by writing rpsbml into a temporary SBML file
+    and reading it back with cobrapy.
+
+    :return: The cobra model, None if the file cannot be read
+    :rtype: cobra.Model
+    """
+    cobraModel = None
     # To handle file removing (Windows)
-    error = False
     with NamedTemporaryFile(delete=False) as temp_f:
         rpsbml.write_to_file(temp_f.name)
         temp_f.close()
@@ -808,24 +2221,54 @@ def build_cobra_model(
             logger.error("Something went wrong reading the SBML model")
             model, errors = validate_sbml_model(temp_f.name)
             logger.error(str(json_dumps(errors, indent=4)))
-            error = True
 
     # To handle file removing (Windows)
     remove(temp_f.name)
-    if error:
-        return None
 
-    # Hide to Cobra species that are isolated
-    cobraModel.remove_metabolites(
-        [
-            cobraModel.metabolites.get_by_id(to_cobra(met))
-            for met in rpsbml.get_isolated_species()
-        ]
-    )
+    return cobraModel
 
-    logger.debug(cobraModel)
 
-    return cobraModel
+def write_results_to_merged_model(
+    rpsbml: rpSBML,
+    results: Dict,
+    objective_rxn_id: str,
+    biomass_rxn_id: str,
+    objectives: List[Tuple[str, float, str]] = None,
+    logger: Logger = getLogger(__name__),
+) -> None:
+    """Write the results of runFBA into the BRSynth annotations of rpsbml,
+    the 'biomass' results to the biomass objective, the 'multi_fba' results
+    to the weighted objective and the other ones to the target objective.
+
+    :param rpsbml: The merged model
+    :param results: The results of the simulations, by simulation type
+    :param objective_rxn_id: The objective reaction ID
+    :param biomass_rxn_id: The biomass reaction ID
+    :param objectives: The reactions of the weighted objective (Default: None)
+    :param logger: The logger object
+
+    :type rpsbml: rpSBML
+    :type results: Dict
+    :type objective_rxn_id: str
+    :type biomass_rxn_id: str
+    :type objectives: List[Tuple[str, float, str]]
+    :type logger: Logger
+    """
+    for sim_type, cobra_results in results.items():
+        if sim_type == "multi_fba":
+            objective_id = find_or_create_weighted_objective(rpsbml, objectives)
+        else:
+            rxn_id = biomass_rxn_id if sim_type == "biomass" else objective_rxn_id
+            objective_id = rpsbml.find_or_create_objective(
+                rxn_id=rxn_id, obj_id=f"brs_obj_{rxn_id}"
+            )
+        write_results_to_rpsbml(
+            rpsbml=rpsbml,
+            objective_id=objective_id,
+            cobra_results=cobra_results,
+            sim_type=sim_type,
+            logger=logger,
+        )
 
 
 def write_results_to_rpsbml(
@@ -1078,39 +2521,3 @@ def write_objective_to_pathway(
 # 10) Reduced model
 
 # 11) ECM
-
-
-# def runMultiObjective(rpsbml,
-#                       reactions,
-#                       coefficients,
-#                       is_max=True,
-#                       pathway_id='rp_pathway',
-#                       objective_id=None):
-#     """Run FBA using multiple objectives
-#
-#     :param reactions: The ids of the reactions involved in the objective
-#     :param coefficients: The coefficients associated with the reactions id
-#     :param is_max: Maximise or minimise the objective (Default: True)
-#     :param pathway_id: The id of the heterologous pathway (Default: rp_pathway)
-#     :param objective_id: Overwrite the default id (Default: None)
-#
-#     :type reactions: list
-#     :type coefficients: list
-#     :type is_max: bool
-#     :type pathway_id: str
-#     :type objective_id: str
-#
-#     :return: Success or failure of the function
-#     :rtype: bool
-#     """
-#     fbc_plugin = rpsbml.getModel().getPlugin('fbc')
-#     rpsbml.checklibSBML(fbc_plugin, 'Getting FBC package')
-#     objective_id = rpsbml.findCreateObjective(reactions, coefficients, is_max)
-#     rpsbml.checklibSBML(fbc_plugin.setActiveObjectiveId(objective_id),
-#                         'Setting active objective '+str(objective_id))
-#     cobraModel = rpsbml.convertToCobra()
-#     if not cobraModel:
-#         return False
-#     cobra_results = cobraModel.optimize()
-#     rpsbml.writeFBAResults(objective_id, cobra_results, pathway_id)
-#     return rpsbml
@@ -0,0 +1,1182 @@
+import re
+from contextlib import contextmanager
+from logging import Logger, getLogger
+from os import path as os_path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import TYPE_CHECKING, Dict, Iterator, List, Set, Tuple
+
+import numpy as np
+import pandas as pd
+from cobra import Configuration
+from cobra.core.metabolite import Metabolite as cobra_metabolite
+from cobra.core.model import Model as cobra_model
+from cobra.core.reaction import Reaction as cobra_reaction
+from cobra.core.solution import Solution as cobra_solution
+from cobra.io import load_json_model, load_matlab_model
+from cobra.io.sbml import F_REACTION, F_REPLACE, F_SPECIE, _model_to_sbml
+from cobra.util.solver import linear_reaction_coefficients
+from libsbml import Model as libsbml_model
+from libsbml import Reaction as libsbml_reaction
+from libsbml import FbcExtension, GroupsExtension, SBMLDocument
+from libsbml import Species as libsbml_species
+from libsbml import readSBMLFromString, writeSBMLToString
+from rplibs import rpSBML
+from rplibs.cobra_format import to_cobra
+
+from .cache import simulation_key
+from .fba import _read_cobra_model_from_document, species_incidence
+from .profiling import stage as profile_stage
+from .snapshot import SnapshotError, default_snapshot, read_snapshot, write_snapshot
+
+if TYPE_CHECKING:
+    from .lp import SparseLP
+
+# IDs of the species and reaction written in the template of the overlay
+# models to locate their lists, see index_model
+SPECIES_PLACEHOLDER = "rpfba_species_placeholder"
+REACTION_PLACEHOLDER = "rpfba_reaction_placeholder"
+
+# Cross-references of species annotations (MIRIAM and BRSynth InChIKey)
+IDENTIFIERS_PATTERN = re.compile(r'identifiers\.org/([^"\s<]+)')
+INCHIKEY_PATTERN = re.compile(r'inchikey[^>]*?value="([^"]+)"', re.IGNORECASE)
+
+
+class HostModel:
+    """GEM shared by all the pathways simulated against it.
+
+    The GEM is parsed once and the cobra model built from it is kept.
+    Simulating a pathway then only adds the heterologous reactions and
+    species of the merged model to this cobra model (and hides the isolated
+    species) within a cobra context, which is reverted afterwards.
+
+    The optima of the host are memoized by objective, so that they are
+    reused for the pathways which cannot change them (see unchanged_optimum).
+
+    Species (by ID and cross-references, InChIKey included), reactions and
+    compartments of the GEM are indexed once, so that pathways can be merged
+    into the small part of the GEM they can match (see overlay_model)
+    instead of into a copy of the whole GEM.
+
+    The GEM can be an SBML file, or a cobra JSON or MAT file. If snapshot
+    is given, the index, the cobra model and the LP of the GEM are loaded
+    from this snapshot (see save_snapshot) instead of being built, the GEM
+    being only parsed if needed, e.g. to write the whole merged model. A
+    missing or stale snapshot (built from another content of model_file) is
+    rebuilt, the GEM being parsed if it cannot be written. Snapshots hold
+    no code but are trusted as the GEM (see snapshot.write_snapshot).
+    """
+
+    # Tolerance on reduced costs to consider a pathway reaction cannot
+    # improve the host optimum
+    REDUCED_COST_TOLERANCE = 1e-9
+
+    def __init__(
+        self,
+        model_file: str,
+        logger: Logger = getLogger(__name__),
+        snapshot: str = None,
+    ):
+        self.model_file = model_file
+        self.logger = logger
+        self.__rpsbml = None
+        self.__skeleton = None
+        self.__cobra_model = None
+        self.__sparse_lp = None
+        self.__species_incidence = None
+        self.__host_rxn_ids = None
+        self.__host_met_ids = None
+        # IDs of the reactions added by the pathway in merged_cobra_model
+        self.__pathway_rxn_ids = None
+        # Host optima, by objective
+        self.__optima = {}
+        self.__index = None
+        self.__digest = None
+        self.__snapshot = None
+        # The snapshot file loaded or written, and the temporary directory
+        # of the one written by get_snapshot
+        self.__snapshot_file = None
+        self.__snapshot_dir = None
+        if snapshot is not None:
+            # '' for the default snapshot
+            snapshot = snapshot or default_snapshot(model_file)
+            if not self.__load_snapshot(snapshot):
+                try:
+                    self.save_snapshot(snapshot)
+                except OSError as e:
+                    self.logger.warning(
+                        f"Cannot write the snapshot {snapshot} ({e}), "
+                        + f"parsing {model_file} instead"
+                    )
+        if self.__snapshot is None:
+            self.get_rpsbml()
+
+    def get_rpsbml(self) -> rpSBML:
+        """Return the GEM, parsed on first call."""
+        if self.__rpsbml is None:
+            with profile_stage("parse_model"):
+                self.__rpsbml, cobraModel = read_host_model(
+                    self.model_file, self.logger
+                )
+            if self.__cobra_model is None and cobraModel is not None:
+                self.__set_cobra_model(cobraModel)
+        return self.__rpsbml
+
+    def get_skeleton(self) -> rpSBML:
+        """Return the model the IDs of the GEM (compartments, reactions) can
+        be checked against, i.e. the GEM itself if it has been parsed, or
+        its skeleton (compartments, parameters, objectives and reactions
+        reduced to their ID and name) from the snapshot.
+
+        :rtype: rpSBML
+        """
+        if self.__rpsbml is not None or self.__snapshot is None:
+            return self.get_rpsbml()
+        if self.__skeleton is None:
+            self.__skeleton = _rpsbml_from_string(
+                self.__snapshot["data"]["skeleton"], self.logger
+            )
+        return self.__skeleton
+
+    def get_species_incidence(self) -> Dict[str, Tuple[Set[str], Set[str]]]:
+        """Return the producing and consuming reactions of each species of
+        the GEM, indexed on first call (see species_incidence).
+
+        :rtype: Dict[str, Tuple[Set[str], Set[str]]]
+        """
+        if self.__species_incidence is None:
+            start = perf_counter()
+            self.__species_incidence = species_incidence(
+                self.get_rpsbml().getModel().getListOfReactions()
+            )
+            self.logger.debug(
+                f"Species incidence of the host indexed in {perf_counter() - start:.4f} s"
+            )
+        return self.__species_incidence
+
+    def digest(self) -> str:
+        """Return the hash of the stoichiometry and flux bounds of the GEM
+        (see simulation_key), computed on first call.
+
+        :rtype: str
+        """
+        if self.__digest is None:
+            self.__digest = simulation_key(self.get_rpsbml(), [])
+        return self.__digest
+
+    def overlay_model(
+        self,
+        pathway: rpSBML,
+        biomass_rxn_id: str,
+    ) -> rpSBML:
+        """Return the part of the GEM a pathway can be merged into, i.e.
+        the GEM compartments, parameters and objectives, with:
+            - the species which share an ID or a cross-reference (e.g. an
+              InChIKey) with a species of pathway,
+            - the reactions among these species only (which the pathway
+              reactions can match),
+            - the biomass and the objective reactions.
+        Merging pathway into this model instead of the whole GEM gives the
+        same pathway reactions and species, and the same missing species.
+        If a species of pathway matches no indexed key whereas one of its
+        keys occurs in the annotations of the GEM (e.g. a cross-reference
+        which is not an identifiers.org URI), the whole GEM is returned.
+
+        :param pathway: The pathway to merge
+        :param biomass_rxn_id: The biomass reaction ID
+
+        :type pathway: rpSBML
+        :type biomass_rxn_id: str
+
+        :return: The part of the GEM to merge pathway into
+        :rtype: rpSBML
+        """
+        start = perf_counter()
+        index = self.__get_index()
+
+        # Species matched by ID or cross-reference, through hash indices
+        species = set()
+        for spe in pathway.getModel().getListOfSpecies():
+            keys = species_keys(spe)
+            matched = set().union(
+                *(index["species_by_key"].get(key, ()) for key in keys)
+            )
+            # merge can still match the species if one of its
+            # cross-references occurs in the GEM in a form which is not indexed
+            if not matched and any(
+                _references(index["annotations"], key.split("inchikey:")[-1])
+                for key in keys
+            ):
+                self.logger.debug(
+                    f"Species {spe.getId()} not indexed in the host, "
+                    + "merging into the whole host model"
+                )
+                return self.get_rpsbml()
+            species |= matched
+        # Reactions among the matched species only
+        incidence = self.get_species_incidence()
+        rxn_ids = {
+            rxn_id
+            for spe_id in species
+            for rxn_ids in incidence.get(spe_id, ())
+            for rxn_id in rxn_ids
+        }
+        rxn_ids = {
+            rxn_id for rxn_id in rxn_ids if index["reaction_species"][rxn_id] <= species
+        }
+        # Objective reactions, with their species
+        for rxn_id in [biomass_rxn_id] + index["objective_rxn_ids"]:
+            if rxn_id in index["reaction_species"]:
+                rxn_ids.add(rxn_id)
+                species |= index["reaction_species"][rxn_id]
+
+        # In the GEM order
+        overlay = _rpsbml_from_string(
+            fill_template(
+                index["template"],
+                [xml for spe_id, xml in index["species"].items() if spe_id in species],
+                [
+                    xml
+                    for rxn_id, xml in index["reactions"].items()
+                    if rxn_id in rxn_ids
+                ],
+            ),
+            self.logger,
+        )
+        self.logger.debug(
+            f"Overlay model: {len(species)} species, {len(rxn_ids)} reaction(s) "
+            + f"out of {len(index['reactions'])}, built in {perf_counter() - start:.4f} s"
+        )
+        return overlay
+
+    def __get_index(self) -> Dict:
+        if self.__index is None:
+            start = perf_counter()
+            self.__index = index_model(self.get_rpsbml().getModel())
+            self.logger.debug(f"Host model indexed in {perf_counter() - start:.4f} s")
+        return self.__index
+
+    def get_cobra_model(self) -> cobra_model:
+        """Return the cobra model of the GEM, built on first call.
+
+        :return: The cobra model of the GEM, None if it cannot be built
+        :rtype: cobra.Model
+        """
+        if self.__cobra_model is None:
+            if self.__snapshot is not None:
+                self.logger.info("Creating Cobra object from the snapshot...")
+                cobraModel = cobra_model_from_tables(
+                    tables=self.__snapshot["data"]["cobra_model"],
+                    arrays=self.__snapshot["arrays"],
+                )
+                self.__set_cobra_model(cobraModel)
+                return self.__cobra_model
+            # Cobra JSON and MAT models are read as cobra models
+            rpsbml = self.get_rpsbml()
+            if self.__cobra_model is None:
+                self.logger.info("Creating Cobra object from the host model...")
+                cobraModel = _read_cobra_model_from_document(rpsbml, self.logger)
+                if cobraModel is not None:
+                    self.__set_cobra_model(cobraModel)
+        return self.__cobra_model
+
+    def __set_cobra_model(self, cobraModel: cobra_model) -> None:
+        self.__cobra_model = cobraModel
+        self.__host_rxn_ids = pd.Index(cobraModel.reactions.list_attr("id"))
+        self.__host_met_ids = pd.Index(cobraModel.metabolites.list_attr("id"))
+
+    def get_sparse_lp(self) -> "SparseLP":
+        """Return the LP of the GEM (for the 'scipy' engine), built from its
+        cobra model (or loaded from the snapshot) on first call.
+
+        :return: The LP of the GEM, None if its cobra model cannot be built
+        :rtype: SparseLP
+        """
+        if self.__sparse_lp is None:
+            # scipy is only required by the 'scipy' engine
+            from .lp import SparseLP
+
+            if self.__snapshot is not None:
+                with profile_stage("build_lp"):
+                    self.__sparse_lp = SparseLP.from_arrays(
+                        arrays=self.__snapshot["arrays"],
+                        rxn_ids=self.__snapshot["data"]["rxn_ids"],
+                        met_ids=self.__snapshot["data"]["met_ids"],
+                    )
+            else:
+                cobraModel = self.get_cobra_model()
+                if cobraModel is not None:
+                    with profile_stage("build_lp"):
+                        self.__sparse_lp = SparseLP.from_cobra_model(cobraModel)
+        return self.__sparse_lp
+
+    def save_snapshot(self, outfile: str) -> None:
+        """Write the snapshot of the GEM into outfile: its index, the
+        species incidence, its digest, its skeleton (see get_skeleton), the
+        tables its cobra model is rebuilt from (see cobra_model_tables) and
+        its LP (stoichiometry and bounds), with the hash of model_file it is
+        valid for (see snapshot.write_snapshot).
+
+        :param outfile: The snapshot file
+        :type outfile: str
+
+        :raises ValueError: If the cobra model cannot be built, or is merged with a pathway (see merged_cobra_model)
+        """
+        # The LP arrays do not require scipy
+        from .lp import lp_arrays
+
+        if self.__pathway_rxn_ids is not None:
+            raise ValueError("Cannot snapshot the GEM while a pathway is merged")
+        start = perf_counter()
+        cobraModel = self.get_cobra_model()
+        if cobraModel is None:
+            raise ValueError(f"Cannot build the cobra model of {self.model_file}")
+        coefficients = linear_reaction_coefficients(cobraModel)
+        write_snapshot(
+            outfile=outfile,
+            source=self.model_file,
+            data={
+                "index": self.__get_index(),
+                "species_incidence": self.get_species_incidence(),
+                "digest": self.digest(),
+                "skeleton": skeleton_model(self.get_rpsbml().getModel()),
+                "rxn_ids": cobraModel.reactions.list_attr("id"),
+                "met_ids": cobraModel.metabolites.list_attr("id"),
+                "cobra_model": cobra_model_tables(cobraModel),
+            },
+            arrays={
+                **lp_arrays(cobraModel),
+                "objective_coefficients": np.array(
+                    [coefficients.get(rxn, 0) for rxn in cobraModel.reactions], float
+                ),
+            },
+        )
+        self.__snapshot_file = outfile
+        self.logger.info(
+            f"Snapshot of {self.model_file} written in {outfile} "
+            + f"in {perf_counter() - start:.2f} s"
+        )
+
+    def get_snapshot(self) -> str:
+        """Return the snapshot of the GEM, e.g. for worker processes to load
+        it from: the one it has been loaded from or written into, or else a
+        temporary one, written on first call (out of merged_cobra_model) and
+        removed with this object.
+
+        :rtype: str
+        """
+        if self.__snapshot_file is None:
+            self.__snapshot_dir = TemporaryDirectory()
+            self.save_snapshot(
+                os_path.join(
+                    self.__snapshot_dir.name,
+                    os_path.basename(default_snapshot(self.model_file)),
+                )
+            )
+        return self.__snapshot_file
+
+    def __load_snapshot(self, snapshot: str) -> bool:
+        if not os_path.exists(snapshot):
+            self.logger.info(f"Building the snapshot {snapshot}...")
+            return False
+        start = perf_counter()
+        try:
+            data, arrays = read_snapshot(snapshot, self.model_file)
+        except SnapshotError as e:
+            self.logger.warning(f"Rebuilding the snapshot: {e}")
+            return False
+        self.__snapshot = {"data": data, "arrays": arrays}
+        self.__snapshot_file = snapshot
+        # Sets and tuples are stored as lists
+        index = data["index"]
+        for name in ("species_by_key", "reaction_species"):
+            index[name] = {key: set(ids) for key, ids in index[name].items()}
+        index["template"] = tuple(index["template"])
+        self.__index = index
+        self.__species_incidence = {
+            spe_id: (set(producing), set(consuming))
+            for spe_id, (producing, consuming) in data["species_incidence"].items()
+        }
+        self.__digest = data["digest"]
+        self.logger.debug(
+            f"Snapshot {snapshot} loaded in {perf_counter() - start:.4f} s"
+        )
+        return True
+
+    @contextmanager
+    def merged_cobra_model(
+        self,
+        rpsbml: rpSBML,
+        objective_id: str,
+        pathway_id: str = "rp_pathway",
+    ) -> Iterator[cobra_model]:
+        """Yield the host cobra model completed with the pathway reactions
+        of rpsbml (the model merged from the host and a pathway), with the
+        isolated species of rpsbml removed and the objective objective_id set.
+        All changes are reverted on exit.
+
+        :param rpsbml: The merged model
+        :param objective_id: The ID of the (FBC) objective to optimise
+        :param pathway_id: The ID of the heterologous pathway group (Default: rp_pathway)
+
+        :type rpsbml: rpSBML
+        :type objective_id: str
+        :type pathway_id: str
+
+        :return: The merged cobra model, None if the host model cannot be built
+        :rtype: cobra.Model
+        """
+        cobraModel = self.get_cobra_model()
+        if cobraModel is None:
+            yield None
+            return
+        with cobraModel:
+            with profile_stage("build_cobra_model"):
+                # Hide to Cobra species that are isolated, by not adding them
+                hidden_species = set(rpsbml.get_isolated_species())
+                reactions = build_pathway_reactions(
+                    cobraModel=cobraModel,
+                    sbml_model=rpsbml.getModel(),
+                    pathway_id=pathway_id,
+                    hidden_species=hidden_species,
+                    logger=self.logger,
+                )
+                cobraModel.add_reactions(reactions)
+                # or by removing them, in case they are in the host
+                cobraModel.remove_metabolites(
+                    [
+                        cobraModel.metabolites.get_by_id(to_cobra(met))
+                        for met in hidden_species
+                        if to_cobra(met) in cobraModel.metabolites
+                    ]
+                )
+                set_objective(
+                    cobraModel=cobraModel,
+                    sbml_model=rpsbml.getModel(),
+                    objective_id=objective_id,
+                )
+                self.logger.debug(cobraModel)
+            self.__pathway_rxn_ids = [rxn.id for rxn in reactions]
+            try:
+                yield cobraModel
+            finally:
+                self.__pathway_rxn_ids = None
+
+    def pathway_delta(self, cobraModel: cobra_model) -> Dict:
+        """Return the changes merged_cobra_model has made to the host cobra
+        model, yielded as cobraModel (with its current objective), as plain
+        data for another HostModel of the same GEM to apply them (see
+        delta_cobra_model), e.g. in a worker process, instead of the whole
+        cobraModel being sent to it.
+
+        :param cobraModel: The cobra model yielded by merged_cobra_model
+        :type cobraModel: cobra.Model
+
+        :return: The changes
+        :rtype: Dict
+        """
+        reactions = [
+            cobraModel.reactions.get_by_id(rxn_id) for rxn_id in self.__pathway_rxn_ids
+        ]
+        metabolites = {
+            met.id: [met.id, met.name, met.compartment]
+            for rxn in reactions
+            for met in rxn.metabolites
+            if met.id not in self.__host_met_ids
+        }
+        return {
+            "metabolites": list(metabolites.values()),
+            "reactions": [
+                [
+                    rxn.id,
+                    rxn.name,
+                    rxn.bounds,
+                    {met.id: coeff for met, coeff in rxn.metabolites.items()},
+                ]
+                for rxn in reactions
+            ],
+            "hidden_metabolites": [
+                met_id
+                for met_id in self.__host_met_ids
+                if met_id not in cobraModel.metabolites
+            ],
+            "objective": {
+                rxn.id: coeff
+                for rxn, coeff in linear_reaction_coefficients(cobraModel).items()
+            },
+            "objective_direction": cobraModel.objective_direction,
+        }
+
+    @contextmanager
+    def delta_cobra_model(self, delta: Dict) -> Iterator[cobra_model]:
+        """Yield the host cobra model with the changes delta returned by
+        pathway_delta applied, all of them being reverted on exit.
+
+        :param delta: The changes
+        :type delta: Dict
+
+        :return: The changed cobra model, None if the host model cannot be built
+        :rtype: cobra.Model
+        """
+        cobraModel = self.get_cobra_model()
+        if cobraModel is None:
+            yield None
+            return
+        with cobraModel:
+            # As build_pathway_reactions does
+            new_metabolites = {
+                met_id: cobra_metabolite(met_id, name=name, compartment=compartment)
+                for met_id, name, compartment in delta["metabolites"]
+            }
+            reactions = []
+            for rxn_id, name, bounds, stoichiometry in delta["reactions"]:
+                reaction = cobra_reaction(rxn_id, name=name)
+                reaction.bounds = bounds
+                reaction.add_metabolites(
+                    {
+                        (
+                            new_metabolites[met_id]
+                            if met_id in new_metabolites
+                            else cobraModel.metabolites.get_by_id(met_id)
+                        ): coeff
+                        for met_id, coeff in stoichiometry.items()
+                    }
+                )
+                reactions.append(reaction)
+            cobraModel.add_reactions(reactions)
+            cobraModel.remove_metabolites(
+                [
+                    cobraModel.metabolites.get_by_id(met_id)
+                    for met_id in delta["hidden_metabolites"]
+                ]
+            )
+            cobraModel.objective = {
+                cobraModel.reactions.get_by_id(rxn_id): coeff
+                for rxn_id, coeff in delta["objective"].items()
+            }
+            cobraModel.objective_direction = delta["objective_direction"]
+            yield cobraModel
+
+    def unchanged_optimum(self, cobraModel: cobra_model) -> cobra_solution:
+        """Return the optimum of cobraModel, as yielded by merged_cobra_model,
+        if the pathway reactions cannot change the optimum of the host for the
+        same objective, None otherwise.
+
+        The host optimum, computed once per objective, stays optimal if no
+        pathway reaction has a reduced cost (with the shadow prices of the
+        host, new species being priced 0) allowing it to improve the
+        objective, e.g. by draining host species whose production does
+        not limit the objective. The pathway reactions then carry no flux.
+
+        :param cobraModel: The merged cobra model
+        :type cobraModel: cobra.Model
+
+        :return: The optimum of cobraModel, None if it has to be computed
+        :rtype: cobra.Solution
+        """
+        if cobraModel is not self.__cobra_model or self.__pathway_rxn_ids is None:
+            return None
+        coefficients = {
+            rxn.id: coeff
+            for rxn, coeff in linear_reaction_coefficients(cobraModel).items()
+        }
+        if any(rxn_id in coefficients for rxn_id in self.__pathway_rxn_ids):
+            return None
+        direction = cobraModel.objective_direction
+        key = (tuple(sorted(coefficients.items())), direction)
+        if key not in self.__optima:
+            self.__optima[key] = self.__host_optimum(cobraModel)
+        optimum = self.__optima[key]
+        if optimum is None:
+            return None
+
+        shadow_prices = optimum.shadow_prices
+        sense = 1 if direction == "max" else -1
+        reduced_costs = {}
+        for rxn_id in self.__pathway_rxn_ids:
+            rxn = cobraModel.reactions.get_by_id(rxn_id)
+            if rxn.lower_bound > 0 or rxn.upper_bound < 0:
+                return None
+            reduced_cost = -sum(
+                shadow_prices.get(met.id, 0.0) * coeff
+                for met, coeff in rxn.metabolites.items()
+            )
+            if (
+                rxn.upper_bound > 0
+                and sense * reduced_cost > self.REDUCED_COST_TOLERANCE
+                or rxn.lower_bound < 0
+                and sense * reduced_cost < -self.REDUCED_COST_TOLERANCE
+            ):
+                return None
+            # As cobra, the reduced cost of the forward minus the reverse variable
+            reduced_costs[rxn_id] = 2 * reduced_cost
+
+        self.logger.debug("Pathway cannot change the host optimum, reusing it")
+        rxn_ids = pd.Index(cobraModel.reactions.list_attr("id"))
+        met_ids = pd.Index(cobraModel.metabolites.list_attr("id"))
+        return cobra_solution(
+            objective_value=optimum.objective_value,
+            status=optimum.status,
+            fluxes=optimum.fluxes.reindex(rxn_ids, fill_value=0.0),
+            reduced_costs=optimum.reduced_costs.reindex(rxn_ids).fillna(
+                pd.Series(reduced_costs, dtype=float)
+            ),
+            shadow_prices=optimum.shadow_prices.reindex(met_ids, fill_value=0.0),
+        )
+
+    def __host_optimum(self, cobraModel: cobra_model) -> cobra_solution:
+        # Optimise the host alone, i.e. with the pathway reactions shut down
+        with cobraModel:
+            for rxn_id in self.__pathway_rxn_ids:
+                cobraModel.reactions.get_by_id(rxn_id).bounds = (0, 0)
+            solution = cobraModel.optimize()
+        if solution.status != "optimal":
+            return None
+        return cobra_solution(
+            objective_value=solution.objective_value,
+            status=solution.status,
+            fluxes=solution.fluxes.reindex(self.__host_rxn_ids),
+            reduced_costs=solution.reduced_costs.reindex(self.__host_rxn_ids),
+            shadow_prices=solution.shadow_prices.reindex(self.__host_met_ids),
+        )
+
+
+def prepare_snapshot(
+    model_file: str,
+    snapshot: str = None,
+    logger: Logger = getLogger(__name__),
+) -> None:
+    """Build the snapshot of model_file if it is missing or stale (see
+    HostModel), e.g. once before worker processes load it.
+
+    :param model_file: The GEM file
+    :param snapshot: The snapshot file ('' for the default one), None for none
+    :param logger: The logger object
+
+    :type model_file: str
+    :type snapshot: str
+    :type logger: Logger
+    """
+    if snapshot is not None:
+        HostModel(model_file=model_file, logger=logger, snapshot=snapshot)
+
+
+@contextmanager
+def shared_snapshot(
+    model_file: str,
+    snapshot: str = None,
+    jobs: int = 1,
+    engine: str = "cobra",
+    logger: Logger = getLogger(__name__),
+) -> Iterator[str]:
+    """Yield the snapshot jobs worker processes load model_file from (see
+    HostModel), built once beforehand.
+
+    With the 'scipy' engine, the LP arrays of the GEM are memory-mapped
+    from the same pages of the page cache by all the workers, which build
+    no cobra model, instead of each of them parsing and holding its own copy
+    of the GEM. The cobra model is rebuilt by each worker (in its private
+    memory) from the snapshot, which only saves parsing the GEM: no
+    temporary snapshot is built for the 'cobra' engine.
+
+    :param model_file: The GEM file
+    :param snapshot: The snapshot file ('' for the default one), None for a temporary snapshot, removed on exit, if jobs is greater than 1 and engine is 'scipy'
+    :param jobs: The number of worker processes
+    :param engine: The LP engine of the workers, 'cobra' or 'scipy' (Default: cobra)
+    :param logger: The logger object
+
+    :type model_file: str
+    :type snapshot: str
+    :type jobs: int
+    :type engine: str
+    :type logger: Logger
+
+    :return: The snapshot file, None if the workers parse model_file
+    :rtype: Iterator[str]
+    """
+    if snapshot is not None:
+        prepare_snapshot(model_file, snapshot, logger)
+        yield snapshot or default_snapshot(model_file)
+    elif jobs > 1 and engine == "scipy":
+        with TemporaryDirectory() as tmp_d:
+            snapshot = os_path.join(
+                tmp_d, os_path.basename(default_snapshot(model_file))
+            )
+            prepare_snapshot(model_file, snapshot, logger)
+            yield snapshot
+    else:
+        yield None
+
+
+def cobra_model_tables(cobraModel: cobra_model) -> Dict:
+    """Return the tables cobraModel is rebuilt from, with the arrays of its
+    stoichiometric matrix, flux bounds and objective coefficients (see
+    cobra_model_from_tables): the IDs, names and compartments (and
+    InChIKeys) of its metabolites, the IDs, names and gene rules of its
+    reactions, the IDs and names of its genes, and its compartments.
+
+    :param cobraModel: The cobra model
+    :type cobraModel: cobra.Model
+
+    :return: The tables
+    :rtype: Dict
+    """
+    return {
+        "id": cobraModel.id,
+        "name": cobraModel.name,
+        "compartments": cobraModel.compartments,
+        "metabolites": [
+            [met.id, met.name, met.compartment, met.annotation.get("inchikey")]
+            for met in cobraModel.metabolites
+        ],
+        "reactions": [
+            [rxn.id, rxn.name, rxn.gene_reaction_rule] for rxn in cobraModel.reactions
+        ],
+        "genes": [[gene.id, gene.name] for gene in cobraModel.genes],
+        "objective_direction": cobraModel.objective_direction,
+    }
+
+
+def cobra_model_from_tables(
+    tables: Dict,
+    arrays: Dict[str, np.ndarray],
+) -> cobra_model:
+    """Return the cobra model of the tables returned by cobra_model_tables
+    and of the arrays of lp_arrays, with the objective coefficients
+    (objective_coefficients array).
+
+    :param tables: The tables
+    :param arrays: The arrays, by name
+
+    :type tables: Dict
+    :type arrays: Dict[str, np.ndarray]
+
+    :return: The cobra model
+    :rtype: cobra.Model
+    """
+    cobraModel = cobra_model(tables["id"], name=tables["name"])
+    cobraModel.compartments = tables["compartments"]
+    metabolites = []
+    for met_id, name, compartment, inchikey in tables["metabolites"]:
+        met = cobra_metabolite(met_id, name=name, compartment=compartment)
+        if inchikey is not None:
+            met.annotation["inchikey"] = inchikey
+        metabolites.append(met)
+    indptr, indices, data = (
+        arrays[name].tolist() for name in ("S_indptr", "S_indices", "S_data")
+    )
+    lower_bounds = arrays["lower_bounds"].tolist()
+    upper_bounds = arrays["upper_bounds"].tolist()
+    reactions = []
+    for i, (rxn_id, name, _) in enumerate(tables["reactions"]):
+        rxn = cobra_reaction(
+            rxn_id,
+            name=name,
+            lower_bound=lower_bounds[i],
+            upper_bound=upper_bounds[i],
+        )
+        # Before the metabolites are added to the model, not to be copied
+        rxn.add_metabolites(
+            {
+                metabolites[row]: coeff
+                for row, coeff in zip(
+                    indices[indptr[i] : indptr[i + 1]], data[indptr[i] : indptr[i + 1]]
+                )
+            }
+        )
+        reactions.append(rxn)
+    # In the order of the tables
+    cobraModel.add_metabolites(metabolites)
+    cobraModel.add_reactions(reactions)
+    for rxn, (_, _, rule) in zip(reactions, tables["reactions"]):
+        if rule:
+            rxn.gene_reaction_rule = rule
+    for gene_id, name in tables["genes"]:
+        if gene_id in cobraModel.genes:
+            cobraModel.genes.get_by_id(gene_id).name = name
+    cobraModel.objective = {
+        reactions[i]: coeff
+        for i, coeff in enumerate(arrays["objective_coefficients"].tolist())
+        if coeff
+    }
+    cobraModel.objective_direction = tables["objective_direction"]
+    return cobraModel
+
+
+def species_keys(species: libsbml_species) -> Set[str]:
+    """Return the keys species can be matched on: its ID (with and without
+    compartment suffix) and the cross-references of its annotation, with
+    and without namespace (e.g. 'metanetx.chemical:MNXM2' and 'MNXM2'),
+    InChIKeys being keyed as 'inchikey:<InChIKey>'.
+
+    :param species: The libSBML species
+    :type species: libsbml.Species
+
+    :return: The keys of species
+    :rtype: Set[str]
+    """
+    spe_id = species.getId()
+    keys = {spe_id, spe_id.split("__64__")[0]}
+    annotation = species.getAnnotationString() if species.isSetAnnotation() else ""
+    for resource in IDENTIFIERS_PATTERN.findall(annotation):
+        sep = "/" if "/" in resource else ":"
+        namespace, _, _id = resource.partition(sep)
+        if namespace.lower() == "inchikey":
+            keys.add(f"inchikey:{_id}")
+        else:
+            keys |= {f"{namespace.lower()}:{_id}", _id}
+    for inchikey in INCHIKEY_PATTERN.findall(annotation):
+        keys.add(f"inchikey:{inchikey}")
+    return keys
+
+
+def _species_refs(rxn: libsbml_reaction) -> List:
+    return list(rxn.getListOfReactants()) + list(rxn.getListOfProducts())
+
+
+def _rpsbml_from_document(
+    document: SBMLDocument,
+    logger: Logger = getLogger(__name__),
+) -> rpSBML:
+    # Built in memory, the packages merge relies on being enabled
+    for package, uri in (
+        ("fbc", FbcExtension.getXmlnsL3V1V2()),
+        ("groups", GroupsExtension.getXmlnsL3V1V1()),
+    ):
+        if not document.isPackageEnabled(package):
+            document.enablePackage(uri, package, True)
+    rpsbml = rpSBML(name=document.getModel().getId(), logger=logger)
+    rpsbml.document = document
+    return rpsbml
+
+
+def _rpsbml_from_string(
+    xml: str,
+    logger: Logger = getLogger(__name__),
+) -> rpSBML:
+    return _rpsbml_from_document(readSBMLFromString(xml), logger)
+
+
+def read_host_model(
+    model_file: str,
+    logger: Logger = getLogger(__name__),
+) -> Tuple[rpSBML, cobra_model]:
+    """Read the GEM model_file, an SBML file, or a cobra JSON (.json) or
+    MAT (.mat) file which is converted into SBML (by cobra).
+
+    :param model_file: The GEM file
+    :param logger: The logger object
+
+    :type model_file: str
+    :type logger: Logger
+
+    :return: The GEM, and its cobra model if model_file is a cobra model (None otherwise)
+    :rtype: Tuple[rpSBML, cobra.Model]
+    """
+    extension = os_path.splitext(model_file)[1].lower()
+    if extension == ".json":
+        cobraModel = load_json_model(model_file)
+    elif extension == ".mat":
+        cobraModel = load_matlab_model(model_file)
+    else:
+        return rpSBML(inFile=model_file, logger=logger), None
+    logger.info(f"Converting the cobra model {model_file} into SBML...")
+    document = _model_to_sbml(cobraModel, f_replace=F_REPLACE)
+    return _rpsbml_from_document(document, logger), cobraModel
+
+
+def index_model(sbml_model: libsbml_model) -> Dict:
+    """Return the index of the GEM sbml_model, which the overlay models are
+    built from (see HostModel.overlay_model):
+        - species_by_key: the IDs of the species by key (see species_keys),
+        - reaction_species: the IDs of the species of each reaction,
+        - objective_rxn_ids: the IDs of the reactions of the objectives,
+        - annotations: the IDs and the annotations of the species,
+        - species, reactions: the SBML of each species and reaction (gene
+          products being left out), in the GEM order,
+        - template: the SBML of the GEM without species and reactions
+          (see fill_template).
+
+    :param sbml_model: The GEM
+    :type sbml_model: libsbml.Model
+
+    :return: The index
+    :rtype: Dict
+    """
+    species_by_key = {}
+    annotations = []
+    species = {}
+    for spe in sbml_model.getListOfSpecies():
+        for key in species_keys(spe):
+            species_by_key.setdefault(key, set()).add(spe.getId())
+        annotations.append(spe.getId())
+        if spe.isSetAnnotation():
+            annotations.append(spe.getAnnotationString())
+        species[spe.getId()] = spe.toSBML()
+    reaction_species = {}
+    reactions = {}
+    for rxn in sbml_model.getListOfReactions():
+        reaction_species[rxn.getId()] = {
+            spe_ref.getSpecies() for spe_ref in _species_refs(rxn)
+        }
+        # Gene products are left out
+        rxn = rxn.clone()
+        rxn.getPlugin("fbc").unsetGeneProductAssociation()
+        reactions[rxn.getId()] = rxn.toSBML()
+    return {
+        "species_by_key": species_by_key,
+        "reaction_species": reaction_species,
+        "objective_rxn_ids": [
+            flux_obj.getReaction()
+            for obj in sbml_model.getPlugin("fbc").getListOfObjectives()
+            for flux_obj in obj.getListOfFluxObjectives()
+        ],
+        "annotations": "\n".join(annotations),
+        "species": species,
+        "reactions": reactions,
+        "template": _template(sbml_model),
+    }
+
+
+def _references(text: str, value: str) -> bool:
+    # Whether value occurs in text as a whole word
+    start = text.find(value)
+    while start != -1:
+        end = start + len(value)
+        if not (start > 0 and _is_word_char(text[start - 1])) and not (
+            end < len(text) and _is_word_char(text[end])
+        ):
+            return True
+        start = text.find(value, start + 1)
+    return False
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+def _empty_document(sbml_model: libsbml_model) -> SBMLDocument:
+    # GEM without species, reactions, gene products and groups,
+    # but with its compartments, units, parameters and objectives
+    document = sbml_model.getSBMLDocument().clone()
+    model = document.getModel()
+    for list_of in (
+        model.getListOfReactions(),
+        model.getListOfSpecies(),
+        model.getPlugin("fbc").getListOfGeneProducts(),
+    ):
+        while list_of.size() > 0:
+            list_of.remove(list_of.size() - 1)
+    groups = model.getPlugin("groups")
+    if groups is not None:
+        while groups.getNumGroups() > 0:
+            groups.removeGroup(groups.getNumGroups() - 1)
+    return document
+
+
+def _template(sbml_model: libsbml_model) -> Tuple[str, ...]:
+    # SBML of the empty GEM, split around its lists of species and
+    # reactions, written with placeholders to be located
+    document = _empty_document(sbml_model)
+    model = document.getModel()
+    model.createSpecies().setId(SPECIES_PLACEHOLDER)
+    model.createReaction().setId(REACTION_PLACEHOLDER)
+    xml = writeSBMLToString(document)
+    template = []
+    end = 0
+    for list_of, placeholder in (
+        ("listOfSpecies", SPECIES_PLACEHOLDER),
+        ("listOfReactions", REACTION_PLACEHOLDER),
+    ):
+        match = re.compile(
+            rf'(<{list_of}[^>]*>)\s*<\w+ id="{placeholder}"/>\s*(</{list_of}>)'
+        ).search(xml, end)
+        template += [xml[end : match.start()], match.group(1), match.group(2)]
+        end = match.end()
+    return tuple(template + [xml[end:]])
+
+
+def fill_template(
+    template: Tuple[str, ...],
+    species: List[str],
+    reactions: List[str],
+) -> str:
+    """Return the SBML of the template of index_model filled with the SBML
+    of species and reactions.
+    """
+    head, species_start, species_end, middle, rxns_start, rxns_end, tail = template
+    parts = [head]
+    # Lists cannot be empty
+    if species:
+        parts += [species_start, *species, species_end]
+    parts.append(middle)
+    if reactions:
+        parts += [rxns_start, *reactions, rxns_end]
+    parts.append(tail)
+    return "\n".join(parts)
+
+
+def skeleton_model(sbml_model: libsbml_model) -> str:
+    """Return the SBML of the skeleton of the GEM sbml_model, i.e. its
+    compartments, units, parameters and objectives, and its reactions
+    reduced to their ID and name, which IDs can be checked against.
+    """
+    document = _empty_document(sbml_model)
+    model = document.getModel()
+    for rxn in sbml_model.getListOfReactions():
+        skeleton_rxn = model.createReaction()
+        skeleton_rxn.setId(rxn.getId())
+        if rxn.isSetName():
+            skeleton_rxn.setName(rxn.getName())
+        skeleton_rxn.setReversible(rxn.getReversible())
+        skeleton_rxn.setFast(False)
+    return writeSBMLToString(document)
+
+
+def iter_pathway_reactions(
+    sbml_model: libsbml_model,
+    pathway_id: str,
+    hidden_species: Set[str] = None,
+    logger: Logger = getLogger(__name__),
+) -> Iterator[Tuple[str, libsbml_reaction, Dict[str, float]]]:
+    """Yield the reactions of the pathway group, with their cobra ID and
+    their stoichiometry by SBML species ID.
+
+    :param sbml_model: The libSBML model which contains the pathway
+    :param pathway_id: The ID of the heterologous pathway group
+    :param hidden_species: SBML IDs of the species to leave out of the stoichiometries (Default: empty)
+
+    :type sbml_model: libsbml.Model
+    :type pathway_id: str
+    :type hidden_species: Set[str]
+
+    :return: Tuples (cobra ID, libSBML reaction, stoichiometry)
+    :rtype: Iterator[Tuple[str, libsbml.Reaction, Dict[str, float]]]
+    """
+    if hidden_species is None:
+        hidden_species = set()
+    group = sbml_model.getPlugin("groups").getGroup(pathway_id)
+    if group is None:
+        logger.error(f"Cannot retreive the group {pathway_id}")
+        return
+
+    for member in group.getListOfMembers():
+        sbml_rxn = sbml_model.getReaction(member.getIdRef())
+        if sbml_rxn is None:
+            logger.error(
+                "Cannot retreive the following reaction: " + str(member.getIdRef())
+            )
+            continue
+        stoichiometry = {}
+        for sign, species_refs in (
+            (-1, sbml_rxn.getListOfReactants()),
+            (1, sbml_rxn.getListOfProducts()),
+        ):
+            for spe_ref in species_refs:
+                spe_id = spe_ref.getSpecies()
+                if spe_id in hidden_species:
+                    continue
+                stoichiometry[spe_id] = (
+                    stoichiometry.get(spe_id, 0) + sign * spe_ref.getStoichiometry()
+                )
+        yield F_REPLACE[F_REACTION](member.getIdRef()), sbml_rxn, stoichiometry
+
+
+def build_pathway_reactions(
+    cobraModel: cobra_model,
+    sbml_model: libsbml_model,
+    pathway_id: str,
+    hidden_species: Set[str] = None,
+    logger: Logger = getLogger(__name__),
+) -> List[cobra_reaction]:
+    """Build the cobra reactions of the pathway group that are not
+    already in cobraModel, with the species missing from cobraModel.
+
+    :param cobraModel: The host cobra model
+    :param sbml_model: The libSBML model which contains the pathway
+    :param pathway_id: The ID of the heterologous pathway group
+    :param hidden_species: SBML IDs of the species to leave out of the reactions (Default: empty)
+
+    :type cobraModel: cobra.Model
+    :type sbml_model: libsbml.Model
+    :type pathway_id: str
+    :type hidden_species: Set[str]
+
+    :return: The new cobra reactions
+    :rtype: List[cobra.Reaction]
+    """
+    new_metabolites = {}
+    reactions = []
+    for rxn_id, sbml_rxn, stoichiometry in iter_pathway_reactions(
+        sbml_model=sbml_model,
+        pathway_id=pathway_id,
+        hidden_species=hidden_species,
+        logger=logger,
+    ):
+        if rxn_id in cobraModel.reactions:
+            continue
+        reaction = cobra_reaction(rxn_id, name=sbml_rxn.getName())
+        reaction.bounds = _get_flux_bounds(sbml_model, sbml_rxn)
+        metabolites = {}
+        for spe_id, coeff in stoichiometry.items():
+            met_id = F_REPLACE[F_SPECIE](spe_id)
+            if met_id in cobraModel.metabolites:
+                met = cobraModel.metabolites.get_by_id(met_id)
+            elif met_id in new_metabolites:
+                met = new_metabolites[met_id]
+            else:
+                sbml_spe = sbml_model.getSpecies(spe_id)
+                met = cobra_metabolite(
+                    met_id,
+                    name=sbml_spe.getName(),
+                    compartment=sbml_spe.getCompartment(),
+                )
+                new_metabolites[met_id] = met
+            metabolites[met] = coeff
+        reaction.add_metabolites(metabolites)
+        reactions.append(reaction)
+
+    return reactions
+
+
+def set_objective(
+    cobraModel: cobra_model,
+    sbml_model: libsbml_model,
+    objective_id: str,
+) -> None:
+    """Set the (FBC) objective objective_id of sbml_model to cobraModel.
+
+    :param cobraModel: The cobra model
+    :param sbml_model: The libSBML model which contains the objective
+    :param objective_id: The objective ID
+
+    :type cobraModel: cobra.Model
+    :type sbml_model: libsbml.Model
+    :type objective_id: str
+    """
+    objective = sbml_model.getPlugin("fbc").getObjective(objective_id)
+    cobraModel.objective = {
+        cobraModel.reactions.get_by_id(
+            F_REPLACE[F_REACTION](flux_obj.getReaction())
+        ): flux_obj.getCoefficient()
+        for flux_obj in objective.getListOfFluxObjectives()
+    }
+    cobraModel.objective_direction = (
+        "min" if objective.getType() == "minimize" else "max"
+    )
+
+
+def _get_flux_bounds(
+    sbml_model: libsbml_model, sbml_rxn: libsbml_reaction
+) -> Tuple[float, float]:
+    fbc_rxn = sbml_rxn.getPlugin("fbc")
+    config = Configuration()
+    bounds = []
+    # Missing bounds are set to cobrapy defaults, as cobrapy does when reading SBML
+    for param_id, default in (
+        (fbc_rxn.getLowerFluxBound(), config.lower_bound),
+        (fbc_rxn.getUpperFluxBound(), config.upper_bound),
+    ):
+        param = sbml_model.getParameter(param_id)
+        bounds.append(param.getValue() if param is not None else default)
+    return tuple(bounds)
@@ -0,0 +1,275 @@
+from logging import Logger, getLogger
+from typing import Dict, List, Set
+
+import numpy as np
+import pandas as pd
+from cobra.core.model import Model as cobra_model
+from cobra.core.solution import Solution as cobra_solution
+from cobra.exceptions import OptimizationError
+from cobra.io.sbml import F_REACTION, F_REPLACE, F_SPECIE
+from libsbml import Model as libsbml_model
+from rplibs.cobra_format import to_cobra
+
+from .host import _get_flux_bounds, iter_pathway_reactions
+
+try:
+    from scipy import sparse
+    from scipy.optimize import linprog
+except ImportError:
+    sparse = None
+    linprog = None
+
+# Status of the solutions, by status of scipy.optimize.linprog
+LINPROG_STATUS = {
+    0: "optimal",
+    1: "iteration_limit",
+    2: "infeasible",
+    3: "unbounded",
+    4: "numeric",
+}
+
+
+def lp_arrays(cobraModel: cobra_model) -> Dict[str, np.ndarray]:
+    """Return the stoichiometric matrix of cobraModel, as the (CSC) arrays
+    of column pointers, row indices (species) and coefficients, and the flux
+    bounds, see SparseLP.from_arrays.
+
+    :param cobraModel: The cobra model
+    :type cobraModel: cobra.Model
+
+    :return: The arrays, by name
+    :rtype: Dict[str, np.ndarray]
+    """
+    indptr, indices, data = [0], [], []
+    met_index = {met.id: i for i, met in enumerate(cobraModel.metabolites)}
+    for rxn in cobraModel.reactions:
+        # Rows sorted within columns, as scipy does
+        for row, coeff in sorted(
+            (met_index[met.id], coeff) for met, coeff in rxn.metabolites.items()
+        ):
+            indices.append(row)
+            data.append(coeff)
+        indptr.append(len(indices))
+    return {
+        "S_indptr": np.array(indptr, dtype=np.int32),
+        "S_indices": np.array(indices, dtype=np.int32),
+        "S_data": np.array(data, dtype=float),
+        "lower_bounds": np.array(cobraModel.reactions.list_attr("lower_bound"), float),
+        "upper_bounds": np.array(cobraModel.reactions.list_attr("upper_bound"), float),
+    }
+
+
+class SparseLP:
+    """Linear program of FBA, i.e. max (or min) c.v s.t. S.v = 0 and
+    lb <= v <= ub, with the stoichiometric matrix S held as a scipy sparse
+    (CSC) matrix and solved by HiGHS (through scipy.optimize.linprog).
+
+    The LP of the host is built once from its cobra model (see
+    HostModel.get_sparse_lp), then the LP of each pathway is the host LP
+    extended with the pathway columns (see extend), without building any
+    cobra object. Solutions are cobra Solutions, with the same fields (and
+    sign conventions) as those of cobra.
+    """
+
+    def __init__(
+        self,
+        S: "sparse.csc_matrix",
+        rxn_ids: pd.Index,
+        met_ids: pd.Index,
+        lower_bounds: np.ndarray,
+        upper_bounds: np.ndarray,
+    ):
+        if sparse is None:
+            raise ImportError("scipy is required by the 'scipy' engine")
+        self.S = S
+        self.rxn_ids = rxn_ids
+        self.met_ids = met_ids
+        self.lower_bounds = lower_bounds
+        self.upper_bounds = upper_bounds
+        self.objective = np.zeros(len(rxn_ids))
+        self.direction = "max"
+
+    @classmethod
+    def from_cobra_model(cls, cobraModel: cobra_model) -> "SparseLP":
+        """Return the LP of cobraModel (its objective left unset)."""
+        return cls.from_arrays(
+            arrays=lp_arrays(cobraModel),
+            rxn_ids=cobraModel.reactions.list_attr("id"),
+            met_ids=cobraModel.metabolites.list_attr("id"),
+        )
+
+    @classmethod
+    def from_arrays(
+        cls,
+        arrays: Dict[str, np.ndarray],
+        rxn_ids: List[str],
+        met_ids: List[str],
+    ) -> "SparseLP":
+        """Return the LP of the arrays returned by lp_arrays (e.g. stored
+        in a snapshot), for the reactions rxn_ids and the species met_ids.
+
+        The arrays are not copied: the LP of a memory-mapped snapshot shares
+        its pages with all the processes which load it. Bounds are copied on
+        first change (see set_bounds).
+        """
+        if sparse is None:
+            raise ImportError("scipy is required by the 'scipy' engine")
+        return cls(
+            S=sparse.csc_matrix(
+                (arrays["S_data"], arrays["S_indices"], arrays["S_indptr"]),
+                shape=(len(met_ids), len(rxn_ids)),
+                copy=False,
+            ),
+            rxn_ids=pd.Index(rxn_ids),
+            met_ids=pd.Index(met_ids),
+            lower_bounds=arrays["lower_bounds"],
+            upper_bounds=arrays["upper_bounds"],
+        )
+
+    def extend(
+        self,
+        sbml_model: libsbml_model,
+        pathway_id: str = "rp_pathway",
+        hidden_species: Set[str] = None,
+        logger: Logger = getLogger(__name__),
+    ) -> "SparseLP":
+        """Return this LP completed with the reactions of the pathway group
+        of sbml_model (those which are not already in the LP) and the species
+        missing from the LP, the hidden species being left out, as
+        HostModel.merged_cobra_model does. This LP is left unchanged.
+
+        :param sbml_model: The libSBML model which contains the pathway
+        :param pathway_id: The ID of the heterologous pathway group (Default: rp_pathway)
+        :param hidden_species: SBML IDs of the species to leave out (Default: empty)
+        :param logger: The logger object
+
+        :type sbml_model: libsbml.Model
+        :type pathway_id: str
+        :type hidden_species: Set[str]
+        :type logger: Logger
+
+        :return: The extended LP
+        :rtype: SparseLP
+        """
+        if hidden_species is None:
+            hidden_species = set()
+        nb_mets = len(self.met_ids)
+        rxn_ids, new_met_ids, new_mets = [], [], {}
+        lower_bounds, upper_bounds = [], []
+        rows, cols, data = [], [], []
+        for rxn_id, sbml_rxn, stoichiometry in iter_pathway_reactions(
+            sbml_model=sbml_model,
+            pathway_id=pathway_id,
+            hidden_species=hidden_species,
+            logger=logger,
+        ):
+            if rxn_id in self.rxn_ids:
+                continue
+            lower_bound, upper_bound = _get_flux_bounds(sbml_model, sbml_rxn)
+            for spe_id, coeff in stoichiometry.items():
+                met_id = F_REPLACE[F_SPECIE](spe_id)
+                if met_id in self.met_ids:
+                    row = self.met_ids.get_loc(met_id)
+                elif met_id in new_mets:
+                    row = new_mets[met_id]
+                else:
+                    row = new_mets[met_id] = nb_mets + len(new_met_ids)
+                    new_met_ids.append(met_id)
+                rows.append(row)
+                cols.append(len(rxn_ids))
+                data.append(coeff)
+            rxn_ids.append(rxn_id)
+            lower_bounds.append(lower_bound)
+            upper_bounds.append(upper_bound)
+
+        S = sparse.hstack(
+            [
+                sparse.vstack(
+                    [self.S, sparse.csc_matrix((len(new_met_ids), len(self.rxn_ids)))]
+                ),
+                sparse.csc_matrix(
+                    (data, (rows, cols)),
+                    shape=(nb_mets + len(new_met_ids), len(rxn_ids)),
+                ),
+            ],
+            format="csc",
+        )
+        met_ids = self.met_ids.append(pd.Index(new_met_ids))
+        # Hide the isolated species of the host, by removing their rows
+        hidden = met_ids.isin([to_cobra(spe_id) for spe_id in hidden_species])
+        if hidden.any():
+            S = S[np.flatnonzero(~hidden), :]
+            met_ids = met_ids[~hidden]
+        return SparseLP(
+            S=S,
+            rxn_ids=self.rxn_ids.append(pd.Index(rxn_ids)),
+            met_ids=met_ids,
+            lower_bounds=np.concatenate([self.lower_bounds, lower_bounds]),
+            upper_bounds=np.concatenate([self.upper_bounds, upper_bounds]),
+        )
+
+    def set_objective(self, coefficients: Dict[str, float], direction: str = "max"):
+        """Set the objective to the coefficients by reaction ID."""
+        self.objective = np.zeros(len(self.rxn_ids))
+        for rxn_id, coeff in coefficients.items():
+            self.objective[self.rxn_ids.get_loc(rxn_id)] = coeff
+        self.direction = direction
+
+    def set_sbml_objective(self, sbml_model: libsbml_model, objective_id: str):
+        """Set the (FBC) objective objective_id of sbml_model, as set_objective
+        (host module) does for cobra models.
+        """
+        objective = sbml_model.getPlugin("fbc").getObjective(objective_id)
+        self.set_objective(
+            {
+                F_REPLACE[F_REACTION](flux_obj.getReaction()): flux_obj.getCoefficient()
+                for flux_obj in objective.getListOfFluxObjectives()
+            },
+            "min" if objective.getType() == "minimize" else "max",
+        )
+
+    def set_bounds(self, rxn_id: str, lower_bound: float, upper_bound: float):
+        if not self.lower_bounds.flags.writeable:
+            # Shared (e.g. memory-mapped) bounds
+            self.lower_bounds = self.lower_bounds.copy()
+            self.upper_bounds = self.upper_bounds.copy()
+        j = self.rxn_ids.get_loc(rxn_id)
+        self.lower_bounds[j] = lower_bound
+        self.upper_bounds[j] = upper_bound
+
+    def optimize(self) -> cobra_solution:
+        """Solve the LP.
+
+        :raises OptimizationError: If no optimal solution is found, as cobra.Model.optimize(raise_error=True)
+
+        :return: The optimal solution, with the fluxes, the reduced costs and the shadow prices as cobra computes them
+        :rtype: cobra.Solution
+        """
+        # linprog minimises
+        sense = -1 if self.direction == "max" else 1
+        res = linprog(
+            sense * self.objective,
+            A_eq=self.S,
+            b_eq=np.zeros(len(self.met_ids)),
+            bounds=np.column_stack([self.lower_bounds, self.upper_bounds]),
+            method="highs",
+        )
+        status = LINPROG_STATUS.get(res.status, "failed")
+        if status != "optimal":
+            raise OptimizationError(f"solver status is '{status}' ({res.message})")
+        return cobra_solution(
+            objective_value=sense * res.fun,
+            status=status,
+            fluxes=pd.Series(res.x, index=self.rxn_ids, name="fluxes"),
+            # As cobra, the reduced cost of the forward minus the reverse variable
+            reduced_costs=pd.Series(
+                2 * sense * (res.lower.marginals + res.upper.marginals),
+                index=self.rxn_ids,
+                name="reduced_costs",
+            ),
+            shadow_prices=pd.Series(
+                sense * res.eqlin.marginals,
+                index=self.met_ids,
+                name="shadow_prices",
+            ),
+        )
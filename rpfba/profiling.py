@@ -0,0 +1,252 @@
+import cProfile
+import tracemalloc
+from argparse import Namespace as arg_nspace
+from contextlib import contextmanager, nullcontext
+from json import dump as json_dump
+from logging import Logger, getLogger
+from os import environ
+from time import perf_counter, process_time
+from typing import ContextManager, Dict, Iterator, List
+
+# Enable profiling as --profile does: '1' (or 'true', 'yes'), or the JSON
+# file to write the profile into
+PROFILE_ENV = "RPFBA_PROFILE"
+
+_NULL_CONTEXT = nullcontext()
+
+
+class Profiler:
+    """Record the wall time, the CPU time and the peak memory of the stages
+    of the processing of pathways (see stage), once enabled.
+
+    Peak memory is the peak of the Python heap (traced by tracemalloc)
+    during the stage, above its size at the start of the stage. Stages can
+    be nested, e.g. 'solve' within 'simulate'. One stage can also be run
+    under cProfile, its statistics being accumulated over all its runs.
+    Records and statistics of other processes (e.g. batch workers) are
+    merged with those of the current process by merge.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.cprofile_stage = None
+        self.__records = []
+        self.__pathway = None
+        # Peaks of the running stages (innermost last)
+        self.__peaks = []
+        self.__cprofile = None
+        self.__cstats = []
+
+    def enable(self, cprofile_stage: str = None) -> None:
+        """Start recording stages, under cProfile for cprofile_stage if given."""
+        self.enabled = True
+        self.cprofile_stage = cprofile_stage
+        if cprofile_stage is not None:
+            self.__cprofile = cProfile.Profile()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self) -> None:
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def stage(self, name: str) -> ContextManager:
+        """Return the context recording the stage name, a no-op one if the
+        profiler is disabled.
+        """
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self.__stage(name)
+
+    @contextmanager
+    def __stage(self, name: str) -> Iterator[None]:
+        current, peak = tracemalloc.get_traced_memory()
+        # Keep the peak reached so far by the outer stages
+        self.__peaks = [max(p, peak) for p in self.__peaks]
+        self.__peaks.append(current)
+        tracemalloc.reset_peak()
+        profile = self.__cprofile if name == self.cprofile_stage else None
+        if profile is not None:
+            profile.enable()
+        wall, cpu = perf_counter(), process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = perf_counter() - wall, process_time() - cpu
+            if profile is not None:
+                profile.disable()
+            peak = max(self.__peaks.pop(), tracemalloc.get_traced_memory()[1])
+            self.__peaks = [max(p, peak) for p in self.__peaks]
+            self.__records.append(
+                {
+                    "pathway": self.__pathway,
+                    "stage": name,
+                    "wall": wall,
+                    "cpu": cpu,
+                    "peak_memory": peak - current,
+                }
+            )
+
+    @contextmanager
+    def pathway(self, name: str) -> Iterator[None]:
+        """Attach the stages run within the context to the pathway name."""
+        pathway, self.__pathway = self.__pathway, name
+        try:
+            yield
+        finally:
+            self.__pathway = pathway
+
+    def drain(self) -> Dict:
+        """Return the records and the cProfile statistics collected since
+        the last call, to be merged into another profiler, None if the
+        profiler is disabled.
+        """
+        if not self.enabled:
+            return None
+        profile = {"records": self.__records, "cprofile": None}
+        self.__records = []
+        if self.__cprofile is not None:
+            self.__cprofile.create_stats()
+            profile["cprofile"] = self.__cprofile.stats
+            self.__cprofile = cProfile.Profile()
+        return profile
+
+    def merge(self, profile: Dict) -> None:
+        """Merge the records and cProfile statistics returned by drain."""
+        if profile is None:
+            return
+        self.__records += profile["records"]
+        if profile["cprofile"] is not None:
+            self.__cstats.append(profile["cprofile"])
+
+    def records(self) -> List[Dict]:
+        return list(self.__records)
+
+    def summary(self) -> Dict[str, Dict]:
+        """Return, by stage, the number of runs, the total, mean and maximal
+        wall time (s), the total CPU time (s) and the maximal peak memory
+        (bytes), stages being sorted by decreasing total wall time.
+        """
+        stages = {}
+        for record in self.__records:
+            stage = stages.setdefault(
+                record["stage"],
+                {
+                    "calls": 0,
+                    "wall": 0.0,
+                    "wall_max": 0.0,
+                    "cpu": 0.0,
+                    "peak_memory": 0,
+                },
+            )
+            stage["calls"] += 1
+            stage["wall"] += record["wall"]
+            stage["wall_max"] = max(stage["wall_max"], record["wall"])
+            stage["cpu"] += record["cpu"]
+            stage["peak_memory"] = max(stage["peak_memory"], record["peak_memory"])
+        for stage in stages.values():
+            stage["wall_mean"] = stage["wall"] / stage["calls"]
+        return dict(sorted(stages.items(), key=lambda item: -item[1]["wall"]))
+
+    def format_summary(self) -> str:
+        """Return the summary as a table."""
+        pathways = {r["pathway"] for r in self.__records if r["pathway"] is not None}
+        lines = [
+            f"Profile over {len(pathways)} pathway(s) (nested stages included in outer ones)",
+            f"{'stage':<20} {'calls':>7} {'wall (s)':>10} {'mean (s)':>10} "
+            + f"{'max (s)':>10} {'cpu (s)':>10} {'peak (MB)':>10}",
+        ]
+        for name, stage in self.summary().items():
+            lines.append(
+                f"{name:<20} {stage['calls']:>7} {stage['wall']:>10.3f} "
+                + f"{stage['wall_mean']:>10.4f} {stage['wall_max']:>10.4f} "
+                + f"{stage['cpu']:>10.3f} {stage['peak_memory'] / 1024**2:>10.1f}"
+            )
+        return "\n".join(lines)
+
+    def write_json(self, outfile: str) -> None:
+        with open(outfile, "w") as f:
+            json_dump({"summary": self.summary(), "records": self.__records}, f)
+
+    def dump_cprofile(self, outfile: str) -> None:
+        """Write the cProfile statistics of the profiled stage, merged over
+        all the processes, into outfile (to be read by pstats, snakeviz...).
+        """
+        # pstats (and its dependencies) is only needed here
+        import pstats
+
+        self.merge(self.drain())
+        stats = pstats.Stats()
+        for cstats in self.__cstats:
+            stats.add(_StatsHolder(cstats))
+        stats.dump_stats(outfile)
+
+
+class _StatsHolder:
+    # What pstats.Stats loads statistics from, as a cProfile.Profile
+    def __init__(self, stats: Dict):
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+
+# Profiler of the current process
+PROFILER = Profiler()
+
+
+def stage(name: str) -> ContextManager:
+    """Return the context recording the stage name with PROFILER."""
+    return PROFILER.stage(name)
+
+
+def profile_output(args: arg_nspace) -> str:
+    """Return the JSON file to write the profile into ('' if none), None
+    if profiling is not requested, by args.profile or PROFILE_ENV.
+    """
+    profile = getattr(args, "profile", None)
+    if profile is None:
+        profile = environ.get(PROFILE_ENV, "")
+        if profile.lower() in ("", "0", "false", "no"):
+            return None
+        if profile.lower() in ("1", "true", "yes"):
+            return ""
+    return profile
+
+
+def setup_profiler(args: arg_nspace) -> bool:
+    """Enable PROFILER if requested by args or PROFILE_ENV.
+
+    :return: Whether profiling is enabled
+    :rtype: bool
+    """
+    if profile_output(args) is None:
+        return False
+    PROFILER.enable(cprofile_stage=getattr(args, "profile_stage", None))
+    return True
+
+
+def report_profile(
+    args: arg_nspace,
+    logger: Logger = getLogger(__name__),
+) -> None:
+    """Log the summary of PROFILER and write the profile into the JSON file
+    and the cProfile statistics into the file requested by args, if any.
+    """
+    if not PROFILER.enabled:
+        return
+    logger.info(PROFILER.format_summary())
+    outfile = profile_output(args)
+    if outfile:
+        PROFILER.write_json(outfile)
+        logger.info(f"Profile written in {outfile}")
+    if PROFILER.cprofile_stage is not None:
+        outfile = (
+            getattr(args, "profile_stage_out", None)
+            or f"rpfba_{PROFILER.cprofile_stage}.prof"
+        )
+        PROFILER.dump_cprofile(outfile)
+        logger.info(
+            f"cProfile statistics of '{PROFILER.cprofile_stage}' written in {outfile}"
+        )
@@ -0,0 +1,150 @@
+from json import dumps as json_dumps
+from logging import Logger, getLogger
+from os import makedirs
+from os import path as os_path
+from typing import Dict, Iterator
+
+PARQUET_COLUMNS = ["name", "entity", "id", "key", "value", "units"]
+
+
+class ResultsWriter:
+    """Stream the results of pathways, as built by build_results, into a
+    JSON Lines file (one record per pathway) or, if outfile ends with
+    .parquet, into a Parquet file (one row per value, see results_to_rows).
+
+    JSON Lines records are flushed as soon as they are written, so that the
+    file holds every pathway processed so far even if the process crashes.
+    Parquet rows are buffered and written as a row group every
+    row_group_size pathways, the file being readable once closed.
+    """
+
+    def __init__(
+        self,
+        outfile: str,
+        row_group_size: int = 100,
+        logger: Logger = getLogger(__name__),
+    ):
+        self.outfile = outfile
+        self.row_group_size = row_group_size
+        self.logger = logger
+        self.__rows = []
+        self.__nb_pending = 0
+        dirname = os_path.dirname(outfile)
+        if dirname != "":
+            makedirs(dirname, exist_ok=True)
+        if outfile.lower().endswith(".parquet"):
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise ImportError(
+                    f"pyarrow is required to write Parquet results ({outfile})"
+                )
+            self.__pa = pyarrow
+            self.__schema = pyarrow.schema(
+                [
+                    ("name", pyarrow.string()),
+                    ("entity", pyarrow.string()),
+                    ("id", pyarrow.string()),
+                    ("key", pyarrow.string()),
+                    ("value", pyarrow.float64()),
+                    ("units", pyarrow.string()),
+                ]
+            )
+            self.__parquet = pyarrow.parquet.ParquetWriter(outfile, self.__schema)
+            self.__jsonl = None
+        else:
+            self.__parquet = None
+            self.__jsonl = open(outfile, "w")
+
+    def write(self, name: str, results: Dict) -> None:
+        """Write the results of the pathway name.
+
+        :param name: The name of the pathway (e.g. its file name)
+        :param results: The results, as returned by build_results
+
+        :type name: str
+        :type results: Dict
+        """
+        if self.__jsonl is not None:
+            self.__jsonl.write(
+                json_dumps(results_to_record(name, results), default=float) + "\n"
+            )
+            self.__jsonl.flush()
+            return
+        self.__rows += list(results_to_rows(name, results))
+        self.__nb_pending += 1
+        if self.__nb_pending >= self.row_group_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.__parquet is not None and self.__rows:
+            self.__parquet.write_table(
+                self.__pa.Table.from_pylist(self.__rows, schema=self.__schema)
+            )
+            self.__rows = []
+            self.__nb_pending = 0
+
+    def close(self) -> None:
+        if self.__jsonl is not None:
+            self.__jsonl.close()
+        if self.__parquet is not None:
+            self.flush()
+            self.__parquet.close()
+        self.logger.info(f"Results written in {self.outfile}")
+
+    def __enter__(self) -> "ResultsWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def results_to_record(name: str, results: Dict) -> Dict:
+    """Return the JSON record of the results of the pathway name, i.e.
+    the results with the name of the pathway.
+    """
+    return {
+        "name": name,
+        "pathway": results["pathway"],
+        "reactions": results["reactions"],
+        "species": results["species"],
+        "ignored_species": list(results["ignored_species"]),
+    }
+
+
+def results_to_rows(name: str, results: Dict) -> Iterator[Dict]:
+    """Yield the results of the pathway name as flat rows, with the
+    columns PARQUET_COLUMNS:
+        - 'entity' is 'pathway', 'reaction', 'species' or 'ignored_species',
+        - 'id' is the ID of the reaction or the species (None for the pathway),
+        - 'key' is the simulation type (e.g. 'fraction', 'biomass_shadow_price').
+    """
+    for key, score in results["pathway"].items():
+        yield _row(name, "pathway", None, key, score)
+    for entity, scores in (
+        ("reaction", results["reactions"]),
+        ("species", results["species"]),
+    ):
+        for _id, _scores in scores.items():
+            for key, score in _scores.items():
+                yield _row(name, entity, _id, key, score)
+    for spe_id in results["ignored_species"]:
+        yield dict(zip(PARQUET_COLUMNS, [name, "ignored_species", spe_id] + 3 * [None]))
+
+
+def _row(name: str, entity: str, _id: str, key: str, score: Dict) -> Dict:
+    value = score.get("value")
+    return dict(
+        zip(
+            PARQUET_COLUMNS,
+            [
+                name,
+                entity,
+                _id,
+                key,
+                None if value is None else float(value),
+                score.get("units"),
+            ],
+        )
+    )
@@ -0,0 +1,283 @@
+from argparse import Namespace as arg_nspace
+from concurrent.futures import ProcessPoolExecutor, wait
+from contextlib import ExitStack
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps as json_dumps
+from logging import Logger, getLevelName, getLogger
+from os import path as os_path
+from os import remove
+from socketserver import ThreadingMixIn, UnixStreamServer
+from tempfile import TemporaryDirectory
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from brs_utils import create_logger
+
+from .Args import ENGINES, SIM_TYPES
+from .batch import _process_pathway
+from .cache import open_cache
+from .host import HostModel, shared_snapshot
+from .results import results_to_record
+
+
+def choice(choices: List[str]) -> Callable[[str], str]:
+    """Return the type of the arguments restricted to choices."""
+
+    def _choice(value: str) -> str:
+        if value not in choices:
+            raise ValueError(f"invalid choice: {value} (choose from {choices})")
+        return value
+
+    return _choice
+
+
+def pathway_name(value: str) -> str:
+    """Return the file name of the pathway named value by request."""
+    name = os_path.basename(value)
+    if name in ("", ".", ".."):
+        raise ValueError(f"invalid pathway name: {value!r}")
+    return name
+
+
+def content_length(value: str) -> int:
+    """Return the length of the request body, from its Content-Length."""
+    try:
+        length = int(value)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise ValueError(f"invalid Content-Length: {value!r}")
+    return length
+
+
+# Simulation arguments which can be set by request (query parameters)
+REQUEST_ARGS = {
+    "compartment_id": str,
+    "objective_rxn_id": str,
+    "biomass_rxn_id": str,
+    "sim": choice(SIM_TYPES),
+    "fraction_of": float,
+    "engine": choice(ENGINES),
+}
+
+
+def parse_models(models: List[str]) -> Dict[str, str]:
+    """Return the paths of the model files by name, from 'name=path' or
+    'path' items (named after the file name without extension).
+    """
+    paths = {}
+    for model in models:
+        name, sep, path = model.partition("=")
+        if not sep:
+            path = model
+            name = os_path.basename(model).split(".")[0]
+        paths[name] = path
+    return paths
+
+
+class FBARequestHandler(BaseHTTPRequestHandler):
+    """Handle the requests to the FBA service:
+    - GET /models: the names of the preloaded models,
+    - POST /fba?model=<name>[&name=<file name>][&sbml=1][&<simulation argument>=<value>]:
+      simulate the pathway rpSBML sent as body and return its results
+      (as records of ResultsWriter) and, if sbml is set, the annotated
+      pathway rpSBML.
+    """
+
+    def do_GET(self) -> None:
+        path = urlparse(self.path).path
+        if path == "/models":
+            self._send_json(200, list(self.server.models))
+        elif path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": f"Unknown path {path}"})
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        if url.path != "/fba":
+            self._send_json(404, {"error": f"Unknown path {url.path}"})
+            return
+        params = {
+            k: v[-1] for k, v in parse_qs(url.query, keep_blank_values=True).items()
+        }
+        model = params.get("model", next(iter(self.server.models)))
+        if model not in self.server.models:
+            self._send_json(404, {"error": f"Unknown model {model}"})
+            return
+        try:
+            overrides = {
+                arg: _type(params[arg])
+                for arg, _type in REQUEST_ARGS.items()
+                if arg in params
+            }
+            name = pathway_name(params.get("name", "pathway.xml"))
+            length = content_length(self.headers.get("Content-Length", "0"))
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        content = self.rfile.read(length)
+
+        future = self.server.executor.submit(
+            _process_in_worker, model, name, content, overrides
+        )
+        content, results = future.result()
+        if results is None:
+            self._send_json(422, {"error": f"{name} cannot be processed"})
+            return
+        response = {"model": model, **results_to_record(name, results)}
+        if params.get("sbml", "").lower() in ("1", "true", "yes"):
+            response["sbml"] = content.decode()
+        self._send_json(200, response)
+
+    def _send_json(self, code: int, content) -> None:
+        body = json_dumps(content, default=float).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, format: str, *args) -> None:
+        self.server.logger.debug(f"{self.address_string()} - {format % args}")
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self) -> None:
+        UnixStreamServer.server_bind(self)
+        # As HTTPServer does, for BaseHTTPRequestHandler
+        self.server_name = self.server_address
+        self.server_port = 0
+
+
+def create_server(
+    args: arg_nspace,
+    logger: Logger = getLogger(__name__),
+) -> ThreadingHTTPServer:
+    """Preload the models args.models into args.jobs worker processes and
+    return the server of FBA requests (see FBARequestHandler), over HTTP on
+    args.host and args.port, or on the Unix socket args.socket.
+
+    :param args: The arguments, as parsed from the command line
+    :param logger: The logger object
+
+    :type args: Namespace
+    :type logger: Logger
+
+    :return: The server, its worker pool being server.executor
+    :rtype: ThreadingHTTPServer
+    """
+    models = parse_models(args.models)
+    # The workers load the GEMs from the same snapshots, removed on close
+    # if temporary
+    snapshots_stack = ExitStack()
+    snapshots = {
+        name: snapshots_stack.enter_context(
+            shared_snapshot(
+                path,
+                getattr(args, "snapshot", None),
+                args.jobs,
+                getattr(args, "engine", "cobra"),
+                logger,
+            )
+        )
+        for name, path in models.items()
+    }
+    executor = ProcessPoolExecutor(
+        max_workers=args.jobs,
+        initializer=_init_worker,
+        initargs=(args, models, snapshots, getLevelName(logger.getEffectiveLevel())),
+    )
+    # Start (and warm) the workers before accepting requests
+    logger.info(f"Preloading {', '.join(models)} into {args.jobs} worker(s)...")
+    wait([executor.submit(_warm_worker) for _ in range(args.jobs)])
+
+    if args.socket:
+        server = ThreadingUnixHTTPServer(args.socket, FBARequestHandler)
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), FBARequestHandler)
+    server.models = models
+    server.executor = executor
+    server.snapshots = snapshots_stack
+    server.logger = logger
+    return server
+
+
+def close_server(server: ThreadingHTTPServer) -> None:
+    """Close the server created by create_server and stop its workers."""
+    server.server_close()
+    server.executor.shutdown()
+    server.snapshots.close()
+    if isinstance(server, ThreadingUnixHTTPServer):
+        remove(server.server_address)
+
+
+def serve(
+    args: arg_nspace,
+    logger: Logger = getLogger(__name__),
+) -> None:
+    """Serve FBA requests until interrupted, see create_server."""
+    server = create_server(args, logger)
+    if args.socket:
+        logger.info(f"Serving FBA on {args.socket}")
+    else:
+        logger.info(f"Serving FBA on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_server(server)
+
+
+# Worker-local state, set by _init_worker in each process of the pool
+_worker = {}
+
+
+def _init_worker(
+    args: arg_nspace, models: Dict[str, str], snapshots: Dict[str, str], log_level: str
+) -> None:
+    logger = create_logger(__name__, log_level)
+    _worker["args"] = args
+    _worker["logger"] = logger
+    _worker["cache"] = open_cache(args, logger)
+    _worker["hosts"] = {}
+    for name, path in models.items():
+        host = HostModel(model_file=path, logger=logger, snapshot=snapshots[name])
+        # Build the cobra model (and its solver), or the LP of the 'scipy'
+        # engine which shares the arrays of the snapshot, and the host
+        # indices now
+        if getattr(args, "engine", "cobra") == "scipy":
+            host.get_sparse_lp()
+        else:
+            host.get_cobra_model()
+        host.get_species_incidence()
+        _worker["hosts"][name] = host
+
+
+def _warm_worker() -> None:
+    return None
+
+
+def _process_in_worker(
+    model: str, name: str, content: bytes, overrides: Dict
+) -> Tuple[bytes, Dict]:
+    args = arg_nspace(**{**vars(_worker["args"]), **overrides})
+    with TemporaryDirectory() as tmp_d:
+        path = os_path.join(tmp_d, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return _process_pathway(
+            name,
+            path,
+            args,
+            _worker["hosts"][model],
+            _worker["cache"],
+            _worker["logger"],
+        )
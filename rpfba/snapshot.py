@@ -0,0 +1,146 @@
+import struct
+from hashlib import sha256
+from mmap import ACCESS_READ, mmap
+from os import path as os_path
+from os import remove, replace
+from json import dumps as json_dumps
+from json import loads as json_loads
+from tempfile import NamedTemporaryFile
+from typing import Dict, Tuple
+
+import numpy as np
+
+from ._version import __version__
+
+SNAPSHOT_MAGIC = b"RPFBA-SNAPSHOT-4\n"
+SNAPSHOT_SUFFIX = ".snapshot"
+# Alignment (bytes) of the arrays within the snapshot file
+ALIGNMENT = 64
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def default_snapshot(model_file: str) -> str:
+    """Return the default snapshot file of model_file, next to it."""
+    return model_file + SNAPSHOT_SUFFIX
+
+
+def file_digest(filename: str) -> str:
+    """Return the SHA-256 hash of the content of filename."""
+    h = sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1024**2), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_snapshot(
+    outfile: str,
+    source: str,
+    data: Dict,
+    arrays: Dict[str, np.ndarray],
+) -> None:
+    """Write the snapshot of the model file source into outfile: data
+    (JSON, sets being written as sorted lists and tuples as lists) and
+    arrays (raw, to be memory-mapped by read_snapshot), with the hash of
+    source and the version of rpfba they are valid for. Snapshots hold no
+    code, so that loading one cannot execute any.
+
+    The snapshot is written into a temporary file which then replaces
+    outfile, so that processes reading outfile meanwhile are not affected.
+
+    :param outfile: The snapshot file
+    :param source: The model file the snapshot is built from
+    :param data: The data (JSON serializable, sets included)
+    :param arrays: The arrays, by name
+
+    :type outfile: str
+    :type source: str
+    :type data: Dict
+    :type arrays: Dict[str, np.ndarray]
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = (array.dtype.str, array.shape, offset)
+        offset += _aligned(array.nbytes)
+    header = json_dumps(
+        {
+            "version": __version__,
+            "source_digest": file_digest(source),
+            "arrays": layout,
+            "data": data,
+        },
+        default=sorted,
+    ).encode()
+    with NamedTemporaryFile(
+        dir=os_path.dirname(os_path.abspath(outfile)), delete=False
+    ) as f:
+        try:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(header)
+            f.write(bytes(_aligned(f.tell()) - f.tell()))
+            for array in arrays.values():
+                f.write(array.tobytes())
+                f.write(bytes(_aligned(array.nbytes) - array.nbytes))
+        except Exception:
+            f.close()
+            remove(f.name)
+            raise
+    replace(f.name, outfile)
+
+
+def read_snapshot(
+    infile: str,
+    source: str,
+) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    """Return the data and the arrays of the snapshot infile of the model
+    file source, arrays being memory-mapped (read-only).
+
+    :param infile: The snapshot file
+    :param source: The model file the snapshot has been built from
+
+    :type infile: str
+    :type source: str
+
+    :raises SnapshotError: If infile is not a snapshot, or is stale, i.e. built from another content of source or by another version of rpfba
+
+    :return: The data and the arrays, by name
+    :rtype: Tuple[Dict, Dict[str, np.ndarray]]
+    """
+    with open(infile, "rb") as f:
+        try:
+            # The mapping outlives the file object
+            buffer = mmap(f.fileno(), 0, access=ACCESS_READ)
+        except ValueError:
+            raise SnapshotError(f"{infile} is empty")
+    start = len(SNAPSHOT_MAGIC) + 8
+    if buffer[: len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC or len(buffer) < start:
+        raise SnapshotError(f"{infile} is not an rpfba snapshot")
+    (size,) = struct.unpack_from("<Q", buffer, len(SNAPSHOT_MAGIC))
+    try:
+        header = json_loads(buffer[start : start + size])
+    except ValueError as e:
+        raise SnapshotError(f"{infile} is corrupted ({e})")
+    if header["version"] != __version__:
+        raise SnapshotError(f"{infile} has been built by rpfba {header['version']}")
+    if header["source_digest"] != file_digest(source):
+        raise SnapshotError(f"{source} has changed since {infile} has been built")
+    start = _aligned(start + size)
+    arrays = {}
+    for name, (dtype, shape, offset) in header["arrays"].items():
+        count = int(np.prod(shape))
+        arrays[name] = (
+            np.frombuffer(buffer, dtype=dtype, count=count, offset=start + offset)
+            if count
+            else np.empty(0, dtype=dtype)
+        ).reshape(shape)
+    return header["data"], arrays
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
@@ -0,0 +1,159 @@
+import asyncio
+from argparse import Namespace
+from json import load as json_load
+from json import loads as json_loads
+from os import listdir
+from os import path as os_path
+from tarfile import open as tar_open
+from zipfile import ZipFile
+
+from main_rpfba import Main_rpfba
+
+from rpfba.aio import run_fba_many
+from rpfba.batch import iter_pathway_files, run_batch
+from rpfba.profiling import PROFILER
+
+
+class Test_batch(Main_rpfba):
+    def setUp(self):
+        super().setUp()
+        input_zip = ZipFile(self.cr_path)
+        self.pathways_d = os_path.join(self.temp_d, "cr_fba")
+        input_zip.extractall(path=self.pathways_d)
+        self.names = sorted(listdir(self.pathways_d))
+        self.archive = os_path.join(self.temp_d, "pathways.tar.xz")
+        with tar_open(self.archive, mode="w:xz") as archive:
+            for name in self.names:
+                archive.add(os_path.join(self.pathways_d, name), arcname=name)
+
+    def tearDown(self):
+        super().tearDown()
+
+    def _args(self, pathways, outpath, jobs=1, results=None):
+        return Namespace(
+            pathways=pathways,
+            model_file=self.e_coli_model_path,
+            compartment_id="c",
+            outpath=outpath,
+            biomass_rxn_id="biomass",
+            objective_rxn_id="rxn_target",
+            with_orphan_species=False,
+            sim="fraction",
+            fraction_of=0.75,
+            cobra_from_file=False,
+            fraction_sweep=None,
+            pareto_tolerance=0.01,
+            pareto_max_points=20,
+            results=results,
+            jobs=jobs,
+        )
+
+    def test_iter_pathway_files(self):
+        for pathways in [
+            [self.pathways_d],
+            [os_path.join(self.pathways_d, "*.xml")],
+            [self.archive],
+        ]:
+            self.assertListEqual(
+                [name for name, path in iter_pathway_files(pathways)], self.names
+            )
+
+    def test_duplicate_names(self):
+        name = self.names[0]
+        # Archive members sharing a file name, in different folders
+        archive = os_path.join(self.temp_d, "folders.tar")
+        with tar_open(archive, mode="w") as f:
+            for folder in ("a", "b"):
+                f.add(os_path.join(self.pathways_d, name), arcname=f"{folder}/{name}")
+        self.assertListEqual(
+            [_name for _name, path in iter_pathway_files([archive])],
+            [f"a/{name}", f"b/{name}"],
+        )
+        # Files sharing a file name, made unique
+        stem, ext = os_path.splitext(name)
+        self.assertListEqual(
+            [
+                _name
+                for _name, path in iter_pathway_files(
+                    [os_path.join(self.pathways_d, name)] * 3
+                )
+            ],
+            [name, f"{stem}_2{ext}", f"{stem}_3{ext}"],
+        )
+        for outpath in ("out", "out.tar"):
+            outpath = os_path.join(self.temp_d, outpath)
+            status = run_batch(args=self._args([archive], outpath), logger=self.logger)
+            self.assertListEqual(status["processed"], [f"a/{name}", f"b/{name}"])
+        self.assertTrue(os_path.exists(os_path.join(self.temp_d, "out", "b", name)))
+        with tar_open(outpath) as f:
+            self.assertListEqual(f.getnames(), [f"a/{name}", f"b/{name}"])
+
+    def test_run_batch_archive(self):
+        outpath = os_path.join(self.temp_d, "out", "pathways.tar.xz")
+        status = run_batch(args=self._args([self.archive], outpath), logger=self.logger)
+        self.assertListEqual(status["processed"], self.names)
+        self.assertListEqual(status["failed"], [])
+        with tar_open(outpath) as archive:
+            self.assertListEqual(sorted(archive.getnames()), self.names)
+
+    def test_run_batch_directory(self):
+        outpath = os_path.join(self.temp_d, "out")
+        status = run_batch(
+            args=self._args([self.pathways_d], outpath), logger=self.logger
+        )
+        self.assertListEqual(status["processed"], self.names)
+        self.assertListEqual(sorted(listdir(outpath)), self.names)
+
+    def test_run_batch_jobs(self):
+        outpath = os_path.join(self.temp_d, "out.tar")
+        status = run_batch(
+            args=self._args([self.archive], outpath, jobs=2), logger=self.logger
+        )
+        self.assertListEqual(sorted(status["processed"]), self.names)
+        with tar_open(outpath) as archive:
+            self.assertListEqual(sorted(archive.getnames()), self.names)
+
+    def test_run_batch_results(self):
+        outpath = os_path.join(self.temp_d, "out")
+        results = os_path.join(self.temp_d, "results.jsonl")
+        run_batch(
+            args=self._args([self.pathways_d], outpath, results=[results]),
+            logger=self.logger,
+        )
+        with open(results) as f:
+            records = [json_loads(line) for line in f]
+        self.assertListEqual([record["name"] for record in records], self.names)
+        self.assertIn("fraction", records[0]["pathway"])
+
+    def test_run_fba_many(self):
+        async def run():
+            return [
+                processed
+                async for processed in run_fba_many(
+                    iter_pathway_files([self.archive]),
+                    self.e_coli_model_path,
+                    self._args([], None),
+                    jobs=2,
+                    max_pending=1,
+                )
+            ]
+
+        processed = asyncio.run(run())
+        self.assertListEqual(sorted(name for name, _, _ in processed), self.names)
+        for name, content, results in processed:
+            self.assertIn(b"fba_fraction", content)
+            self.assertIn("fraction", results["pathway"])
+
+    def test_run_batch_profile(self):
+        outpath = os_path.join(self.temp_d, "out")
+        args = self._args([self.pathways_d], outpath, jobs=2)
+        args.profile = os_path.join(self.temp_d, "profile.json")
+        try:
+            run_batch(args=args, logger=self.logger)
+        finally:
+            PROFILER.disable()
+        with open(args.profile) as f:
+            profile = json_load(f)
+        self.assertEqual(profile["summary"]["pathway"]["calls"], len(self.names))
+        for stage in ("parse_pathway", "merge", "solve", "write_pathway"):
+            self.assertIn(stage, profile["summary"])
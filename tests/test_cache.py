@@ -0,0 +1,140 @@
+import sqlite3
+from os import path as os_path
+from pickle import dumps as pickle_dumps
+from types import SimpleNamespace
+from zipfile import ZipFile
+from zlib import compress
+
+import numpy as np
+import pandas as pd
+from cobra import Solution
+
+from main_rpfba import Main_rpfba
+
+from rpfba.cache import CACHE_FILENAME, ResultsCache, simulation_key
+from rpfba.fba import run_pathway
+
+
+def solution(seed: int) -> Solution:
+    """Return a Solution of random (incompressible) fluxes."""
+    fluxes = np.random.default_rng(seed).random(100)
+    return Solution(
+        objective_value=float(seed),
+        status="optimal",
+        fluxes=pd.Series(fluxes, index=[f"R_{i}" for i in range(100)]),
+    )
+
+
+class Tampered:
+    """Create a file once unpickled."""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+
+    def __reduce__(self):
+        return (open, (self.filename, "w"))
+
+
+class Test_cache(Main_rpfba):
+    def setUp(self):
+        super().setUp()
+        input_zip = ZipFile(self.cr_path)
+        input_zip.extractall(path=os_path.join(self.temp_d, "cr_fba"))
+        self.cache_dir = os_path.join(self.temp_d, "cache")
+
+    def tearDown(self):
+        super().tearDown()
+
+    def test_lru_eviction(self):
+        cache = ResultsCache(self.cache_dir, max_size=3000, logger=self.logger)
+        for i in range(5):
+            cache.put(f"key_{i}", {"fraction": solution(i)})
+        # Refresh key_3, so that key_2 is the least recently used one
+        self.assertIsNotNone(cache.get("key_3"))
+        cache.put("key_5", {"fraction": solution(5)})
+        self.assertIsNone(cache.get("key_2"))
+        self.assertIsNotNone(cache.get("key_3"))
+        stats = cache.stats()
+        self.assertLessEqual(stats["size"], 3000)
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 1)
+        cache.close()
+
+    def test_encoded_results(self):
+        cache = ResultsCache(self.cache_dir, logger=self.logger)
+        results = {"biomass": solution(1), "fraction": solution(2)}
+        cache.put("key", results)
+        cached = cache.get("key")
+        for sim_type, _solution in results.items():
+            self.assertEqual(
+                cached[sim_type].objective_value, _solution.objective_value
+            )
+            self.assertEqual(cached[sim_type].status, _solution.status)
+            pd.testing.assert_series_equal(
+                cached[sim_type].fluxes, _solution.fluxes, check_names=False
+            )
+            self.assertIsNone(cached[sim_type].shadow_prices)
+        cache.close()
+
+    def test_tampered_results(self):
+        cache = ResultsCache(self.cache_dir, logger=self.logger)
+        cache.put("key", {"fraction": solution(1)})
+        # Replaced by a pickle, which would create a file once loaded
+        filename = os_path.join(self.temp_d, "tampered")
+        with sqlite3.connect(os_path.join(self.cache_dir, CACHE_FILENAME)) as db:
+            db.execute(
+                "UPDATE results SET value = ? WHERE key = ?",
+                (compress(pickle_dumps({"fraction": Tampered(filename)})), "key"),
+            )
+        # Rejected, and removed
+        self.assertIsNone(cache.get("key"))
+        self.assertFalse(os_path.exists(filename))
+        stats = cache.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["entries"], 0)
+        cache.close()
+
+    def test_simulation_key(self):
+        key = simulation_key(self.rpsbml, [], sim_type="fraction", fraction_coeff=0.75)
+        self.assertEqual(
+            key,
+            simulation_key(self.rpsbml, [], sim_type="fraction", fraction_coeff=0.75),
+        )
+        self.assertNotEqual(
+            key,
+            simulation_key(self.rpsbml, [], sim_type="fraction", fraction_coeff=0.5),
+        )
+        # Bounds are part of the key
+        rxn = self.rpsbml.getModel().getReaction(0)
+        param_id = rxn.getPlugin("fbc").getLowerFluxBound()
+        self.rpsbml.getModel().getParameter(param_id).setValue(-12.34)
+        self.assertNotEqual(
+            key,
+            simulation_key(self.rpsbml, [], sim_type="fraction", fraction_coeff=0.75),
+        )
+
+    def test_run_pathway_cache(self):
+        args = SimpleNamespace(
+            pathway_file=os_path.join(self.temp_d, "cr_fba", "rp_002_0001.xml"),
+            model_file=self.e_coli_model_path,
+            compartment_id="c",
+            biomass_rxn_id="biomass",
+            objective_rxn_id="rxn_target",
+            with_orphan_species=False,
+            sim="fraction",
+            fraction_of=0.75,
+            merge="",
+            cobra_from_file=False,
+            fraction_sweep=None,
+            pareto_tolerance=0.01,
+            pareto_max_points=20,
+        )
+        cache = ResultsCache(self.cache_dir, logger=self.logger)
+        results = [
+            run_pathway(args=args, cache=cache, logger=self.logger)[1] for i in range(2)
+        ]
+        self.assertDictEqual(results[0]["pathway"], results[1]["pathway"])
+        stats = cache.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 1)
+        cache.close()
@@ -0,0 +1,72 @@
+import sys
+from os import path as os_path
+from subprocess import run
+from typing import Dict
+
+from main_rpfba import Main_rpfba
+
+# Modules only imported once a code path needs them
+DEFERRED_MODULES = ["cobra", "optlang", "pandas", "libsbml", "rplibs", "scipy"]
+# Cumulative import time of rpfba (and its light modules), in seconds
+IMPORT_TIME_BUDGET = 0.25
+
+
+def import_times(code: str) -> Dict[str, float]:
+    """Return the cumulative import time (s) of the modules imported by
+    running code, as reported by python -X importtime.
+    """
+    proc = run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os_path.dirname(os_path.dirname(os_path.abspath(__file__))),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, module = line[len("import time:") :].split("|")
+        # Header line
+        if not cumulative.strip().isdigit():
+            continue
+        times[module.strip()] = int(cumulative) / 10**6
+    return times
+
+
+class Test_import_time(Main_rpfba):
+    def assertNotImported(self, times: Dict[str, float], modules):
+        imported = {module.split(".")[0] for module in times} | set(times)
+        for module in modules:
+            self.assertNotIn(module, imported)
+
+    def test_import_rpfba(self):
+        times = import_times("import rpfba, rpfba.Args, rpfba.profiling")
+        self.assertNotImported(times, DEFERRED_MODULES)
+        self.assertLessEqual(
+            sum(times[module] for module in ("rpfba", "rpfba.Args", "rpfba.profiling")),
+            IMPORT_TIME_BUDGET,
+        )
+
+    def test_import_cli(self):
+        # Simulation modules are imported once the arguments are parsed
+        times = import_times("import rpfba.__main__")
+        self.assertNotImported(
+            times,
+            [
+                "rpfba.fba",
+                "rpfba.host",
+                "rpfba.batch",
+                "rpfba.serve",
+                "rpfba.profiling",
+                "brs_utils",
+                "cobra",
+            ],
+        )
+
+    def test_lazy_runFBA(self):
+        import rpfba
+        from rpfba.fba import runFBA
+
+        self.assertIs(rpfba.runFBA, runFBA)
+        self.assertFalse(hasattr(rpfba, "unknown"))
@@ -0,0 +1,66 @@
+from argparse import Namespace
+from json import load as json_load
+from os import path as os_path
+from pstats import Stats
+
+from main_rpfba import Main_rpfba
+
+from rpfba.profiling import Profiler, profile_output
+
+
+class Test_profiling(Main_rpfba):
+    def setUp(self):
+        super().setUp()
+        self.profiler = Profiler()
+        self.profiler.enable(cprofile_stage="solve")
+
+    def tearDown(self):
+        self.profiler.disable()
+        super().tearDown()
+
+    def test_nested_stages(self):
+        with self.profiler.pathway("rp_001"), self.profiler.stage("simulate"):
+            outer = [0] * 10**6
+            with self.profiler.stage("solve"):
+                inner = [0] * 10**6
+                del inner
+            del outer
+        records = {r["stage"]: r for r in self.profiler.records()}
+        self.assertEqual(records["solve"]["pathway"], "rp_001")
+        self.assertGreaterEqual(records["simulate"]["wall"], records["solve"]["wall"])
+        # The peak of the inner stage is part of the peak of the outer one
+        self.assertGreater(
+            records["simulate"]["peak_memory"], records["solve"]["peak_memory"]
+        )
+        self.assertGreater(records["solve"]["peak_memory"], 10**6)
+
+    def test_merge(self):
+        worker = Profiler()
+        worker.enable(cprofile_stage="solve")
+        for name in ("rp_001", "rp_002"):
+            with worker.pathway(name), worker.stage("solve"):
+                sum(range(1000))
+        self.profiler.merge(worker.drain())
+        self.assertListEqual(worker.records(), [])
+        summary = self.profiler.summary()
+        self.assertEqual(summary["solve"]["calls"], 2)
+        self.assertIn("2 pathway(s)", self.profiler.format_summary())
+        outfile = os_path.join(self.temp_d, "profile.json")
+        self.profiler.write_json(outfile)
+        with open(outfile) as f:
+            self.assertEqual(len(json_load(f)["records"]), 2)
+        outfile = os_path.join(self.temp_d, "solve.prof")
+        self.profiler.dump_cprofile(outfile)
+        self.assertTrue(Stats(outfile).stats)
+
+    def test_disabled(self):
+        profiler = Profiler()
+        with profiler.stage("solve"):
+            pass
+        self.assertListEqual(profiler.records(), [])
+        self.assertIsNone(profiler.drain())
+
+    def test_profile_output(self):
+        self.assertIsNone(profile_output(Namespace(profile=None)))
+        self.assertEqual(profile_output(Namespace(profile="")), "")
+        self.assertEqual(profile_output(Namespace(profile="p.json")), "p.json")
@@ -0,0 +1,75 @@
+from json import loads as json_loads
+from os import path as os_path
+from unittest import skipUnless
+
+from main_rpfba import Main_rpfba
+
+from rpfba.results import ResultsWriter, results_to_rows
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+
+class Test_results(Main_rpfba):
+    results = {
+        "species": {
+            "CMPD_0000000003__64__MNXC3": {
+                "biomass_shadow_price": {"value": -0.5},
+                "fraction_shadow_price": {"value": None},
+            },
+        },
+        "reactions": {
+            "rxn_1": {
+                "biomass": {"value": 0.0, "units": "gDW / gDW / hour"},
+                "fraction": {"value": 2.5, "units": "milimole / gDW / hour"},
+            },
+        },
+        "pathway": {
+            "biomass": {"value": 0.87, "units": "gDW / gDW / hour"},
+            "fraction": {"value": 2.5, "units": "milimole / gDW / hour"},
+        },
+        "ignored_species": ["MNXM100"],
+    }
+
+    def test_results_to_rows(self):
+        rows = list(results_to_rows("rp_001_0001.xml", self.results))
+        self.assertEqual(len(rows), 2 + 2 + 2 + 1)
+        self.assertIn(
+            {
+                "name": "rp_001_0001.xml",
+                "entity": "reaction",
+                "id": "rxn_1",
+                "key": "fraction",
+                "value": 2.5,
+                "units": "milimole / gDW / hour",
+            },
+            rows,
+        )
+
+    def test_write_jsonl(self):
+        outfile = os_path.join(self.temp_d, "results.jsonl")
+        with ResultsWriter(outfile, logger=self.logger) as writer:
+            writer.write("rp_001_0001.xml", self.results)
+            # Records are available as soon as written
+            with open(outfile) as f:
+                self.assertEqual(len(f.readlines()), 1)
+            writer.write("rp_002_0001.xml", self.results)
+        with open(outfile) as f:
+            records = [json_loads(line) for line in f]
+        self.assertListEqual(
+            [record["name"] for record in records],
+            ["rp_001_0001.xml", "rp_002_0001.xml"],
+        )
+        self.assertDictEqual(records[0]["pathway"], self.results["pathway"])
+
+    @skipUnless(pq, "pyarrow is not installed")
+    def test_write_parquet(self):
+        outfile = os_path.join(self.temp_d, "results.parquet")
+        with ResultsWriter(outfile, row_group_size=1, logger=self.logger) as writer:
+            writer.write("rp_001_0001.xml", self.results)
+            writer.write("rp_002_0001.xml", self.results)
+        parquet_file = pq.ParquetFile(outfile)
+        self.assertEqual(parquet_file.num_row_groups, 2)
+        self.assertEqual(parquet_file.metadata.num_rows, 2 * 7)
@@ -1,11 +1,29 @@
+import re
+from argparse import ArgumentTypeError
 from glob import glob
 from zipfile import ZipFile
 from types import SimpleNamespace
 
 from os import path as os_path
 
-from rpfba.fba import preprocess, runFBA
-from rplibs import rpPathway
+from cobra.io.sbml import F_REACTION, F_REPLACE
+
+from rpfba.Args import fraction_range
+from rpfba.fba import (
+    build_cobra_model,
+    build_results,
+    fraction_sim_type,
+    knockout_candidates,
+    knockout_sim_type,
+    pareto_sim_type,
+    preprocess,
+    run_pathway,
+    runFBA,
+    search_isolated_species,
+)
+from rpfba.host import HostModel
+from rplibs import rpPathway, rpSBML
+from rplibs.cobra_format import cobraize, to_cobra
 from main_rpfba import Main_rpfba
 
 
@@ -81,3 +99,529 @@ class Test_rpFBA(Main_rpfba):
             )
 
             self.assertDictEqual(res_previous, res_run_fba)
+
+    def test_build_cobra_model_in_memory(self):
+        args = SimpleNamespace(
+            pathway_file=os_path.join(self.temp_d, "cr_fba", "rp_002_0001.xml"),
+            model_file=self.e_coli_model_path,
+            compartment_id="c",
+            biomass_rxn_id="biomass",
+            objective_rxn_id="rxn_target",
+            with_orphan_species=False,
+            sim="fraction",
+            fraction_of=0.75,
+            merge="",
+        )
+        merged_model, pathway, ids = preprocess(args=args)
+        objective_id = merged_model.find_or_create_objective(
+            rxn_id=ids["biomass_rxn_id"],
+            obj_id=f"brs_obj_{ids['biomass_rxn_id']}",
+        )
+        from_file = build_cobra_model(
+            rpsbml=merged_model, objective_id=objective_id, from_file=True
+        )
+        in_memory = build_cobra_model(
+            rpsbml=merged_model, objective_id=objective_id, from_file=False
+        )
+        self.assertListEqual(
+            [r.id for r in from_file.reactions], [r.id for r in in_memory.reactions]
+        )
+        self.assertListEqual(
+            [m.id for m in from_file.metabolites],
+            [m.id for m in in_memory.metabolites],
+        )
+        self.assertAlmostEqual(
+            from_file.slim_optimize(), in_memory.slim_optimize(), places=6
+        )
+
+    def test_runFBA_host_model(self):
+        args = SimpleNamespace(
+            model_file=self.e_coli_model_path,
+            compartment_id="c",
+            biomass_rxn_id="biomass",
+            objective_rxn_id="rxn_target",
+            with_orphan_species=False,
+            sim="fraction",
+            fraction_of=0.75,
+            merge="",
+        )
+        host = HostModel(model_file=self.e_coli_model_path, logger=self.logger)
+        for name in ["rp_001_0001", "rp_002_0001", "rp_003_0001"]:
+            args.pathway_file = os_path.join(self.temp_d, "cr_fba", name + ".xml")
+            results = {}
+            for _host in [None, host]:
+                merged_model, pathway, ids = preprocess(args=args, host=_host)
+                results[_host] = runFBA(
+                    model=merged_model,
+                    compartment_id=ids["comp_id"],
+                    biomass_rxn_id=ids["biomass_rxn_id"],
+                    objective_rxn_id=ids["obj_rxn_id"],
+                    sim_type=args.sim,
+                    fraction_coeff=args.fraction_of,
+                    host=_host,
+                )
+            for sim_type, cobra_r in results[None].items():
+                self.assertAlmostEqual(
+                    cobra_r.objective_value,
+                    results[host][sim_type].objective_value,
+                    places=6,
+                )
+
+    def test_runFBA_scipy_engine(self):
+        args = SimpleNamespace(
+            model_file=self.e_coli_model_path,
+            compartment_id="c",
+            biomass_rxn_id="biomass",
+            objective_rxn_id="rxn_target",
+            with_orphan_species=False,
+            fraction_of=0.75,
+            merge="",
+        )
+        host = HostModel(model_file=self.e_coli_model_path, logger=self.logger)
+        for name in ["rp_001_0001", "rp_002_0001", "rp_003_0001"]:
+            args.pathway_file = os_path.join(self.temp_d, "cr_fba", name + ".xml")
+            for sim_type in ["fba", "fraction"]:
+                args.sim = sim_type
+                for _host in [None, host]:
+                    results = {}
+                    for engine in ["cobra", "scipy"]:
+                        merged_model, pathway, ids = preprocess(args=args, host=_host)
+                        results[engine] = runFBA(
+                            model=merged_model,
+                            compartment_id=ids["comp_id"],
+                            biomass_rxn_id=ids["biomass_rxn_id"],
+                            objective_rxn_id=ids["obj_rxn_id"],
+                            sim_type=sim_type,
+                            fraction_coeff=args.fraction_of,
+                            host=_host,
+                            engine=engine,
+                            write_results=False,
+                        )
+                    self.assertEqual(results["cobra"].keys(), results["scipy"].keys())
+                    for _sim_type, cobra_r in results["cobra"].items():
+                        scipy_r = results["scipy"][_sim_type]
+                        self.assertAlmostEqual(
+                            cobra_r.objective_value,
+                            scipy_r.objective_value,
+                            places=6,
+                        )
+                        # Same reactions and species
+                        self.assertEqual(
+                            set(cobra_r.fluxes.index), set(scipy_r.fluxes.index)
+                        )
+                        self.assertEqual(
+                            set(cobra_r.shadow_prices.index),
+                            set(scipy_r.shadow_prices.index),
+                        )
+
+    def test_fraction_range(self):
+        self.assertListEqual(fraction_range("0.5"), [0.5])
+        self.assertListEqual(fraction_range("0:1:0.25"), [0, 0.25, 0.5, 0.75, 1])
+        # Reversed ranges, fractions out of [0, 1]
+        for value in ("1:0:0.25", "1.5", "-0.1", "0.5:1.5:0.5"):
+            with self.assertRaises(ArgumentTypeError):
+                fraction_range(value)
+
+    def test_runFBA_fraction_sweep(self):
+        args = SimpleNamespace(
+            pathway_file=os_path.join(self.temp_d, "cr_fba", "rp_002_0001.xml"),
+            model_file=self.e_coli_model_path,
+            compartment_id="c",
+            biomass_rxn_id="biomass",
+            objective_rxn_id="rxn_target",
+            with_orphan_species=False,
+            sim="fraction",
+            fraction_of=0.75,
+            merge="",
+        )
+        fractions = [0.25, 0.5, 0.75, 1.0]
+        results = {}
+        for fraction_sweep in [None, fractions]:
+            merged_model, pathway, ids = preprocess(args=args)
+            results[str(fraction_sweep)] = runFBA(
+                model=merged_model,
+                compartment_id=ids["comp_id"],
+                biomass_rxn_id=ids["biomass_rxn_id"],
+                objective_rxn_id=ids["obj_rxn_id"],
+                sim_type=args.sim,
+                fraction_coeff=args.fraction_of,
+                fraction_sweep=fraction_sweep,
+            )
+        sweep = results[str(fractions)]
+        self.assertListEqual(
+            sorted(sweep.keys()),
+            sorted(["biomass"] + [fraction_sim_type(x) for x in fractions]),
+        )
+        self.assertAlmostEqual(
+            sweep[fraction_sim_type(0.75)].objective_value,
+            results["None"]["fraction"].objective_value,
+            places=6,
+        )
+        # The more biomass is required, the less target is produced
+        values = [sweep[fraction_sim_type(x)].objective_value for x in fractions]
+        self.assertListEqual(values, sorted(values, reverse=True))
+
+    def test_runFBA_pareto(self):
+        args = SimpleNamespace(
+            pathway_file=os_path.join(self.temp_d, "cr_fba", "rp_002_0001.xml"),
+            model_file=self.e_coli_model_path,
+            compartment_id="c",
+            biomass_rxn_id="biomass",
+            objective_rxn_id="rxn_target",
+            with_orphan_species=False,
+            sim="pareto",
+            fraction_of=0.75,
+            merge="",
+        )
+        merged_model, pathway, ids = preprocess(args=args)
+        results = runFBA(
+            model=merged_model,
+            compartment_id=ids["comp_id"],
+            biomass_rxn_id=ids["biomass_rxn_id"],
+            objective_rxn_id=ids["obj_rxn_id"],
+            sim_type=args.sim,
+            pareto_max_points=10,
+        )
+        fractions = sorted(
+            float(key[len("pareto_") :]) for key in results if key != "biomass"
+        )
+        self.assertIn("biomass", results)
+        self.assertLessEqual(len(fractions), 10)
+        self.assertEqual(fractions[0], 0.0)
+        self.assertEqual(fractions[-1], 1.0)
+        # The frontier is non-increasing
+        values = [results[pareto_sim_type(x)].objective_value for x in fractions]
+        self.assertListEqual(values, sorted(values, reverse=True))
+
+    def test_runFBA_fva(self):
+        args = SimpleNamespace(
+            pathway_file=os_path.join(self.temp_d, "cr_fba", "rp_002_0001.xml"),
+            model_file=self.e_coli_model_path,
+            compartment_id="c",
+            biomass_rxn_id="biomass",
+            objective_rxn_id="rxn_target",
+            with_orphan_species=False,
+            sim="fraction_fva",
+            fraction_of=0.75,
+            merge="",
+        )
+        merged_model, pathway, ids = preprocess(args=args)
+        for processes in (1, 2):
+            results = runFBA(
+                model=merged_model,
+                compartment_id=ids["comp_id"],
+                biomass_rxn_id=ids["biomass_rxn_id"],
+                objective_rxn_id=ids["obj_rxn_id"],
+                sim_type=args.sim,
+                fraction_coeff=args.fraction_of,
+                fva_processes=processes,
+                write_results=False,
+            )
+            self.assertIn("fraction", results)
+            # The target optimum at this growth is within its flux range
+            self.assertAlmostEqual(
+                results["fva_max"].objective_value,
+                results["fraction"].objective_value,
+                places=6,
+            )
+            for rxn_id in pathway.get_reactions_ids():
+                self.assertLessEqual(
+                    results["fva_min"].fluxes[rxn_id],
+                    results["fva_max"].fluxes[rxn_id] + 1e-9,
+                )
+        results = build_results(
+            results=results,
+            pathway=pathway,
+            compartment_id=ids["comp_id"],
+            hidden_species=merged_model.get_isolated_species(),
+        )
+        rxn_id = pathway.get_reactions_ids()[0]
+        self.assertIn("fva_min", results["reactions"][rxn_id])
+        self.assertIn("fva_max", results["pathway"])
+
+    def test_runFBA_knockout(self):
+        args = SimpleNamespace(
+            pathway_file=os_path.join(self.temp_d, "cr_fba", "rp_002_0001.xml"),
+            model_file=self.e_coli_model_path,
+            compartment_id="c",
+            biomass_rxn_id="biomass",
+            objective_rxn_id="rxn_target",
+            with_orphan_species=False,
+            sim="knockout",
+            fraction_of=0.75,
+            merge="",
+        )
+        host = HostModel(model_file=self.e_coli_model_path, logger=self.logger)
+        candidates = ["R_PGI", "PFK", "R_ATPS4rpp", "G6PDH2r", "R_GND", "unknown_rxn"]
+        knockouts = []
+        # Workers receive the cobra model, or load the host and the pathway
+        for processes, _host in ((1, None), (2, None), (2, host)):
+            merged_model, pathway, ids = preprocess(args=args, host=_host)
+            results = runFBA(
+                model=merged_model,
+                compartment_id=ids["comp_id"],
+                biomass_rxn_id=ids["biomass_rxn_id"],
+                objective_rxn_id=ids["obj_rxn_id"],
+                sim_type=args.sim,
+                fraction_coeff=args.fraction_of,
+                host=_host,
+                knockout_candidates=candidates,
+                double_knockouts=True,
+                knockout_top=3,
+                knockout_processes=processes,
+                write_results=False,
+            )
+            self.assertIn("biomass", results)
+            self.assertIn("fraction", results)
+            knockouts.append([key for key in results if key.startswith("knockout_")])
+            self.assertLessEqual(len(knockouts[-1]), 3)
+            # The top knockouts raise the target flux, by decreasing flux
+            values = [results[key].objective_value for key in knockouts[-1]]
+            self.assertListEqual(values, sorted(values, reverse=True))
+            for value in values:
+                self.assertGreater(value, results["fraction"].objective_value)
+        self.assertListEqual(knockouts[0], knockouts[1])
+        self.assertListEqual(knockouts[0], knockouts[2])
+        self.assertEqual(knockout_sim_type(("PGI", "GND")), "knockout_PGI+GND")
+        # 5 single and 10 double knockouts
+        with self.assertRaises(ValueError):
+            runFBA(
+                model=merged_model,
+                compartment_id=ids["comp_id"],
+                biomass_rxn_id=ids["biomass_rxn_id"],
+                objective_rxn_id=ids["obj_rxn_id"],
+                sim_type=args.sim,
+                fraction_coeff=args.fraction_of,
+                knockout_candidates=candidates,
+                double_knockouts=True,
+                knockout_max=14,
+                write_results=False,
+            )
+
+    def test_knockout_candidates(self):
+        cobraModel = HostModel(
+            model_file=self.e_coli_model_path, logger=self.logger
+        ).get_cobra_model()
+        # The genes of the excluded reactions are not knocked out
+        excluded_genes = {gene.id for gene in cobraModel.reactions.PGI.genes}
+        gene_ids = knockout_candidates(
+            cobraModel=cobraModel, knockout_type="gene", excluded=["PGI"]
+        )
+        self.assertTrue(gene_ids)
+        self.assertFalse(excluded_genes & set(gene_ids))
+        self.assertEqual(
+            len(gene_ids) + len(excluded_genes),
+            len(knockout_candidates(cobraModel=cobraModel, knockout_type="gene")),
+        )
+
+    def test_runFBA_multi(self):
+        args = SimpleNamespace(
+            pathway_file=os_path.join(self.temp_d, "cr_fba", "rp_002_0001.xml"),
+            model_file=self.e_coli_model_path,
+            compartment_id="c",
+            biomass_rxn_id="biomass",
+            objective_rxn_id="rxn_target",
+            with_orphan_species=False,
+            sim="multi_fba",
+            fraction_of=0.75,
+            objectives=[("rxn_target", 1.0, "max"), ("biomass", 0.1, "max")],
+            merge="",
+        )
+        merged_model, pathway, ids = preprocess(args=args)
+        results = runFBA(
+            model=merged_model,
+            compartment_id=ids["comp_id"],
+            biomass_rxn_id=ids["biomass_rxn_id"],
+            objective_rxn_id=ids["obj_rxn_id"],
+            sim_type=args.sim,
+            objectives=ids["objectives"],
+        )
+        fluxes = results["multi_fba"].fluxes
+        self.assertAlmostEqual(
+            results["multi_fba"].objective_value,
+            fluxes[F_REPLACE[F_REACTION](ids["obj_rxn_id"])]
+            + 0.1 * fluxes[F_REPLACE[F_REACTION](ids["biomass_rxn_id"])],
+            places=6,
+        )
+        # Objective reactions are checked
+        args.objectives = [("unknown_rxn", 1.0, "max")]
+        self.assertEqual(preprocess(args=args), 1)
+
+    def test_build_results(self):
+        args = SimpleNamespace(
+            pathway_file=os_path.join(self.temp_d, "cr_fba", "rp_002_0001.xml"),
+            model_file=self.e_coli_model_path,
+            compartment_id="c",
+            biomass_rxn_id="biomass",
+            objective_rxn_id="rxn_target",
+            with_orphan_species=False,
+            sim="fraction",
+            fraction_of=0.75,
+            merge="",
+        )
+        merged_model, pathway, ids = preprocess(args=args)
+        results = runFBA(
+            model=merged_model,
+            compartment_id=ids["comp_id"],
+            biomass_rxn_id=ids["biomass_rxn_id"],
+            objective_rxn_id=ids["obj_rxn_id"],
+            sim_type=args.sim,
+            fraction_coeff=args.fraction_of,
+        )
+        _results = build_results(
+            results=results,
+            pathway=pathway,
+            compartment_id=ids["comp_id"],
+            hidden_species=[],
+        )
+        # Same values as looked up one by one
+        for spe_id in pathway.get_species_ids():
+            for sim_type, cobra_r in results.items():
+                self.assertEqual(
+                    _results["species"][spe_id][sim_type + "_shadow_price"]["value"],
+                    cobra_r.shadow_prices.get(
+                        to_cobra(cobraize(spe_id, ids["comp_id"]))
+                    ),
+                )
+        for rxn_id in pathway.get_reactions_ids():
+            for sim_type, cobra_r in results.items():
+                self.assertEqual(
+                    _results["reactions"][rxn_id][sim_type]["value"],
+                    cobra_r.fluxes[rxn_id],
+                )
+        self.assertEqual(
+            _results["reactions"][rxn_id]["biomass"]["units"], "gDW / gDW / hour"
+        )
+
+    def test_run_pathway_merge(self):
+        args = SimpleNamespace(
+            pathway_file=os_path.join(self.temp_d, "cr_fba", "rp_002_0001.xml"),
+            model_file=self.e_coli_model_path,
+            compartment_id="c",
+            biomass_rxn_id="biomass",
+            objective_rxn_id="rxn_target",
+            with_orphan_species=False,
+            sim="fraction",
+            fraction_of=0.75,
+            merge="",
+            cobra_from_file=False,
+            fraction_sweep=None,
+            pareto_tolerance=0.01,
+            pareto_max_points=20,
+        )
+        pathway, results = run_pathway(args=args)
+        # The merged model is annotated with the results once saved
+        args.merge = os_path.join(self.temp_d, "merged.xml")
+        pathway_merged, results_merged = run_pathway(args=args)
+        self.assertEqual(
+            results_merged["pathway"]["fraction"]["value"],
+            results["pathway"]["fraction"]["value"],
+        )
+        with open(args.merge) as f:
+            self.assertIn("fba_fraction", f.read())
+
+    def test_run_pathway_host_biomass(self):
+        args = SimpleNamespace(
+            model_file=self.e_coli_model_path,
+            compartment_id="c",
+            biomass_rxn_id="biomass",
+            objective_rxn_id="rxn_target",
+            with_orphan_species=False,
+            sim="fraction",
+            fraction_of=0.75,
+            merge="",
+            cobra_from_file=False,
+            fraction_sweep=None,
+            pareto_tolerance=0.01,
+            pareto_max_points=20,
+        )
+        # The host biomass optimum is reused for the pathways
+        # which cannot change it
+        host = HostModel(model_file=self.e_coli_model_path, logger=self.logger)
+        for name in ["rp_001_0001", "rp_002_0001", "rp_003_0001"]:
+            args.pathway_file = os_path.join(self.temp_d, "cr_fba", name + ".xml")
+            results = {
+                _host: run_pathway(args=args, host=_host)[1] for _host in [None, host]
+            }
+            for sim_type in ["biomass", "fraction"]:
+                self.assertAlmostEqual(
+                    results[None]["pathway"][sim_type]["value"],
+                    results[host]["pathway"][sim_type]["value"],
+                    places=6,
+                )
+            self.assertListEqual(
+                list(results[None]["reactions"]), list(results[host]["reactions"])
+            )
+
+    def test_search_isolated_species(self):
+        host = HostModel(model_file=self.e_coli_model_path, logger=self.logger)
+        for name in ["rp_001_0001", "rp_002_0001", "rp_003_0001"]:
+            pathway = rpPathway(
+                os_path.join(self.temp_d, "cr_fba", name + ".xml"), logger=self.logger
+            )
+            merged_model, reactions_in_both, missing_species, compartment_id = (
+                rpSBML.merge(
+                    pathway=pathway.get_rpsbml(),
+                    model=host.get_rpsbml(),
+                    compartment_id="c",
+                    logger=self.logger,
+                )
+            )
+            merged_model.search_isolated_species(missing_species)
+            expected = sorted(merged_model.get_isolated_species())
+            for host_incidence in [None, host.get_species_incidence()]:
+                self.assertListEqual(
+                    sorted(
+                        search_isolated_species(
+                            rpsbml=merged_model,
+                            species=missing_species,
+                            host_incidence=host_incidence,
+                        )
+                    ),
+                    expected,
+                )
+
+    def test_overlay_model(self):
+        host = HostModel(model_file=self.e_coli_model_path, logger=self.logger)
+        for name in ["rp_001_0001", "rp_002_0001", "rp_003_0001"]:
+            pathway = rpPathway(
+                os_path.join(self.temp_d, "cr_fba", name + ".xml"), logger=self.logger
+            )
+            merged = {}
+            for model in [
+                host.get_rpsbml(),
+                host.overlay_model(pathway.get_rpsbml(), biomass_rxn_id="biomass"),
+            ]:
+                merged[model] = rpSBML.merge(
+                    pathway=pathway.get_rpsbml(),
+                    model=model,
+                    compartment_id="c",
+                    logger=self.logger,
+                )
+            full, overlay = merged.values()
+            # Same missing species and reactions in both
+            self.assertListEqual(sorted(full[2]), sorted(overlay[2]))
+            self.assertListEqual(sorted(full[1]), sorted(overlay[1]))
+            self.assertLess(
+                overlay[0].getModel().getNumReactions(),
+                full[0].getModel().getNumReactions(),
+            )
+
+    def test_overlay_model_unindexed(self):
+        # Cross-references which are not identifiers.org URIs are not indexed
+        model_file = os_path.join(self.temp_d, "e_coli_urn.sbml")
+        with open(self.e_coli_model_path) as f:
+            sbml = f.read()
+        with open(model_file, "w") as f:
+            f.write(
+                re.sub(r"https?://identifiers\.org/([^/\"]+)/", r"urn:miriam:\1:", sbml)
+            )
+        host = HostModel(model_file=model_file, logger=self.logger)
+        pathway = rpPathway(
+            os_path.join(self.temp_d, "cr_fba", "rp_002_0001.xml"), logger=self.logger
+        )
+        # Merged into the whole GEM
+        self.assertIs(
+            host.overlay_model(pathway.get_rpsbml(), biomass_rxn_id="biomass"),
+            host.get_rpsbml(),
+        )
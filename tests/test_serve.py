@@ -0,0 +1,92 @@
+from argparse import Namespace
+from http.client import HTTPConnection
+from json import loads as json_loads
+from os import path as os_path
+from threading import Thread
+from zipfile import ZipFile
+
+from main_rpfba import Main_rpfba
+
+from rpfba.serve import close_server, create_server, parse_models
+
+
+class Test_serve(Main_rpfba):
+    def setUp(self):
+        super().setUp()
+        ZipFile(self.cr_path).extractall(path=self.temp_d)
+        self.pathway_path = os_path.join(self.temp_d, "rp_002_0001.xml")
+        args = Namespace(
+            models=[f"e_coli={self.e_coli_model_path}"],
+            compartment_id="c",
+            host="127.0.0.1",
+            port=0,
+            socket=None,
+            jobs=1,
+            biomass_rxn_id="biomass",
+            objective_rxn_id="rxn_target",
+            with_orphan_species=False,
+            sim="fraction",
+            fraction_of=0.75,
+            cobra_from_file=False,
+            fraction_sweep=None,
+            pareto_tolerance=0.01,
+            pareto_max_points=20,
+            cache_dir=None,
+            cache_size=1024,
+        )
+        self.server = create_server(args, logger=self.logger)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        close_server(self.server)
+        super().tearDown()
+
+    def _request(self, method, url, body=None, headers={}):
+        conn = HTTPConnection("127.0.0.1", self.server.server_port, timeout=600)
+        conn.request(method, url, body=body, headers=headers)
+        response = conn.getresponse()
+        content = json_loads(response.read())
+        conn.close()
+        return response.status, content
+
+    def test_parse_models(self):
+        self.assertDictEqual(
+            parse_models(["e_coli=a/model.xml", "b/iML1515.sbml"]),
+            {"e_coli": "a/model.xml", "iML1515": "b/iML1515.sbml"},
+        )
+
+    def test_models(self):
+        self.assertEqual(self._request("GET", "/models"), (200, ["e_coli"]))
+
+    def test_fba(self):
+        with open(self.pathway_path, "rb") as f:
+            body = f.read()
+        status, content = self._request(
+            "POST", "/fba?model=e_coli&name=rp_002_0001.xml&sim=fba&sbml=1", body
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(content["name"], "rp_002_0001.xml")
+        self.assertIn("fba", content["pathway"])
+        self.assertIn("fba_fba", content["sbml"])
+        status, content = self._request("POST", "/fba?model=unknown", body)
+        self.assertEqual(status, 404)
+
+    def test_invalid_args(self):
+        for query in (
+            "sim=unknown",
+            "engine=unknown",
+            "fraction_of=x",
+            "name=",
+            "name=/",
+            "name=..",
+        ):
+            status, content = self._request("POST", f"/fba?model=e_coli&{query}", b"")
+            self.assertEqual(status, 400)
+            self.assertIn("error", content)
+        for length in ("x", "-1"):
+            status, content = self._request(
+                "POST", "/fba?model=e_coli", b"", headers={"Content-Length": length}
+            )
+            self.assertEqual(status, 400)
+            self.assertIn("error", content)
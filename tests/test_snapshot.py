@@ -0,0 +1,190 @@
+from concurrent.futures import ProcessPoolExecutor
+from os import path as os_path
+from shutil import copyfile
+from types import SimpleNamespace
+from unittest import skipUnless
+from zipfile import ZipFile
+
+import numpy as np
+from cobra.io import save_json_model
+
+from main_rpfba import Main_rpfba
+
+from rpfba.fba import run_pathway
+from rpfba.host import HostModel, shared_snapshot
+from rpfba.snapshot import SnapshotError, read_snapshot, write_snapshot
+
+SMAPS_ROLLUP = "/proc/self/smaps_rollup"
+
+
+def private_memory() -> int:
+    """Return the private memory (kB) of the current process."""
+    with open(SMAPS_ROLLUP) as f:
+        return sum(int(line.split()[1]) for line in f if line.startswith("Private_"))
+
+
+def worker_memory(model_file: str, snapshot: str, engine: str) -> int:
+    """Return the private memory (kB) a worker process allocates to load
+    the GEM model_file as the workers of a pool do.
+    """
+    start = private_memory()
+    host = HostModel(model_file=model_file, snapshot=snapshot)
+    if engine == "scipy":
+        host.get_sparse_lp()
+    else:
+        host.get_cobra_model()
+    return private_memory() - start
+
+
+class Test_snapshot(Main_rpfba):
+    def setUp(self):
+        super().setUp()
+        ZipFile(self.cr_path).extractall(path=os_path.join(self.temp_d, "cr_fba"))
+        # The snapshot is written next to the model file by default
+        self.model_file = os_path.join(self.temp_d, "e_coli_iML1515.sbml")
+        copyfile(self.e_coli_model_path, self.model_file)
+        self.args = SimpleNamespace(
+            pathway_file=os_path.join(self.temp_d, "cr_fba", "rp_002_0001.xml"),
+            model_file=self.model_file,
+            compartment_id="c",
+            biomass_rxn_id="biomass",
+            objective_rxn_id="rxn_target",
+            with_orphan_species=False,
+            sim="fraction",
+            fraction_of=0.75,
+            fraction_sweep=None,
+            pareto_tolerance=0.01,
+            pareto_max_points=20,
+            cobra_from_file=False,
+            merge="",
+        )
+
+    def test_write_read(self):
+        snapshot = os_path.join(self.temp_d, "test.snapshot")
+        arrays = {"a": np.arange(10, dtype=np.int32), "b": np.ones((2, 3))}
+        write_snapshot(snapshot, self.model_file, {"key": "value"}, arrays)
+        data, _arrays = read_snapshot(snapshot, self.model_file)
+        self.assertEqual(data, {"key": "value"})
+        for name, array in arrays.items():
+            np.testing.assert_array_equal(_arrays[name], array)
+        # Stale snapshot
+        with open(self.model_file, "a") as f:
+            f.write("\n")
+        with self.assertRaises(SnapshotError):
+            read_snapshot(snapshot, self.model_file)
+        # Not a snapshot
+        with self.assertRaises(SnapshotError):
+            read_snapshot(self.model_file, self.model_file)
+
+    def test_host_snapshot(self):
+        host = HostModel(model_file=self.model_file, logger=self.logger)
+        # Built, then loaded
+        HostModel(model_file=self.model_file, logger=self.logger, snapshot="")
+        self.assertTrue(os_path.exists(self.model_file + ".snapshot"))
+        snapshot_host = HostModel(
+            model_file=self.model_file, logger=self.logger, snapshot=""
+        )
+        self.assertEqual(snapshot_host.digest(), host.digest())
+        self.assertEqual(
+            snapshot_host.get_species_incidence(), host.get_species_incidence()
+        )
+        # Cobra model rebuilt from the tables and arrays of the snapshot
+        models = [_host.get_cobra_model() for _host in (host, snapshot_host)]
+        for attrs in (
+            ["id", "bounds", "gene_reaction_rule"],
+            ["objective_coefficient"],
+        ):
+            self.assertEqual(
+                *(
+                    [[getattr(rxn, attr) for attr in attrs] for rxn in model.reactions]
+                    for model in models
+                )
+            )
+        self.assertEqual(
+            *(
+                [(met.id, met.compartment) for met in model.metabolites]
+                for model in models
+            )
+        )
+        results = [
+            run_pathway(args=self.args, host=_host, logger=self.logger)[1]
+            for _host in (host, snapshot_host)
+        ]
+        self.assertEqual(results[0]["pathway"], results[1]["pathway"])
+
+    def test_stale_snapshot(self):
+        snapshot = os_path.join(self.temp_d, "host.snapshot")
+        HostModel(model_file=self.model_file, logger=self.logger, snapshot=snapshot)
+        with open(self.model_file, "a") as f:
+            f.write("\n")
+        with self.assertRaises(SnapshotError):
+            read_snapshot(snapshot, self.model_file)
+        # Rebuilt
+        HostModel(model_file=self.model_file, logger=self.logger, snapshot=snapshot)
+        read_snapshot(snapshot, self.model_file)
+
+    def test_unwritable_snapshot(self):
+        # The GEM is parsed instead
+        host = HostModel(
+            model_file=self.model_file,
+            logger=self.logger,
+            snapshot=os_path.join(self.temp_d, "missing", "host.snapshot"),
+        )
+        self.assertIsNotNone(host.get_cobra_model())
+
+    def test_json_model(self):
+        host = HostModel(model_file=self.model_file, logger=self.logger)
+        json_file = os_path.join(self.temp_d, "e_coli_iML1515.json")
+        save_json_model(host.get_cobra_model(), json_file)
+        json_host = HostModel(model_file=json_file, logger=self.logger)
+        results = [
+            run_pathway(args=self.args, host=_host, logger=self.logger)[1]
+            for _host in (host, json_host)
+        ]
+        self.assertAlmostEqual(
+            results[0]["pathway"]["fraction"]["value"],
+            results[1]["pathway"]["fraction"]["value"],
+            places=6,
+        )
+
+    def test_shared_snapshot(self):
+        # A single worker, or workers with their own cobra model, parse the GEM
+        for jobs, engine in ((1, "scipy"), (2, "cobra")):
+            with shared_snapshot(
+                self.model_file, jobs=jobs, engine=engine, logger=self.logger
+            ) as snapshot:
+                self.assertIsNone(snapshot)
+        with shared_snapshot(
+            self.model_file, jobs=2, engine="scipy", logger=self.logger
+        ) as snapshot:
+            host = HostModel(
+                model_file=self.model_file, logger=self.logger, snapshot=snapshot
+            )
+            lp = host.get_sparse_lp()
+            # Memory-mapped, not copied
+            self.assertFalse(lp.S.data.flags.writeable)
+            self.assertFalse(lp.lower_bounds.flags.writeable)
+            ref_lp = HostModel(
+                model_file=self.model_file, logger=self.logger
+            ).get_sparse_lp()
+            self.assertEqual((lp.S != ref_lp.S).nnz, 0)
+            # Bounds are copied on change
+            lp.set_bounds(lp.rxn_ids[0], 0, 1)
+            self.assertEqual(lp.upper_bounds[0], 1)
+        # Temporary snapshot removed
+        self.assertFalse(os_path.exists(snapshot))
+
+    @skipUnless(os_path.exists(SMAPS_ROLLUP), "requires /proc/self/smaps_rollup")
+    def test_shared_snapshot_memory(self):
+        with shared_snapshot(
+            self.model_file, jobs=2, engine="scipy", logger=self.logger
+        ) as snapshot:
+            memory = {}
+            for _snapshot, engine in ((None, "cobra"), (snapshot, "scipy")):
+                # A new worker process for each
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    memory[engine] = executor.submit(
+                        worker_memory, self.model_file, _snapshot, engine
+                    ).result()
+        # The LP arrays are shared, no libSBML nor cobra model is built
+        self.assertLess(memory["scipy"], memory["cobra"] / 2)